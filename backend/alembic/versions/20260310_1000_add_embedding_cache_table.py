@@ -0,0 +1,39 @@
+"""添加 Embedding 缓存表
+
+Revision ID: add_embedding_cache_table
+Revises: add_prompt_config_tables
+Create Date: 2026-03-10 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_embedding_cache_table'
+down_revision = 'add_prompt_config_tables'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 创建 embedding_cache 表（按文本哈希、提供商、模型、维度唯一）
+    op.create_table(
+        'embedding_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('text_hash', sa.String(length=64), nullable=False),
+        sa.Column('provider', sa.String(length=50), nullable=False),
+        sa.Column('model', sa.String(length=200), nullable=False),
+        sa.Column('dimension', sa.Integer(), nullable=False),
+        sa.Column('embedding', Vector(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('text_hash', 'provider', 'model', 'dimension', name='uq_embedding_cache_key')
+    )
+    op.create_index(op.f('ix_embedding_cache_id'), 'embedding_cache', ['id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_embedding_cache_id'), table_name='embedding_cache')
+    op.drop_table('embedding_cache')
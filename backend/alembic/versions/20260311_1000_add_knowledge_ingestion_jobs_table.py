@@ -0,0 +1,51 @@
+"""添加知识库入库任务队列表
+
+Revision ID: add_knowledge_ingestion_jobs
+Revises: add_embedding_cache_table
+Create Date: 2026-03-11 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_knowledge_ingestion_jobs'
+down_revision = 'add_embedding_cache_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 创建 knowledge_ingestion_jobs 表（持久化入库队列）
+    op.create_table(
+        'knowledge_ingestion_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('job_type', sa.String(length=20), nullable=True),
+        sa.Column('chunk_strategy', sa.String(length=50), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('max_attempts', sa.Integer(), nullable=True),
+        sa.Column('progress', sa.Integer(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('task_id', sa.String(length=255), nullable=True),
+        sa.Column('next_run_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['knowledge_documents.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_knowledge_ingestion_jobs_id'), 'knowledge_ingestion_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_knowledge_ingestion_jobs_document_id'), 'knowledge_ingestion_jobs', ['document_id'], unique=False)
+    op.create_index(op.f('ix_knowledge_ingestion_jobs_status'), 'knowledge_ingestion_jobs', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_knowledge_ingestion_jobs_status'), table_name='knowledge_ingestion_jobs')
+    op.drop_index(op.f('ix_knowledge_ingestion_jobs_document_id'), table_name='knowledge_ingestion_jobs')
+    op.drop_index(op.f('ix_knowledge_ingestion_jobs_id'), table_name='knowledge_ingestion_jobs')
+    op.drop_table('knowledge_ingestion_jobs')
@@ -0,0 +1,37 @@
+"""向量分块增加文档内容偏移（紧凑存储）
+
+Revision ID: add_vector_chunk_offsets
+Revises: add_knowledge_ingestion_jobs
+Create Date: 2026-03-12 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_vector_chunk_offsets'
+down_revision = 'add_knowledge_ingestion_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 分块在文档内容中的偏移；紧凑存储的分块不再保存 chunk_text
+    op.add_column('vector_chunks', sa.Column('start_offset', sa.Integer(), nullable=True))
+    op.add_column('vector_chunks', sa.Column('end_offset', sa.Integer(), nullable=True))
+    op.alter_column('vector_chunks', 'chunk_text', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade():
+    # 回填紧凑存储分块的文本后再恢复非空约束
+    op.execute("""
+        UPDATE vector_chunks vc
+        SET chunk_text = substr(kd.content, vc.start_offset + 1, vc.end_offset - vc.start_offset)
+        FROM knowledge_documents kd
+        WHERE vc.document_id = kd.id
+          AND vc.chunk_text IS NULL
+    """)
+    op.alter_column('vector_chunks', 'chunk_text', existing_type=sa.Text(), nullable=False)
+    op.drop_column('vector_chunks', 'end_offset')
+    op.drop_column('vector_chunks', 'start_offset')
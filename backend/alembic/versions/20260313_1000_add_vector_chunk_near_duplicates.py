@@ -0,0 +1,41 @@
+"""向量分块增加 SimHash 签名与近似重复关联
+
+Revision ID: add_vector_chunk_near_duplicates
+Revises: add_vector_chunk_offsets
+Create Date: 2026-03-13 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_vector_chunk_near_duplicates'
+down_revision = 'add_vector_chunk_offsets'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('vector_chunks', sa.Column('simhash', sa.BigInteger(), nullable=True))
+    op.add_column('vector_chunks', sa.Column('duplicate_of_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'fk_vector_chunks_duplicate_of_id', 'vector_chunks', 'vector_chunks',
+        ['duplicate_of_id'], ['id'], ondelete='SET NULL'
+    )
+    op.create_index(op.f('ix_vector_chunks_duplicate_of_id'), 'vector_chunks', ['duplicate_of_id'], unique=False)
+
+
+def downgrade():
+    # 近似重复分块没有向量，回填所关联分块的向量后再删除关联
+    op.execute("""
+        UPDATE vector_chunks vc
+        SET embedding = src.embedding
+        FROM vector_chunks src
+        WHERE vc.duplicate_of_id = src.id
+          AND vc.embedding IS NULL
+    """)
+    op.drop_index(op.f('ix_vector_chunks_duplicate_of_id'), table_name='vector_chunks')
+    op.drop_constraint('fk_vector_chunks_duplicate_of_id', 'vector_chunks', type_='foreignkey')
+    op.drop_column('vector_chunks', 'duplicate_of_id')
+    op.drop_column('vector_chunks', 'simhash')
@@ -0,0 +1,31 @@
+"""向量分块增加近似最近邻索引（HNSW）
+
+Revision ID: add_vector_chunk_ann_index
+Revises: add_vector_chunk_near_duplicates
+Create Date: 2026-03-14 10:00:00.000000
+
+迁移只创建默认索引：HNSW，m = 16，ef_construction = 64（与 HNSW_M / HNSW_EF_CONSTRUCTION 的默认值一致）。
+切换为 IVFFlat 或调整构建参数时执行 manage_vector_index.py rebuild，迁移不读取运行时配置。
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_vector_chunk_ann_index'
+down_revision = 'add_vector_chunk_near_duplicates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 检索使用余弦距离（<=>），索引使用对应的 vector_cosine_ops
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_vector_chunks_embedding_hnsw
+        ON vector_chunks USING hnsw (embedding vector_cosine_ops)
+        WITH (m = 16, ef_construction = 64)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_vector_chunks_embedding_ivfflat')
+    op.execute('DROP INDEX IF EXISTS ix_vector_chunks_embedding_hnsw')
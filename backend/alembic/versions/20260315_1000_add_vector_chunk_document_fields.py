@@ -0,0 +1,99 @@
+"""向量分块冗余存储文档的用户、分类，检索过滤不再联表
+
+Revision ID: add_vector_chunk_document_fields
+Revises: add_vector_chunk_ann_index
+Create Date: 2026-03-15 10:00:00.000000
+
+- user_id / category 由触发器与 knowledge_documents 保持同步：
+  插入分块时从所属文档填充，文档的这两个字段变化时批量更新其分块
+- 文档状态（pending -> processing -> completed）变化频繁，只保存在文档上，
+  检索时按 document_id IN (该用户已完成的文档) 过滤，状态变化不改写分块行、不重写近似最近邻索引
+- 代表分块（非近似重复）的 (user_id, document_id)、(user_id, category) 部分索引；
+  近似重复分块按 duplicate_of_id 索引查找
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_vector_chunk_document_fields'
+down_revision = 'add_vector_chunk_ann_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('vector_chunks', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.add_column('vector_chunks', sa.Column('category', sa.String(length=50), nullable=True))
+
+    # 回填已有分块（在创建索引之前，避免逐行维护索引）
+    op.execute("""
+        UPDATE vector_chunks vc
+        SET user_id = kd.user_id, category = kd.category
+        FROM knowledge_documents kd
+        WHERE kd.id = vc.document_id
+    """)
+
+    # 插入分块时从所属文档填充
+    op.execute("""
+        CREATE OR REPLACE FUNCTION vector_chunks_fill_document_fields() RETURNS trigger AS $$
+        BEGIN
+            SELECT kd.user_id, kd.category
+            INTO NEW.user_id, NEW.category
+            FROM knowledge_documents kd
+            WHERE kd.id = NEW.document_id;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_vector_chunks_fill_document_fields
+        BEFORE INSERT OR UPDATE OF document_id ON vector_chunks
+        FOR EACH ROW EXECUTE FUNCTION vector_chunks_fill_document_fields()
+    """)
+
+    # 文档的用户、分类变化时同步到分块
+    op.execute("""
+        CREATE OR REPLACE FUNCTION knowledge_documents_sync_chunk_fields() RETURNS trigger AS $$
+        BEGIN
+            UPDATE vector_chunks
+            SET user_id = NEW.user_id, category = NEW.category
+            WHERE document_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_knowledge_documents_sync_chunk_fields
+        AFTER UPDATE OF user_id, category ON knowledge_documents
+        FOR EACH ROW
+        WHEN (
+            OLD.user_id IS DISTINCT FROM NEW.user_id
+            OR OLD.category IS DISTINCT FROM NEW.category
+        )
+        EXECUTE FUNCTION knowledge_documents_sync_chunk_fields()
+    """)
+
+    op.create_index('ix_vector_chunks_document_id', 'vector_chunks', ['document_id', 'chunk_index'], unique=False)
+    op.create_index(
+        'ix_vector_chunks_searchable_user_document', 'vector_chunks', ['user_id', 'document_id'], unique=False,
+        postgresql_where=sa.text("duplicate_of_id IS NULL")
+    )
+    op.create_index(
+        'ix_vector_chunks_searchable_user_category', 'vector_chunks', ['user_id', 'category'], unique=False,
+        postgresql_where=sa.text("duplicate_of_id IS NULL")
+    )
+
+
+def downgrade():
+    op.drop_index('ix_vector_chunks_searchable_user_category', table_name='vector_chunks')
+    op.drop_index('ix_vector_chunks_searchable_user_document', table_name='vector_chunks')
+    op.drop_index('ix_vector_chunks_document_id', table_name='vector_chunks')
+
+    op.execute('DROP TRIGGER IF EXISTS trg_knowledge_documents_sync_chunk_fields ON knowledge_documents')
+    op.execute('DROP FUNCTION IF EXISTS knowledge_documents_sync_chunk_fields()')
+    op.execute('DROP TRIGGER IF EXISTS trg_vector_chunks_fill_document_fields ON vector_chunks')
+    op.execute('DROP FUNCTION IF EXISTS vector_chunks_fill_document_fields()')
+
+    op.drop_column('vector_chunks', 'category')
+    op.drop_column('vector_chunks', 'user_id')
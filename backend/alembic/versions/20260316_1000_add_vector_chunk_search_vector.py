@@ -0,0 +1,108 @@
+"""向量分块增加关键词检索词位（tsvector）与 GIN 索引
+
+Revision ID: add_vector_chunk_search_vector
+Revises: add_vector_chunk_document_fields
+Create Date: 2026-03-16 10:00:00.000000
+
+中文分词在应用层完成（app.utils.lexical），已有分块在迁移中按批回填；
+迁移不导入应用代码，回填使用迁移编写时分词规则的副本（应用中的分词规则以后变化时，迁移结果不变）
+
+GIN 索引不是部分索引：关键词检索对每个分块按其所属文档与分类过滤，近似重复分块也参与召回（按组合并）
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_vector_chunk_search_vector'
+down_revision = 'add_vector_chunk_document_fields'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+# 以下分词规则与迁移编写时的 app.utils.lexical 一致
+_WORD_RE = re.compile(r'[0-9a-z]+|[\u4e00-\u9fff]+')
+_MAX_TOKEN_LENGTH = 64
+_MAX_POSITION = 16383
+_MAX_POSITIONS_PER_LEXEME = 256
+
+
+def _tokenize(text):
+    """英文与数字按连续字母数字切分（小写），中文按相邻两字切分"""
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word[0] >= '\u4e00':
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        elif len(word) <= _MAX_TOKEN_LENGTH:
+            tokens.append(word)
+    return tokens
+
+
+def _to_tsvector_text(tokens):
+    """tsvector 输入文本（词位带位置，位置数即词频）"""
+    positions = {}
+    for position, token in enumerate(tokens, 1):
+        token_positions = positions.setdefault(token, [])
+        if len(token_positions) < _MAX_POSITIONS_PER_LEXEME:
+            token_positions.append(min(position, _MAX_POSITION))
+    return " ".join(
+        "'" + lexeme.replace("\\", "\\\\").replace("'", "''") + "':"
+        + ",".join(map(str, sorted(set(token_positions))))
+        for lexeme, token_positions in positions.items()
+    )
+
+
+def upgrade():
+    op.add_column('vector_chunks', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('vector_chunks', sa.Column('search_length', sa.Integer(), nullable=True))
+
+    # 按 ID 分批回填（紧凑存储的分块从文档内容截取文本）
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text("""
+            SELECT vc.id, COALESCE(vc.chunk_text, substr(kd.content, vc.start_offset + 1, vc.end_offset - vc.start_offset))
+            FROM vector_chunks vc
+            JOIN knowledge_documents kd ON vc.document_id = kd.id
+            WHERE vc.id > :last_id
+            ORDER BY vc.id
+            LIMIT :limit
+        """), {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for chunk_id, chunk_text in rows:
+            tokens = _tokenize(chunk_text or "")
+            updates.append({
+                "id": chunk_id,
+                "search_vector": _to_tsvector_text(tokens) if tokens else None,
+                "search_length": len(tokens)
+            })
+        conn.execute(
+            sa.text("""
+                UPDATE vector_chunks
+                SET search_vector = CAST(:search_vector AS tsvector), search_length = :search_length
+                WHERE id = :id
+            """),
+            updates
+        )
+        last_id = rows[-1][0]
+
+    op.create_index(
+        'ix_vector_chunks_search_vector', 'vector_chunks', ['search_vector'], unique=False,
+        postgresql_using='gin'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_vector_chunks_search_vector', table_name='vector_chunks')
+    op.drop_column('vector_chunks', 'search_length')
+    op.drop_column('vector_chunks', 'search_vector')
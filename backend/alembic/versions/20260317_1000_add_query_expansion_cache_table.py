@@ -0,0 +1,41 @@
+"""添加查询扩展缓存表
+
+Revision ID: add_query_expansion_cache_table
+Revises: add_vector_chunk_search_vector
+Create Date: 2026-03-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_query_expansion_cache_table'
+down_revision = 'add_vector_chunk_search_vector'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 创建 query_expansion_cache 表（按查询哈希、提示词版本、模型、扩展数量唯一）
+    op.create_table(
+        'query_expansion_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('query_hash', sa.String(length=64), nullable=False),
+        sa.Column('prompt_version', sa.String(length=64), nullable=False),
+        sa.Column('model', sa.String(length=200), nullable=False),
+        sa.Column('num_expansions', sa.Integer(), nullable=False),
+        sa.Column('expansions', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('query_hash', 'prompt_version', 'model', 'num_expansions', name='uq_query_expansion_cache_key')
+    )
+    op.create_index(op.f('ix_query_expansion_cache_id'), 'query_expansion_cache', ['id'], unique=False)
+    # 预热按时间倒序读取最近的条目
+    op.create_index('ix_query_expansion_cache_version_created', 'query_expansion_cache', ['prompt_version', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_query_expansion_cache_version_created', table_name='query_expansion_cache')
+    op.drop_index(op.f('ix_query_expansion_cache_id'), table_name='query_expansion_cache')
+    op.drop_table('query_expansion_cache')
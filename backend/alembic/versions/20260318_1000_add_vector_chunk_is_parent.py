@@ -0,0 +1,34 @@
+"""向量分块增加父块标记
+
+Revision ID: add_vector_chunk_is_parent
+Revises: add_query_expansion_cache_table
+Create Date: 2026-03-18 10:00:00.000000
+
+父子分段的父块此前只能通过子块的 parent_chunk_id 反查，检索时无法直接排除；
+已有父块按子块的 parent_chunk_id 回填
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_vector_chunk_is_parent'
+down_revision = 'add_query_expansion_cache_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'vector_chunks',
+        sa.Column('is_parent', sa.Boolean(), nullable=False, server_default=sa.false())
+    )
+    op.execute("""
+        UPDATE vector_chunks
+        SET is_parent = true
+        WHERE id IN (SELECT DISTINCT parent_chunk_id FROM vector_chunks WHERE parent_chunk_id IS NOT NULL)
+    """)
+
+
+def downgrade():
+    op.drop_column('vector_chunks', 'is_parent')
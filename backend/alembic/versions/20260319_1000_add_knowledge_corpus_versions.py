@@ -0,0 +1,32 @@
+"""添加用户知识库版本号表
+
+Revision ID: add_knowledge_corpus_versions
+Revises: add_vector_chunk_is_parent
+Create Date: 2026-03-19 10:00:00.000000
+
+修改知识库文档的事务中递增该用户的版本号，检索结果缓存读取它作为缓存版本的一部分，
+多进程部署时其他进程的修改提交后即失效
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_knowledge_corpus_versions'
+down_revision = 'add_vector_chunk_is_parent'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'knowledge_corpus_versions',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('knowledge_corpus_versions')
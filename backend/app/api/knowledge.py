@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Dict, List
 from app.core.database import get_db
 from app.models.user import User
 from app.models.knowledge import KnowledgeDocument, QueryHistory
@@ -64,18 +64,24 @@ async def upload_knowledge(
     db.commit()
     db.refresh(db_doc)
 
-    # 调用 RAG 服务处理文档
-    try:
-        from app.services.rag_service import RAGService
-        await RAGService.process_document(db_doc.id, file_path, db, chunk_strategy=chunk_strategy)
-    except Exception as e:
-        print(f"知识库文档处理失败: {e}")
-        # 处理失败不影响文档上传
+    # 写入入库队列，由后台 Worker 解析、分段并向量化
+    from app.services.ingestion_queue_service import ingestion_queue
+    job = await ingestion_queue.enqueue(
+        db,
+        document_id=db_doc.id,
+        user_id=current_user.id,
+        chunk_strategy=chunk_strategy,
+        task_title=f"知识库文档处理 - {file.filename}"
+    )
 
     return ApiResponse(
         code=201,
-        message="文档上传成功",
-        data=KnowledgeDocumentResponse.model_validate(db_doc)
+        message="文档上传成功，正在后台处理",
+        data={
+            **KnowledgeDocumentResponse.model_validate(db_doc).model_dump(),
+            "task_id": job.task_id,
+            "job_id": job.id
+        }
     )
 
 
@@ -106,6 +112,9 @@ async def delete_knowledge_document(
 ):
     """删除知识库文档"""
     from app.schemas.common import SuccessResponse
+    from app.services.rag_service import RAGService
+    from app.services.keyword_index_service import keyword_index
+    from app.services.vector_backend_service import vector_backend
 
     doc = db.query(KnowledgeDocument).filter(
         KnowledgeDocument.id == doc_id,
@@ -119,9 +128,14 @@ async def delete_knowledge_document(
     # 删除文件
     if os.path.exists(doc.file_path):
         os.remove(doc.file_path)
+    # 其他文档中引用本文档分块的近似重复分块接管向量
+    heir_document_ids = RAGService.release_duplicate_chunks(db, document_id=doc.id)
     # 删除数据库记录
     db.delete(doc)
     db.commit()
+    keyword_index.remove_document(doc_id, user_id=current_user.id)
+    vector_backend.remove_document(doc_id, user_id=current_user.id)
+    RAGService.refresh_heir_documents(db, heir_document_ids)
     return SuccessResponse()
 
 
@@ -139,7 +153,11 @@ async def query_knowledge(
     use_query_expansion = query.use_query_expansion if query.use_query_expansion is not None else settings.ENABLE_QUERY_EXPANSION
     use_hybrid_search = query.use_hybrid_search if query.use_hybrid_search is not None else settings.ENABLE_HYBRID_SEARCH
     use_reranking = query.use_reranking if query.use_reranking is not None else settings.ENABLE_RERANKING
+    latency_budget_ms = query.latency_budget_ms
+    if latency_budget_ms is None and settings.ENABLE_SPECULATIVE_RETRIEVAL:
+        latency_budget_ms = settings.RETRIEVAL_LATENCY_BUDGET_MS
 
+    stage_report: Dict[str, Any] = {}
     results = await RAGService.search_knowledge(
         query.query,
         current_user.id,
@@ -147,7 +165,13 @@ async def query_knowledge(
         use_query_expansion=use_query_expansion,
         use_hybrid_search=use_hybrid_search,
         use_reranking=use_reranking,
-        db=db
+        db=db,
+        ef_search=query.ef_search,
+        probes=query.probes,
+        document_ids=query.document_ids,
+        category=query.category,
+        latency_budget_ms=latency_budget_ms or None,
+        stage_report=stage_report
     )
 
     # 自动保存查询历史
@@ -198,8 +222,10 @@ async def query_knowledge(
             "config": {
                 "use_query_expansion": use_query_expansion,
                 "use_hybrid_search": use_hybrid_search,
-                "use_reranking": use_reranking
-            }
+                "use_reranking": use_reranking,
+                "latency_budget_ms": latency_budget_ms or None
+            },
+            "stages": stage_report
         }
     )
 
@@ -290,6 +316,74 @@ async def save_query_history(
     return SuccessResponse(message="查询记录已保存")
 
 
+@router.get("/embedding-cache/stats")
+async def get_embedding_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取 Embedding 缓存命中统计"""
+    from app.services.embedding_cache_service import embedding_cache
+
+    return ApiResponse(
+        code=200,
+        message="success",
+        data={
+            "enabled": settings.ENABLE_EMBEDDING_CACHE,
+            **embedding_cache.get_stats()
+        }
+    )
+
+
+@router.get("/query-expansion-cache/stats")
+async def get_query_expansion_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取查询扩展缓存命中统计"""
+    from app.services.query_expansion_cache_service import query_expansion_cache
+
+    return ApiResponse(
+        code=200,
+        message="success",
+        data={
+            "enabled": settings.ENABLE_QUERY_EXPANSION_CACHE,
+            **query_expansion_cache.get_stats()
+        }
+    )
+
+
+@router.get("/rerank-cache/stats")
+async def get_rerank_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取重排序得分缓存命中统计"""
+    from app.services.reranker_service import rerank_score_cache
+
+    return ApiResponse(
+        code=200,
+        message="success",
+        data={
+            "reranker": settings.RERANKER,
+            **rerank_score_cache.get_stats()
+        }
+    )
+
+
+@router.get("/search-cache/stats")
+async def get_search_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取检索结果缓存命中统计"""
+    from app.services.search_cache_service import search_cache
+
+    return ApiResponse(
+        code=200,
+        message="success",
+        data={
+            "enabled": settings.ENABLE_SEARCH_CACHE,
+            **search_cache.get_stats()
+        }
+    )
+
+
 @router.get("/{doc_id}/preview")
 async def get_document_preview(
     doc_id: int,
@@ -336,8 +430,9 @@ async def get_document_preview(
     chunk_list = [
         {
             "index": chunk.chunk_index,
-            "content": chunk.chunk_text,
-            "parent_chunk_id": chunk.parent_chunk_id
+            "content": chunk.content,
+            "parent_chunk_id": chunk.parent_chunk_id,
+            "is_parent": chunk.is_parent
         }
         for chunk in chunks
     ]
@@ -362,6 +457,8 @@ async def update_document_category(
 ):
     """更新文档分类"""
     from app.schemas.common import SuccessResponse
+    from app.services.keyword_index_service import keyword_index
+    from app.services.vector_backend_service import vector_backend
 
     doc = db.query(KnowledgeDocument).filter(
         KnowledgeDocument.id == doc_id,
@@ -376,6 +473,8 @@ async def update_document_category(
 
     doc.category = category_update.category
     db.commit()
+    keyword_index.set_document_category(current_user.id, doc_id, category_update.category)
+    vector_backend.set_document_category(current_user.id, doc_id, category_update.category)
 
     return SuccessResponse(message="分类更新成功")
 
@@ -387,9 +486,9 @@ async def update_document_chunk_strategy(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """更新文档分段策略并重新处理"""
+    """更新文档分段策略并在后台增量重新分段"""
     from app.schemas.common import ApiResponse
-    from app.services.rag_service import RAGService
+    from app.services.ingestion_queue_service import ingestion_queue
 
     doc = db.query(KnowledgeDocument).filter(
         KnowledgeDocument.id == doc_id,
@@ -402,29 +501,30 @@ async def update_document_chunk_strategy(
             detail="文档不存在"
         )
 
-    # 删除旧的文本块
-    await RAGService.delete_document_chunks(doc_id, db)
-
-    # 更新分段策略
+    # 更新分段策略，实际分段由入库队列在后台完成
     doc.chunk_strategy = strategy_update.chunk_strategy
     doc.status = "processing"
-    doc.chunk_count = 0
     db.commit()
 
-    # 重新处理文档
-    try:
-        await RAGService.process_document(doc_id, doc.file_path, db, chunk_strategy=strategy_update.chunk_strategy)
-    except Exception as e:
-        print(f"文档重新处理失败: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"文档重新处理失败: {str(e)}"
-        )
+    job = await ingestion_queue.enqueue(
+        db,
+        document_id=doc_id,
+        user_id=current_user.id,
+        chunk_strategy=strategy_update.chunk_strategy,
+        job_type="rechunk",
+        task_title=f"知识库重新分段 - {doc.file_name}"
+    )
+    db.refresh(doc)
 
     return ApiResponse(
         code=200,
-        message="分段策略更新成功，文档已重新处理",
-        data=KnowledgeDocumentResponse.model_validate(doc)
+        message="分段策略更新成功，文档正在重新处理",
+        data={
+            **KnowledgeDocumentResponse.model_validate(doc).model_dump(),
+            "task_id": job.task_id,
+            "job_id": job.id,
+            "status": doc.status
+        }
     )
 
 
@@ -0,0 +1,65 @@
+"""
+向量检索专用数据库连接
+- asyncpg 驱动 + pgvector 二进制编码：查询向量作为二进制参数传输，不再格式化为十进制字符串拼入 SQL
+- SQL 文本固定、参数绑定，asyncpg 在每个连接上缓存预编译语句，重复查询跳过解析与计划
+- 自动提交模式，索引查询参数（hnsw.ef_search 等）设置在会话级并记录在连接信息中，
+  与上次相同时不再下发，常见情况下一次检索只需一次往返
+"""
+from typing import Any, Dict, List
+
+from pgvector.asyncpg import register_vector
+from sqlalchemy import event, text
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import settings
+
+# 连接信息中记录已下发的会话参数
+_SESSION_SETTINGS_KEY = "vector_session_settings"
+
+vector_engine = create_async_engine(
+    settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
+    pool_size=settings.VECTOR_SEARCH_POOL_SIZE,
+    isolation_level="AUTOCOMMIT",
+    echo=False
+)
+
+
+@event.listens_for(vector_engine.sync_engine, "connect")
+def _register_vector_codec(dbapi_connection, connection_record):
+    """新连接注册 vector 类型的二进制编解码"""
+    dbapi_connection.run_async(register_vector)
+
+
+async def fetch_rows(sql: str, params: Dict[str, Any], session_settings: Dict[str, str]) -> List[Row]:
+    """
+    执行向量查询
+
+    Args:
+        sql: 查询 SQL（命名参数，向量参数需 CAST 为 vector）
+        params: 绑定参数（向量可为 list 或 numpy 数组）
+        session_settings: 会话参数（如 {"hnsw.ef_search": "40"}），每次查询需给出完整取值
+
+    Returns:
+        查询结果行
+    """
+    async with vector_engine.connect() as conn:
+        applied = conn.info.setdefault(_SESSION_SETTINGS_KEY, {})
+        changed = {name: value for name, value in session_settings.items() if applied.get(name) != value}
+        if changed:
+            set_params = {}
+            calls = []
+            for i, (name, value) in enumerate(changed.items()):
+                set_params[f"name_{i}"] = name
+                set_params[f"value_{i}"] = value
+                calls.append(f"set_config(:name_{i}, :value_{i}, false)")
+            await conn.execute(text(f"SELECT {', '.join(calls)}"), set_params)
+            applied.update(changed)
+
+        result = await conn.execute(text(sql), params)
+        return result.fetchall()
+
+
+async def dispose():
+    """关闭连接池"""
+    await vector_engine.dispose()
@@ -2,7 +2,7 @@ from app.models.user import User
 from app.models.resume import Resume
 from app.models.interview import Interview, InterviewStatus
 from app.models.job import Job
-from app.models.knowledge import KnowledgeDocument, VectorChunk
+from app.models.knowledge import KnowledgeDocument, VectorChunk, KnowledgeIngestionJob, KnowledgeCorpusVersion
 from app.models.game import (
     ResumeFinderSession,
     UserPoints,
@@ -26,6 +26,8 @@ __all__ = [
     "Job",
     "KnowledgeDocument",
     "VectorChunk",
+    "KnowledgeIngestionJob",
+    "KnowledgeCorpusVersion",
     "ResumeFinderSession",
     "UserPoints",
     "UserAchievement",
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, Text, DateTime, ForeignKey, UniqueConstraint, select, false
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, backref, column_property
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from pgvector.sqlalchemy import Vector
 from app.core.database import Base
 
@@ -31,15 +32,100 @@ class VectorChunk(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("knowledge_documents.id"), nullable=False)
-    chunk_text = Column(Text, nullable=False)
+    chunk_text = Column(Text, nullable=True)  # 紧凑存储模式下为空，文本按偏移从文档内容截取
+    start_offset = Column(Integer, nullable=True)  # 分块在文档内容中的起始偏移（字符）
+    end_offset = Column(Integer, nullable=True)  # 分块在文档内容中的结束偏移（字符，不含）
     embedding = Column(Vector(1024))  # pgvector 存储
     chunk_index = Column(Integer)
     parent_chunk_id = Column(Integer, ForeignKey("vector_chunks.id"), nullable=True)  # 父块 ID，用于父子分段
+    is_parent = Column(Boolean, nullable=False, default=False, server_default=false())  # 父子分段的父块（可只检索子块，父块作为命中子块的上下文返回）
+    simhash = Column(BigInteger, nullable=True)  # 文本 SimHash 签名（有符号 64 位），用于近似重复检测
+    duplicate_of_id = Column(Integer, ForeignKey("vector_chunks.id", ondelete="SET NULL"), nullable=True, index=True)  # 近似重复时指向已有分块，复用其向量（本行不存向量）
+
+    # 所属文档的用户、分类（冗余存储，检索时不联表过滤；由数据库触发器与 knowledge_documents 保持同步）
+    # 文档状态变化频繁，只保存在文档上，检索时按已完成文档的 ID 过滤
+    user_id = Column(Integer, nullable=True)
+    category = Column(String(50), nullable=True)
+    search_vector = Column(TSVECTOR, nullable=True)  # 关键词检索词位（中文二元组 + 英文单词，带位置），GIN 索引
+    search_length = Column(Integer, nullable=True)  # 分词后的词元数（BM25 长度归一化）
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # 分块文本（读取时解析）：优先使用存储的文本，否则按偏移截取一次文档内容
+    content = column_property(
+        func.coalesce(
+            chunk_text,
+            select(
+                func.substr(KnowledgeDocument.content, start_offset + 1, end_offset - start_offset)
+            ).where(KnowledgeDocument.id == document_id).scalar_subquery()
+        )
+    )
+
     document = relationship("KnowledgeDocument", backref="chunks")
-    parent_chunk = relationship("VectorChunk", remote_side=[id], backref="child_chunks")
+    parent_chunk = relationship("VectorChunk", remote_side=[id], foreign_keys=[parent_chunk_id], backref="child_chunks")
+
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    __table_args__ = (
+        UniqueConstraint("text_hash", "provider", "model", "dimension", name="uq_embedding_cache_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    text_hash = Column(String(64), nullable=False)  # 归一化文本的 SHA-256
+    provider = Column(String(50), nullable=False)  # Embedding 提供商
+    model = Column(String(200), nullable=False)  # Embedding 模型
+    dimension = Column(Integer, nullable=False)  # 向量维度
+    embedding = Column(Vector(), nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class QueryExpansionCache(Base):
+    __tablename__ = "query_expansion_cache"
+    __table_args__ = (
+        UniqueConstraint("query_hash", "prompt_version", "model", "num_expansions", name="uq_query_expansion_cache_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    query_hash = Column(String(64), nullable=False)  # 归一化查询的 SHA-256
+    prompt_version = Column(String(64), nullable=False)  # query_expansion 提示词内容的哈希
+    model = Column(String(200), nullable=False)  # 生成扩展的 LLM 模型
+    num_expansions = Column(Integer, nullable=False)  # 请求的扩展数量
+    expansions = Column(Text, nullable=False)  # JSON 格式的查询变体列表（不含原始查询）
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class KnowledgeCorpusVersion(Base):
+    """用户知识库版本号：修改知识库文档的事务中递增，检索结果缓存据此跨进程失效"""
+    __tablename__ = "knowledge_corpus_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class KnowledgeIngestionJob(Base):
+    __tablename__ = "knowledge_ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("knowledge_documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    job_type = Column(String(20), default="process")  # process(解析入库), rechunk(重新分段)
+    chunk_strategy = Column(String(50), default="semantic")
+    status = Column(String(20), default="pending", index=True)  # pending, running, completed, failed
+    attempts = Column(Integer, default=0)  # 已尝试次数
+    max_attempts = Column(Integer, default=3)  # 最大尝试次数
+    progress = Column(Integer, default=0)  # 进度（0-100）
+    error_message = Column(Text)
+    task_id = Column(String(255))  # 对应的任务通知 ID
+    next_run_at = Column(DateTime(timezone=True), server_default=func.now())  # 下次可执行时间（重试退避）
+    locked_until = Column(DateTime(timezone=True))  # 执行租约到期时间，过期后可被重新认领
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    document = relationship("KnowledgeDocument", backref=backref("ingestion_jobs", passive_deletes=True))
 
 
 class QueryHistory(Base):
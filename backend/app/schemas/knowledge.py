@@ -26,6 +26,11 @@ class KnowledgeQuery(BaseModel):
     use_query_expansion: Optional[bool] = None  # 使用查询扩展
     use_hybrid_search: Optional[bool] = None  # 使用混合检索
     use_reranking: Optional[bool] = None  # 使用重排序
+    ef_search: Optional[int] = None  # HNSW 查询候选列表大小（召回率/延迟权衡）
+    probes: Optional[int] = None  # IVFFlat 查询扫描的聚类数量（召回率/延迟权衡）
+    document_ids: Optional[List[int]] = None  # 只在这些文档中检索
+    category: Optional[str] = None  # 只在该分类的文档中检索
+    latency_budget_ms: Optional[int] = None  # 检索延迟预算（毫秒），0 表示按顺序执行
 
 
 class DocumentPreviewResponse(BaseModel):
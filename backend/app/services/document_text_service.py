@@ -0,0 +1,295 @@
+"""
+文档文本提取服务
+简历解析、LLM 文档解析与知识库入库共用的提取入口：
+- 按文件内容哈希 + 提取模式在磁盘缓存提取结果，同一文件只解析一次
+- 解析（pdfplumber 等 CPU 密集操作）在进程池中执行，不阻塞事件循环
+- 同一文件的并发提取请求共享同一个解析任务
+- 知识库入库按页/段落流式提取（同样在进程池中解析），边解析边向量化，与整篇提取共用缓存和进行中的任务
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import Dict, Iterator, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 提取逻辑变更时递增，使旧缓存失效
+EXTRACTOR_VERSION = 1
+# 流式提取时解析进程领先消费方的最大片段数（页/段落），限制内存占用
+STREAM_QUEUE_SIZE = 8
+
+
+class DocumentTextExtractor:
+    """带磁盘缓存的文档文本提取器"""
+
+    def __init__(self, cache_dir: str, process_workers: int = 2, enable_cache: bool = True):
+        self.cache_dir = cache_dir
+        self.process_workers = process_workers
+        self.enable_cache = enable_cache
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._manager: Optional[SyncManager] = None
+        # 简历解析在独立线程的事件循环中运行，因此使用线程锁与 concurrent.futures 而非 asyncio 原语
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {
+            "cache_hits": 0,
+            "extractions": 0,
+            "shared": 0
+        }
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """计算文件内容的 SHA-256"""
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    async def extract(self, file_path: str, mode: str = "raw") -> str:
+        """
+        提取文档文本（异步，解析在进程池中执行）
+
+        Args:
+            file_path: 文件路径
+            mode: 提取模式（raw: 原始文本, clean: 清理后的分段文本）
+
+        Returns:
+            提取的文本内容
+        """
+        cache_key = await asyncio.to_thread(self._cache_key, file_path, mode)
+        cached = await asyncio.to_thread(self._read_cache, cache_key)
+        if cached is not None:
+            return cached
+
+        future = self._submit(cache_key, file_path, mode)
+        return await asyncio.wrap_future(future)
+
+    def extract_sync(self, file_path: str, mode: str = "raw") -> str:
+        """
+        提取文档文本（同步版本，供同步调用方使用）
+
+        Args:
+            file_path: 文件路径
+            mode: 提取模式（raw, clean）
+
+        Returns:
+            提取的文本内容
+        """
+        cache_key = self._cache_key(file_path, mode)
+        cached = self._read_cache(cache_key)
+        if cached is not None:
+            return cached
+        return self._submit(cache_key, file_path, mode).result()
+
+    def iter_clean_segments(self, file_path: str) -> Iterator[str]:
+        """
+        流式提取清理后的文档片段（同步迭代器，由调用方在线程中推进）
+
+        解析在进程池中逐页/逐段执行，片段经有界队列回传，全部产出后写入 clean 模式的缓存。
+        与同一文件的 extract(mode="clean") 共享进行中的解析任务：命中缓存或等待其他请求的解析结果时，整篇作为一个片段返回
+
+        Args:
+            file_path: 文件路径
+
+        Yields:
+            非空的清理后片段，以空行拼接即为 extract(mode="clean") 的结果
+        """
+        from app.utils.document_extractor import stream_document_text
+
+        cache_key = self._cache_key(file_path, "clean")
+        cached = self._read_cache(cache_key)
+        if cached is not None:
+            if cached:
+                yield cached
+            return
+
+        cancelled = None
+        with self._lock:
+            shared = self._inflight.get(cache_key)
+            owner = shared is None
+            if not owner:
+                self._stats["shared"] += 1
+            else:
+                self._stats["extractions"] += 1
+                shared = Future()
+                pool = self._get_pool()
+                if pool is None:
+                    # 进程数为 0：在当前线程逐段解析
+                    segments = self._iter_local_segments(file_path)
+                else:
+                    self._inflight[cache_key] = shared
+                    manager = self._get_manager()
+                    out_queue = manager.Queue(maxsize=STREAM_QUEUE_SIZE)
+                    cancelled = manager.Event()
+                    task = pool.submit(stream_document_text, file_path, out_queue, cancelled)
+                    segments = self._iter_queue(out_queue, task)
+
+        if not owner:
+            text_content = shared.result()
+            if text_content:
+                yield text_content
+            return
+
+        shared.add_done_callback(lambda done: self._on_extracted(cache_key, done))
+        parts: List[str] = []
+        try:
+            for segment in segments:
+                parts.append(segment)
+                yield segment
+        except BaseException as e:
+            # 包括调用方提前关闭迭代器（GeneratorExit）：通知解析进程停止，等待同一文件的请求收到异常
+            if cancelled is not None:
+                cancelled.set()
+            shared.set_exception(e if isinstance(e, Exception) else RuntimeError("文档提取已取消"))
+            raise
+        shared.set_result("\n\n".join(parts))
+
+    @staticmethod
+    def _iter_queue(out_queue, task: Future) -> Iterator[str]:
+        """读取进程池回传的片段，直到结束标记；解析失败时抛出解析进程中的异常"""
+        while True:
+            try:
+                segment = out_queue.get(timeout=1)
+            except queue.Empty:
+                # 解析进程异常退出（如进程池损坏）时不会放入结束标记
+                if task.done() and task.exception() is not None:
+                    task.result()
+                continue
+            if segment is None:
+                break
+            yield segment
+        task.result()
+
+    @staticmethod
+    def _iter_local_segments(file_path: str) -> Iterator[str]:
+        """在当前线程逐段提取清理后的片段"""
+        from app.utils.document_extractor import clean_text, iter_document_segments
+
+        for segment in iter_document_segments(file_path):
+            cleaned = clean_text(segment)
+            if cleaned:
+                yield cleaned
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取提取统计"""
+        with self._lock:
+            return dict(self._stats)
+
+    def shutdown(self):
+        """关闭进程池与流式提取使用的队列管理进程"""
+        with self._lock:
+            pool, self._process_pool = self._process_pool, None
+            manager, self._manager = self._manager, None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if manager:
+            manager.shutdown()
+
+    def _cache_key(self, file_path: str, mode: str) -> str:
+        return f"{self.file_hash(file_path)}_{mode}_v{EXTRACTOR_VERSION}"
+
+    def _cache_path(self, cache_key: str) -> str:
+        return os.path.join(self.cache_dir, cache_key[:2], f"{cache_key}.txt")
+
+    def _read_cache(self, cache_key: str) -> Optional[str]:
+        """读取磁盘缓存"""
+        if not self.enable_cache:
+            return None
+
+        cache_path = self._cache_path(cache_key)
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                text_content = f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取文本缓存失败: {e}")
+            return None
+
+        with self._lock:
+            self._stats["cache_hits"] += 1
+        return text_content
+
+    def _write_cache(self, cache_key: str, text_content: str):
+        """写入磁盘缓存（先写临时文件再原子替换）"""
+        if not self.enable_cache:
+            return
+
+        cache_path = self._cache_path(cache_key)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text_content)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"写入文本缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _submit(self, cache_key: str, file_path: str, mode: str) -> Future:
+        """提交解析任务，同一缓存键的并发请求共享结果"""
+        from app.utils.document_extractor import extract_text
+
+        with self._lock:
+            future = self._inflight.get(cache_key)
+            if future is not None:
+                self._stats["shared"] += 1
+                return future
+
+            self._stats["extractions"] += 1
+            pool = self._get_pool()
+            if pool is None:
+                future = Future()
+                try:
+                    future.set_result(extract_text(file_path, mode))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = pool.submit(extract_text, file_path, mode)
+                self._inflight[cache_key] = future
+
+        future.add_done_callback(lambda done: self._on_extracted(cache_key, done))
+        return future
+
+    def _on_extracted(self, cache_key: str, done: Future):
+        """解析完成：移出进行中的任务，成功时写入缓存"""
+        with self._lock:
+            self._inflight.pop(cache_key, None)
+        if not done.cancelled() and done.exception() is None:
+            self._write_cache(cache_key, done.result())
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """延迟创建进程池（调用方需持有锁），进程数为 0 时在当前线程解析"""
+        if self.process_workers <= 0:
+            return None
+        if self._process_pool is None:
+            # 使用 spawn 避免 fork 继承事件循环与数据库连接
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._process_pool
+
+    def _get_manager(self) -> SyncManager:
+        """延迟创建队列管理进程（调用方需持有锁），为流式提取提供可跨进程传递的队列"""
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager
+
+
+# 全局文档文本提取器实例
+document_text_extractor = DocumentTextExtractor(
+    cache_dir=settings.DOCUMENT_TEXT_CACHE_DIR,
+    process_workers=settings.DOCUMENT_EXTRACT_WORKERS,
+    enable_cache=settings.ENABLE_DOCUMENT_TEXT_CACHE
+)
@@ -0,0 +1,205 @@
+"""
+Embedding 缓存服务
+按 (文本哈希, 提供商, 模型, 维度) 缓存向量嵌入：
+进程内 LRU 作为一级缓存，PostgreSQL embedding_cache 表作为持久化二级缓存
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Iterable
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 缓存键：(文本哈希, 提供商, 模型, 维度)
+CacheKey = Tuple[str, str, str, int]
+
+
+class EmbeddingCache:
+    """两级 Embedding 缓存"""
+
+    def __init__(self, max_memory_items: int = 10000, persist: bool = True):
+        self.max_memory_items = max_memory_items
+        self.persist = persist
+        self._memory: "OrderedDict[CacheKey, List[float]]" = OrderedDict()
+        # 数据库读写在线程中执行，统计计数由锁保护
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "db_errors": 0
+        }
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """归一化文本：Unicode NFKC + 折叠空白（供查询级缓存使用，Embedding 缓存键不归一化）"""
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    @staticmethod
+    def make_key(text: str, provider: str, model: str, dimension: int) -> CacheKey:
+        """
+        生成缓存键
+
+        按原始文本计算哈希：发送给提供商的是原始文本，全角/半角或空白不同的文本向量也可能不同，不共用缓存条目
+        """
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return (text_hash, provider, model or "", dimension)
+
+    async def get_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, List[float]]:
+        """
+        批量查询缓存（先查内存，再查数据库）
+
+        Args:
+            keys: 缓存键列表
+
+        Returns:
+            命中的 {缓存键: 向量} 字典
+        """
+        found: Dict[CacheKey, List[float]] = {}
+        pending: List[CacheKey] = []
+
+        for key in dict.fromkeys(keys):
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                found[key] = embedding
+                self._count("memory_hits")
+            else:
+                pending.append(key)
+
+        if pending and self.persist:
+            db_found = await asyncio.to_thread(self._load_from_db, pending)
+            self._count("db_hits", len(db_found))
+            for key, embedding in db_found.items():
+                self._remember(key, embedding)
+            found.update(db_found)
+
+        self._count("misses", sum(1 for key in pending if key not in found))
+        return found
+
+    async def put_many(self, items: Dict[CacheKey, List[float]]):
+        """
+        批量写入缓存（内存 + 数据库）
+
+        Args:
+            items: {缓存键: 向量} 字典
+        """
+        if not items:
+            return
+
+        for key, embedding in items.items():
+            self._remember(key, embedding)
+
+        if self.persist:
+            await asyncio.to_thread(self._save_to_db, items)
+
+    def get_stats(self) -> Dict[str, float]:
+        """获取缓存命中统计"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["db_hits"]
+        total = hits + stats["misses"]
+        return {
+            **stats,
+            "hits": hits,
+            "requests": total,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_items": len(self._memory),
+            "max_memory_items": self.max_memory_items
+        }
+
+    def clear_memory(self):
+        """清空进程内缓存"""
+        self._memory.clear()
+
+    def _count(self, name: str, amount: int = 1):
+        """累加统计计数（事件循环与数据库读写线程都会调用）"""
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _remember(self, key: CacheKey, embedding: List[float]):
+        """写入内存 LRU，超出容量时淘汰最久未使用的条目"""
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _load_from_db(self, keys: List[CacheKey]) -> Dict[CacheKey, List[float]]:
+        """从数据库加载缓存（在线程中执行）"""
+        from app.core.database import SessionLocal
+        from app.models.knowledge import EmbeddingCache as EmbeddingCacheEntry
+
+        found: Dict[CacheKey, List[float]] = {}
+
+        # 按 (提供商, 模型, 维度) 分组查询
+        groups: Dict[Tuple[str, str, int], List[str]] = {}
+        for text_hash, provider, model, dimension in keys:
+            groups.setdefault((provider, model, dimension), []).append(text_hash)
+
+        db = SessionLocal()
+        try:
+            for (provider, model, dimension), hashes in groups.items():
+                rows = db.query(
+                    EmbeddingCacheEntry.text_hash,
+                    EmbeddingCacheEntry.embedding
+                ).filter(
+                    EmbeddingCacheEntry.provider == provider,
+                    EmbeddingCacheEntry.model == model,
+                    EmbeddingCacheEntry.dimension == dimension,
+                    EmbeddingCacheEntry.text_hash.in_(hashes)
+                ).all()
+                for text_hash, embedding in rows:
+                    values = embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+                    found[(text_hash, provider, model, dimension)] = values
+        except Exception as e:
+            self._count("db_errors")
+            logger.warning(f"读取 Embedding 缓存失败: {e}")
+        finally:
+            db.close()
+
+        return found
+
+    def _save_to_db(self, items: Dict[CacheKey, List[float]]):
+        """写入数据库缓存（在线程中执行，已存在的键忽略）"""
+        from sqlalchemy.dialects.postgresql import insert
+        from app.core.database import SessionLocal
+        from app.models.knowledge import EmbeddingCache as EmbeddingCacheEntry
+
+        rows = [
+            {
+                "text_hash": text_hash,
+                "provider": provider,
+                "model": model,
+                "dimension": dimension,
+                "embedding": embedding
+            }
+            for (text_hash, provider, model, dimension), embedding in items.items()
+        ]
+
+        db = SessionLocal()
+        try:
+            db.execute(
+                insert(EmbeddingCacheEntry).on_conflict_do_nothing(
+                    constraint="uq_embedding_cache_key"
+                ),
+                rows
+            )
+            db.commit()
+        except Exception as e:
+            self._count("db_errors")
+            logger.warning(f"写入 Embedding 缓存失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+# 全局 Embedding 缓存实例
+embedding_cache = EmbeddingCache(
+    max_memory_items=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+    persist=settings.EMBEDDING_CACHE_PERSIST
+)
@@ -0,0 +1,434 @@
+"""
+知识库入库队列服务
+上传接口只写入持久化的入库任务并立即返回，由后台 Worker 池消费：
+- 文档按页/段落流式解析（结果按文件内容缓存），分段结果直接送入向量化流水线，解析与向量化重叠
+- 分段向量化与入库由异步 Worker 执行
+任务支持租约、失败重试（指数退避）与进度通知，服务重启后未完成的任务会被重新认领
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Session, aliased
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 向量化写入完成时的进度，剩余进度留给提交与索引刷新
+STORE_PROGRESS_END = 95
+
+
+class IngestionQueue:
+    """持久化知识库入库队列"""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        poll_interval: float = 2.0,
+        job_lease: int = 600,
+        retry_delay: int = 10
+    ):
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.job_lease = job_lease
+        self.retry_delay = retry_delay
+        self._worker_tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self):
+        """启动 Worker 池"""
+        if self._worker_tasks:
+            return
+
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker_loop(i)) for i in range(self.workers)
+        ]
+        logger.info(f"入库队列已启动: {self.workers} 个 Worker")
+
+    async def stop(self):
+        """停止 Worker 池（运行中的任务将在租约到期后被重新认领）"""
+        self._stopping = True
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        logger.info("入库队列已停止")
+
+    async def enqueue(
+        self,
+        db: Session,
+        document_id: int,
+        user_id: int,
+        chunk_strategy: str = "semantic",
+        job_type: str = "process",
+        task_title: Optional[str] = None
+    ):
+        """
+        写入入库任务并注册任务通知
+
+        Args:
+            db: 数据库会话
+            document_id: 文档 ID
+            user_id: 用户 ID
+            chunk_strategy: 分段策略
+            job_type: 任务类型（process: 解析入库, rechunk: 重新分段）
+            task_title: 任务通知标题
+
+        Returns:
+            入库任务记录
+        """
+        from app.models.knowledge import KnowledgeIngestionJob
+        from app.models.task_notification import TaskType
+        from app.services.task_notification_service import task_notification_service
+
+        job = KnowledgeIngestionJob(
+            document_id=document_id,
+            user_id=user_id,
+            job_type=job_type,
+            chunk_strategy=chunk_strategy,
+            status="pending",
+            attempts=0,
+            max_attempts=max(1, settings.INGESTION_MAX_ATTEMPTS),
+            progress=0
+        )
+        db.add(job)
+        db.flush()
+        job.task_id = f"knowledge_{job_type}_{job.id}"
+        db.commit()
+        db.refresh(job)
+
+        await task_notification_service.register_task(
+            task_id=job.task_id,
+            user_id=user_id,
+            task_type=TaskType.KNOWLEDGE_UPLOAD,
+            task_title=task_title or f"知识库文档处理 - {document_id}",
+            extra_data={
+                "document_id": document_id,
+                "job_id": job.id,
+                "job_type": job_type,
+                "chunk_strategy": chunk_strategy
+            },
+            db=db
+        )
+
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    async def _worker_loop(self, worker_index: int):
+        """Worker 主循环：认领任务并执行，队列为空时等待唤醒或轮询"""
+        while not self._stopping:
+            try:
+                job = await asyncio.to_thread(self._claim_next_job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"认领入库任务失败: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"Worker {worker_index} 开始执行入库任务: {job['id']} (第 {job['attempts']} 次)")
+            await self._run_job(job)
+
+    def _claim_next_job(self) -> Optional[Dict[str, Any]]:
+        """
+        认领一个可执行的任务（在线程中执行）
+
+        可执行任务：到达执行时间的 pending 任务，或租约已过期的 running 任务（Worker 失联）。
+        同一文档已有租约有效的 running 任务时跳过该文档的其他任务，避免入库与重新分段并发改写同一文档的分块。
+        使用 FOR UPDATE SKIP LOCKED，多个 Worker/进程可安全并发认领。
+        """
+        from app.core.database import SessionLocal
+        from app.models.knowledge import KnowledgeDocument, KnowledgeIngestionJob
+
+        running = aliased(KnowledgeIngestionJob)
+        db = SessionLocal()
+        try:
+            while True:
+                now = datetime.now(timezone.utc)
+                document_busy = exists().where(
+                    running.document_id == KnowledgeIngestionJob.document_id,
+                    running.id != KnowledgeIngestionJob.id,
+                    running.status == "running",
+                    running.locked_until >= now
+                )
+                job = db.query(KnowledgeIngestionJob).filter(
+                    ~document_busy,
+                    or_(
+                        and_(
+                            KnowledgeIngestionJob.status == "pending",
+                            KnowledgeIngestionJob.next_run_at <= now
+                        ),
+                        and_(
+                            KnowledgeIngestionJob.status == "running",
+                            KnowledgeIngestionJob.locked_until < now
+                        )
+                    )
+                ).order_by(
+                    KnowledgeIngestionJob.next_run_at,
+                    KnowledgeIngestionJob.id
+                ).with_for_update(skip_locked=True).first()
+
+                if not job:
+                    return None
+
+                # 失联任务已用尽尝试次数，直接标记失败
+                if job.attempts >= job.max_attempts:
+                    job.status = "failed"
+                    job.error_message = job.error_message or "任务执行超时"
+                    doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == job.document_id).first()
+                    if doc:
+                        doc.status = "failed"
+                        doc.error_message = job.error_message
+                    db.commit()
+                    continue
+
+                # 两个 Worker 可能同时认领同一文档的不同任务：锁定文档行后重新检查，
+                # 另一 Worker 已先提交时放弃本次认领，等下次轮询
+                db.query(KnowledgeDocument.id).filter(
+                    KnowledgeDocument.id == job.document_id
+                ).with_for_update().first()
+                if db.query(document_busy.where(KnowledgeIngestionJob.id == job.id)).scalar():
+                    db.rollback()
+                    return None
+
+                job.status = "running"
+                job.attempts = (job.attempts or 0) + 1
+                job.locked_until = now + timedelta(seconds=self.job_lease)
+                db.commit()
+
+                return {
+                    "id": job.id,
+                    "document_id": job.document_id,
+                    "user_id": job.user_id,
+                    "job_type": job.job_type,
+                    "chunk_strategy": job.chunk_strategy or "semantic",
+                    "attempts": job.attempts,
+                    "max_attempts": job.max_attempts,
+                    "task_id": job.task_id
+                }
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        """执行入库任务并推送进度"""
+        from app.core.database import SessionLocal
+        from app.models.knowledge import KnowledgeDocument
+        from app.models.task_notification import TaskType
+        from app.services.rag_service import RAGService
+        from app.services.document_text_service import document_text_extractor
+        from app.services.task_notification_service import task_notification_service
+
+        task_id = job["task_id"]
+        db = SessionLocal()
+        try:
+            # 服务重启后内存中的任务状态已丢失，重新注册以便继续推送
+            if task_notification_service.get_task_status(task_id) is None:
+                await task_notification_service.register_task(
+                    task_id=task_id,
+                    user_id=job["user_id"],
+                    task_type=TaskType.KNOWLEDGE_UPLOAD,
+                    task_title=f"知识库文档处理 - {job['document_id']}",
+                    extra_data={"document_id": job["document_id"], "job_id": job["id"]}
+                )
+
+            if job["job_type"] == "rechunk":
+                await task_notification_service.notify_started(task_id, "正在重新分段...")
+
+                async def _on_rechunk_progress(embedded: int, ratio: float):
+                    progress = int(STORE_PROGRESS_END * ratio)
+                    await self._report_progress(job, progress, f"已向量化 {embedded} 个新增文本块", "embedding")
+
+                # 旧数据重新分段时需重新提取文档，提取期间由心跳续约
+                result = await self._with_lease_heartbeat(
+                    job,
+                    RAGService.rechunk_document(
+                        job["document_id"], job["chunk_strategy"], db, on_progress=_on_rechunk_progress
+                    )
+                )
+                message = "文档重新分段完成"
+            else:
+                doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == job["document_id"]).first()
+                if not doc:
+                    raise ValueError("文档不存在")
+                doc.status = "processing"
+                doc.error_message = None
+                db.commit()
+
+                await task_notification_service.notify_started(task_id, "正在解析并向量化文档...")
+
+                async def _on_progress(stored: int, ratio: float):
+                    progress = int(STORE_PROGRESS_END * ratio)
+                    await self._report_progress(job, progress, f"已向量化 {stored} 个文本块", "embedding")
+
+                # 首个分块写入前（解析首页等）没有进度回调，由心跳续约
+                chunk_count = await self._with_lease_heartbeat(
+                    job,
+                    RAGService.ingest_document_content(
+                        job["document_id"],
+                        document_text_extractor.iter_clean_segments(doc.file_path),
+                        db,
+                        chunk_strategy=job["chunk_strategy"],
+                        on_progress=_on_progress
+                    )
+                )
+                result = {"document_id": job["document_id"], "chunk_count": chunk_count}
+                message = "文档处理完成"
+
+            await asyncio.to_thread(self._mark_completed, job["id"])
+            await task_notification_service.notify_completed(
+                task_id=task_id,
+                result=result,
+                message=message,
+                redirect_url="/knowledge",
+                db=db
+            )
+
+        except asyncio.CancelledError:
+            # Worker 停止：保持 running 状态，租约到期后由其他 Worker 重新认领
+            db.rollback()
+            raise
+
+        except Exception as e:
+            logger.error(f"入库任务 {job['id']} 执行失败: {e}")
+            db.rollback()
+
+            # ValueError 表示文档本身的问题（不存在、内容为空），重试无意义
+            retry = not isinstance(e, ValueError) and job["attempts"] < job["max_attempts"]
+            delay = self.retry_delay * (2 ** (job["attempts"] - 1))
+            await asyncio.to_thread(self._mark_failed, job, str(e), retry, delay)
+
+            if retry:
+                await task_notification_service.notify_progress(
+                    task_id,
+                    0,
+                    f"处理失败，{delay} 秒后重试（第 {job['attempts']}/{job['max_attempts']} 次）: {e}",
+                    step="retry"
+                )
+            else:
+                await task_notification_service.notify_failed(
+                    task_id=task_id,
+                    error=str(e),
+                    error_type=type(e).__name__,
+                    db=db
+                )
+        finally:
+            db.close()
+
+    async def _report_progress(self, job: Dict[str, Any], progress: int, message: str, step: str):
+        """记录任务进度并续约，同时推送任务通知"""
+        from app.services.task_notification_service import task_notification_service
+
+        await asyncio.to_thread(self._renew_lease, job["id"], progress)
+        await task_notification_service.notify_progress(job["task_id"], progress, message, step=step)
+
+    async def _with_lease_heartbeat(self, job: Dict[str, Any], awaitable: Awaitable[T]) -> T:
+        """
+        等待耗时步骤完成，期间按租约的三分之一周期续约（文档解析等步骤没有进度回调，
+        大文档可能超过租约时长，未续约会被其他 Worker 当作失联任务重新认领）
+
+        Args:
+            job: 任务信息
+            awaitable: 待执行的步骤
+
+        Returns:
+            步骤的返回值
+        """
+        task = asyncio.ensure_future(awaitable)
+        interval = max(1, self.job_lease // 3)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=interval)
+                if done:
+                    return task.result()
+                await asyncio.to_thread(self._renew_lease, job["id"])
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def _renew_lease(self, job_id: int, progress: Optional[int] = None):
+        """更新进度并延长租约（在线程中执行，progress 为空时只续约）"""
+        values: Dict[str, Any] = {
+            "locked_until": datetime.now(timezone.utc) + timedelta(seconds=self.job_lease)
+        }
+        if progress is not None:
+            values["progress"] = progress
+        self._update_job(job_id, **values)
+
+    def _mark_completed(self, job_id: int):
+        """标记任务完成（在线程中执行）"""
+        self._update_job(job_id, status="completed", progress=100, error_message=None, locked_until=None)
+
+    def _mark_failed(self, job: Dict[str, Any], error: str, retry: bool, delay: int):
+        """标记任务失败或等待重试（在线程中执行）"""
+        from app.core.database import SessionLocal
+        from app.models.knowledge import KnowledgeDocument
+
+        if retry:
+            self._update_job(
+                job["id"],
+                status="pending",
+                error_message=error,
+                locked_until=None,
+                next_run_at=datetime.now(timezone.utc) + timedelta(seconds=delay)
+            )
+            return
+
+        self._update_job(job["id"], status="failed", error_message=error, locked_until=None)
+
+        db = SessionLocal()
+        try:
+            doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == job["document_id"]).first()
+            if doc:
+                doc.status = "failed"
+                doc.error_message = error
+                db.commit()
+        except Exception as e:
+            logger.error(f"更新文档失败状态出错: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _update_job(self, job_id: int, **values):
+        """更新任务字段（独立会话，在线程中执行）"""
+        from app.core.database import SessionLocal
+        from app.models.knowledge import KnowledgeIngestionJob
+
+        db = SessionLocal()
+        try:
+            db.query(KnowledgeIngestionJob).filter(
+                KnowledgeIngestionJob.id == job_id
+            ).update(values, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"更新入库任务 {job_id} 失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+# 全局入库队列实例
+ingestion_queue = IngestionQueue(
+    workers=settings.INGESTION_WORKERS,
+    poll_interval=settings.INGESTION_POLL_INTERVAL,
+    job_lease=settings.INGESTION_JOB_LEASE,
+    retry_delay=settings.INGESTION_RETRY_DELAY
+)
@@ -66,13 +66,10 @@ class InterviewService:
                 use_query_expansion=True,
                 use_hybrid_search=True,
                 use_reranking=True,
-                db=db
+                db=db,
+                document_ids=knowledge_doc_ids
             )
 
-            # 如果指定了文档ID列表，过滤结果
-            if knowledge_doc_ids:
-                results = [r for r in results if r.get('document_id') in knowledge_doc_ids]
-
             if not results:
                 print(f"[知识库检索] 未找到相关内容")
                 return ""
@@ -0,0 +1,614 @@
+"""
+进程内关键词倒排索引（KEYWORD_SEARCH_BACKEND=memory 时使用）
+为每个用户构建紧凑的倒排索引，在内存中完成 BM25 召回与评分，不依赖数据库全文检索：
+- 倒排表以 array 存储（分块槽位 uint32 + 词频 uint16），评分时以 numpy 视图零拷贝计算
+- 文档入库、重新分段、删除、修改分类时增量更新；删除只标记槽位失效，失效过半时压缩
+- 索引快照保存到磁盘，加载时用（分块数, 最大分块 ID）校验是否与数据库一致，不一致则重建
+- 按内存预算 LRU 淘汰，淘汰前保存快照
+- 每个用户一把锁，某个用户的冷启动构建不阻塞其他用户的检索；检索方在线程中调用，不阻塞事件循环
+
+多进程部署时各进程的索引独立维护，检索结果总是回表校验分块状态，索引滞后只会漏召回，不会返回已删除的分块
+"""
+import logging
+import math
+import os
+import pickle
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.utils import lexical
+from app.services.search_cache_service import search_cache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 快照格式版本（结构变化时递增，旧快照自动失效）
+SNAPSHOT_VERSION = 3
+
+# 单个倒排项记录的最大词频
+_MAX_TF = 65535
+
+# 估算内存时每个词项的固定开销（字典项、词项字符串、两个 array 对象）
+_TERM_OVERHEAD_BYTES = 240
+
+
+class UserKeywordIndex:
+    """单个用户的倒排索引"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        # 槽位数据（槽位即分块在索引中的内部编号）
+        self.chunk_ids = array('q')
+        self.groups = array('q')
+        self.documents = array('i')
+        self.lengths = array('I')
+        self.alive = bytearray()
+        # 词项 -> (槽位列表, 词频列表)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        # 文档 -> 槽位列表 / 分类
+        self.document_slots: Dict[int, array] = {}
+        self.categories: Dict[int, str] = {}
+        self.live_count = 0
+        self.live_length = 0
+        self.dirty = False
+
+    def add_document(self, document_id: int, category: str, chunks: Iterable[Tuple[int, str, int]]):
+        """
+        加入文档的分块（已存在时先移除）
+
+        Args:
+            document_id: 文档 ID
+            category: 文档分类
+            chunks: (分块 ID, 分块文本, 组 ID) 序列（组 ID 为近似重复分块的代表分块 ID，其他分块为自身 ID）
+        """
+        self.remove_document(document_id)
+
+        slots = array('I')
+        for chunk_id, chunk_text, group_id in chunks:
+            slot = len(self.chunk_ids)
+            tokens = lexical.tokenize(chunk_text or "")
+            self.chunk_ids.append(chunk_id)
+            self.groups.append(group_id)
+            self.documents.append(document_id)
+            self.lengths.append(len(tokens))
+            self.alive.append(1)
+            slots.append(slot)
+            for term, tf in Counter(tokens).items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = (array('I'), array('H'))
+                posting[0].append(slot)
+                posting[1].append(min(tf, _MAX_TF))
+            self.live_count += 1
+            self.live_length += len(tokens)
+
+        if slots:
+            self.document_slots[document_id] = slots
+            self.categories[document_id] = category or ""
+        self.dirty = True
+
+    def remove_document(self, document_id: int) -> bool:
+        """
+        移除文档的分块（标记槽位失效，失效槽位过半时压缩）
+
+        Returns:
+            文档是否在索引中
+        """
+        slots = self.document_slots.pop(document_id, None)
+        self.categories.pop(document_id, None)
+        if slots is None:
+            return False
+
+        for slot in slots:
+            if self.alive[slot]:
+                self.alive[slot] = 0
+                self.live_count -= 1
+                self.live_length -= self.lengths[slot]
+        self.dirty = True
+
+        if len(self.chunk_ids) - self.live_count > max(self.live_count, 1024):
+            self.compact()
+        return True
+
+    def set_category(self, document_id: int, category: str):
+        """更新文档分类"""
+        if document_id in self.categories:
+            self.categories[document_id] = category or ""
+            self.dirty = True
+
+    def compact(self):
+        """压缩：去除失效槽位并重新编号"""
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        new_slot = np.cumsum(alive, dtype=np.int64) - 1
+
+        def _to_array(typecode: str, values: np.ndarray) -> array:
+            result = array(typecode)
+            result.frombytes(values.tobytes())
+            return result
+
+        postings = {}
+        for term, (slots, tfs) in self.postings.items():
+            slot_view = np.frombuffer(slots, dtype=np.uint32)
+            keep = alive[slot_view]
+            if keep.any():
+                postings[term] = (
+                    _to_array('I', new_slot[slot_view[keep]].astype(np.uint32)),
+                    _to_array('H', np.frombuffer(tfs, dtype=np.uint16)[keep])
+                )
+            del slot_view
+
+        self.chunk_ids = _to_array('q', np.frombuffer(self.chunk_ids, dtype=np.int64)[alive])
+        self.groups = _to_array('q', np.frombuffer(self.groups, dtype=np.int64)[alive])
+        self.documents = _to_array('i', np.frombuffer(self.documents, dtype=np.int32)[alive])
+        self.lengths = _to_array('I', np.frombuffer(self.lengths, dtype=np.uint32)[alive])
+        self.alive = bytearray(b'\x01' * len(self.chunk_ids))
+        self.postings = postings
+        self.document_slots = {
+            document_id: _to_array('I', new_slot[np.frombuffer(slots, dtype=np.uint32)].astype(np.uint32))
+            for document_id, slots in self.document_slots.items()
+        }
+
+    def search(
+        self,
+        terms: List[str],
+        top_k: int,
+        k1: float,
+        b: float,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        BM25 检索（分块数、平均长度与文档频率取自检索范围内的分块，与数据库检索一致）
+
+        Args:
+            terms: 查询词位
+            top_k: 返回结果数量
+            k1: BM25 词频饱和参数
+            b: BM25 长度归一化参数
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+
+        Returns:
+            [(分块 ID, 归一化得分 0~1)]，按得分降序；近似重复组只返回一个分块
+            （与数据库检索的规则一致：代表分块在检索范围内时为代表分块，否则为范围内 ID 最小的重复分块），
+            组得分取组内最高分
+        """
+        if self.live_count == 0 or not terms:
+            return []
+
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+        in_scope = alive
+        corpus_size, corpus_length = self.live_count, self.live_length
+        if document_ids or category:
+            allowed = [
+                document_id for document_id, doc_category in self.categories.items()
+                if (not document_ids or document_id in document_ids)
+                and (not category or doc_category == category)
+            ]
+            documents = np.frombuffer(self.documents, dtype=np.int32)
+            in_scope = alive & np.isin(documents, allowed)
+            corpus_size = int(in_scope.sum())
+            corpus_length = int(lengths[in_scope].sum())
+            if corpus_size == 0:
+                return []
+
+        average_length = max(corpus_length / corpus_size, 1.0)
+        scores = np.zeros(len(alive), dtype=np.float64)
+        max_score = 0.0
+
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            slots = np.frombuffer(posting[0], dtype=np.uint32)
+            live = in_scope[slots]
+            df = int(live.sum())
+            if df == 0:
+                continue
+            idf = math.log(1 + (corpus_size - df + 0.5) / (df + 0.5))
+            slots = slots[live]
+            tfs = np.frombuffer(posting[1], dtype=np.uint16)[live].astype(np.float64)
+            norm = k1 * (1 - b + b * lengths[slots] / average_length)
+            scores[slots] += idf * tfs * (k1 + 1) / (tfs + norm)
+            max_score += idf * (k1 + 1)
+
+        if max_score == 0:
+            return []
+
+        scores = self._collapse_groups(scores, in_scope)
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.chunk_ids[slot], float(scores[slot] / max_score)) for slot in candidates]
+
+    def _collapse_groups(self, scores: np.ndarray, in_scope: np.ndarray) -> np.ndarray:
+        """
+        近似重复组合并：组得分记到组的代表槽位上，组内其他槽位得分置零
+
+        只处理命中分块中含近似重复分块的组，没有近似重复时原样返回
+        """
+        chunk_ids = np.frombuffer(self.chunk_ids, dtype=np.int64)
+        groups = np.frombuffer(self.groups, dtype=np.int64)
+        duplicate_groups = np.unique(groups[(scores > 0) & (groups != chunk_ids)])
+        if len(duplicate_groups) == 0:
+            return scores
+
+        members = np.flatnonzero(in_scope & np.isin(groups, duplicate_groups))
+        # 组内排序：代表分块优先，其次按 ID，每组第一个槽位为代表槽位
+        members = members[np.lexsort((
+            chunk_ids[members], groups[members] != chunk_ids[members], groups[members]
+        ))]
+        member_groups = groups[members]
+        starts = np.flatnonzero(np.r_[True, member_groups[1:] != member_groups[:-1]])
+        group_scores = np.maximum.reduceat(scores[members], starts)
+
+        scores[members] = 0
+        scores[members[starts]] = group_scores
+        return scores
+
+    def signature(self) -> Tuple[int, int]:
+        """索引内容签名（与数据库中可检索分块的数量、最大 ID 比较；最大 ID 只统计有效槽位）"""
+        if self.live_count == 0:
+            return 0, 0
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        return self.live_count, int(np.frombuffer(self.chunk_ids, dtype=np.int64)[alive].max())
+
+    def memory_bytes(self) -> int:
+        """估算内存占用（字节）"""
+        total = (
+            len(self.chunk_ids) * 8 + len(self.groups) * 8 + len(self.documents) * 4 + len(self.lengths) * 4 + len(self.alive)
+        )
+        for term, (slots, tfs) in self.postings.items():
+            total += _TERM_OVERHEAD_BYTES + len(term) * 4 + len(slots) * 4 + len(tfs) * 2
+        total += sum(len(slots) * 4 + 100 for slots in self.document_slots.values())
+        return total
+
+    def to_snapshot(self) -> dict:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "user_id": self.user_id,
+            "chunk_ids": self.chunk_ids.tobytes(),
+            "groups": self.groups.tobytes(),
+            "documents": self.documents.tobytes(),
+            "lengths": self.lengths.tobytes(),
+            "alive": bytes(self.alive),
+            "postings": {term: (slots.tobytes(), tfs.tobytes()) for term, (slots, tfs) in self.postings.items()},
+            "document_slots": {document_id: slots.tobytes() for document_id, slots in self.document_slots.items()},
+            "categories": self.categories,
+            "live_count": self.live_count,
+            "live_length": self.live_length
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "UserKeywordIndex":
+        def _array(typecode: str, raw: bytes) -> array:
+            result = array(typecode)
+            result.frombytes(raw)
+            return result
+
+        index = cls(data["user_id"])
+        index.chunk_ids = _array('q', data["chunk_ids"])
+        index.groups = _array('q', data["groups"])
+        index.documents = _array('i', data["documents"])
+        index.lengths = _array('I', data["lengths"])
+        index.alive = bytearray(data["alive"])
+        index.postings = {
+            term: (_array('I', slots), _array('H', tfs)) for term, (slots, tfs) in data["postings"].items()
+        }
+        index.document_slots = {
+            document_id: _array('I', slots) for document_id, slots in data["document_slots"].items()
+        }
+        index.categories = data["categories"]
+        index.live_count = data["live_count"]
+        index.live_length = data["live_length"]
+        return index
+
+
+class KeywordIndexManager:
+    """
+    按用户管理倒排索引：按需加载（快照或数据库）、增量更新、LRU 淘汰
+
+    每个用户一把锁，保护该用户索引的加载、构建、检索与增量更新；管理器的锁只保护已加载索引的字典，
+    从数据库构建索引、BM25 评分都不持有管理器的锁。加锁顺序为先用户锁、后管理器锁；
+    淘汰时以非阻塞方式获取被淘汰用户的锁，正在使用的索引不淘汰
+    """
+
+    def __init__(self, memory_budget_mb: int = 256, snapshot_dir: str = "./uploads/keyword_index"):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.snapshot_dir = snapshot_dir
+        self._indexes: "OrderedDict[int, UserKeywordIndex]" = OrderedDict()
+        self._user_locks: Dict[int, threading.RLock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.KEYWORD_SEARCH_BACKEND == "memory"
+
+    def search(
+        self,
+        db: Session,
+        user_id: int,
+        query: str,
+        top_k: int,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        检索用户的倒排索引（索引未加载时从快照或数据库构建，调用方应在线程中调用）
+
+        Args:
+            db: 数据库会话（索引未加载时用于构建）
+            user_id: 用户 ID
+            query: 查询文本
+            top_k: 返回结果数量
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+
+        Returns:
+            [(分块 ID, 归一化得分 0~1)]，按得分降序
+        """
+        terms = lexical.query_terms(query)
+        if not terms:
+            return []
+
+        with self._user_lock(user_id):
+            index = self._get_index(db, user_id)
+            hits = index.search(
+                terms,
+                top_k,
+                settings.KEYWORD_SEARCH_BM25_K1,
+                settings.KEYWORD_SEARCH_BM25_B,
+                document_ids=document_ids,
+                category=category
+            )
+        self._evict()
+        return hits
+
+    def refresh_document(self, db: Session, document_id: int):
+        """
+        按数据库中的当前状态刷新文档在索引中的分块（入库、重新分段完成后调用）
+
+        文档所属用户的索引未加载时只删除其快照，下次加载时从数据库重建
+        """
+        if not self.enabled:
+            return
+
+        try:
+            owner = db.execute(
+                text("SELECT user_id, category FROM knowledge_documents WHERE id = :document_id"),
+                {"document_id": document_id}
+            ).first()
+            if owner is None:
+                search_cache.bump(self._remove_from_loaded(document_id))
+                return
+
+            user_id, category = owner
+            with self._user_lock(user_id):
+                index = self._loaded(user_id)
+                if index is None:
+                    # 未加载时删除快照，下次加载时从数据库重建
+                    self._drop_snapshot(user_id)
+                else:
+                    index.add_document(document_id, category, (
+                        (row[2], row[3], row[4]) for row in self._load_chunks(db, user_id, document_id)
+                    ))
+            self._evict()
+            search_cache.bump(user_id)
+        except Exception as e:
+            logger.error(f"刷新关键词索引失败: 文档 {document_id} - {e}")
+
+    def remove_document(self, document_id: int, user_id: Optional[int] = None):
+        """
+        从索引中移除文档（删除文档或其分块时调用）
+
+        Args:
+            document_id: 文档 ID
+            user_id: 文档所属用户（已知时避免遍历已加载的索引）
+        """
+        if not self.enabled:
+            return
+
+        if user_id is None:
+            search_cache.bump(self._remove_from_loaded(document_id))
+            return
+
+        with self._user_lock(user_id):
+            index = self._loaded(user_id)
+            if index is not None:
+                index.remove_document(document_id)
+            else:
+                self._drop_snapshot(user_id)
+        search_cache.bump(user_id)
+
+    def set_document_category(self, user_id: int, document_id: int, category: str):
+        """更新文档分类"""
+        if not self.enabled:
+            return
+
+        with self._user_lock(user_id):
+            index = self._loaded(user_id)
+            if index is not None:
+                index.set_category(document_id, category)
+            else:
+                self._drop_snapshot(user_id)
+        search_cache.bump(user_id)
+
+    def snapshot_all(self):
+        """保存所有有改动的索引快照（服务关闭时调用）"""
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            with self._user_lock(index.user_id):
+                self._save_snapshot(index)
+
+    def _user_lock(self, user_id: int) -> threading.RLock:
+        """用户索引的锁（不存在时创建）"""
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = threading.RLock()
+            return lock
+
+    def _loaded(self, user_id: int) -> Optional[UserKeywordIndex]:
+        """已加载的用户索引（调用方持有该用户的锁）"""
+        with self._lock:
+            return self._indexes.get(user_id)
+
+    def _remove_from_loaded(self, document_id: int) -> Optional[int]:
+        """从已加载的索引中移除文档，返回文档所属用户（不在已加载的索引中时为 None）"""
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            with self._user_lock(index.user_id):
+                if index.remove_document(document_id):
+                    return index.user_id
+        return None
+
+    def _get_index(self, db: Session, user_id: int) -> UserKeywordIndex:
+        """
+        获取用户索引：内存中 > 有效快照 > 从数据库构建（调用方持有该用户的锁）
+
+        读取数据库与构建索引不持有管理器的锁，完成后再放入已加载的索引
+        """
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index
+
+        signature = self._database_signature(db, user_id)
+        index = self._load_snapshot(user_id)
+        if index is None or index.signature() != signature:
+            index = self._build(db, user_id)
+            self._save_snapshot(index)
+
+        with self._lock:
+            self._indexes[user_id] = index
+        return index
+
+    @staticmethod
+    def _database_signature(db: Session, user_id: int) -> Tuple[int, int]:
+        from app.services.rag_service import RAGService
+
+        conditions, params = RAGService._searchable_chunk_filter(user_id)
+        count, max_id = db.execute(
+            text(f"""
+                SELECT COUNT(*), COALESCE(MAX(vc.id), 0)
+                FROM vector_chunks vc
+                WHERE {conditions}
+            """),
+            params
+        ).first()
+        return int(count), int(max_id)
+
+    @staticmethod
+    def _load_chunks(db: Session, user_id: int, document_id: Optional[int] = None) -> List[Tuple[int, str, int, str, int]]:
+        """
+        读取可检索分块的 (文档 ID, 分类, 分块 ID, 分块文本, 组 ID)，按文档、分块 ID 排序
+
+        检索范围与数据库检索一致（见 RAGService._searchable_chunk_filter）；近似重复分块也加入索引，
+        检索时按组（COALESCE(duplicate_of_id, id)）合并，见 UserKeywordIndex.search
+        """
+        from app.services.rag_service import CHUNK_TEXT_SQL, RAGService
+
+        conditions, params = RAGService._searchable_chunk_filter(user_id)
+        if document_id is not None:
+            conditions += " AND vc.document_id = :document_id"
+            params["document_id"] = document_id
+        return db.execute(
+            text(f"""
+                SELECT vc.document_id, vc.category, vc.id, {CHUNK_TEXT_SQL}, COALESCE(vc.duplicate_of_id, vc.id)
+                FROM vector_chunks vc
+                JOIN knowledge_documents kd ON vc.document_id = kd.id
+                WHERE {conditions}
+                ORDER BY vc.document_id, vc.id
+            """),
+            params
+        ).fetchall()
+
+    @staticmethod
+    def _build(db: Session, user_id: int) -> UserKeywordIndex:
+        """从数据库构建用户索引"""
+        rows = KeywordIndexManager._load_chunks(db, user_id)
+
+        index = UserKeywordIndex(user_id)
+        start = 0
+        while start < len(rows):
+            document_id, category = rows[start][0], rows[start][1]
+            end = start
+            while end < len(rows) and rows[end][0] == document_id:
+                end += 1
+            index.add_document(document_id, category, ((row[2], row[3], row[4]) for row in rows[start:end]))
+            start = end
+        logger.info(f"关键词索引已构建: 用户 {user_id}，{index.live_count} 个分块，{len(index.postings)} 个词项")
+        return index
+
+    def _evict(self):
+        """超出内存预算时淘汰最久未使用的索引（至少保留最近使用的一个，正在使用的索引跳过），淘汰前保存快照"""
+        with self._lock:
+            total = sum(index.memory_bytes() for index in self._indexes.values())
+            for user_id in list(self._indexes)[:-1]:
+                if total <= self.memory_budget:
+                    break
+                lock = self._user_locks[user_id]
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    index = self._indexes.pop(user_id)
+                    total -= index.memory_bytes()
+                    self._save_snapshot(index)
+                finally:
+                    lock.release()
+                logger.info(f"关键词索引已淘汰: 用户 {user_id}")
+
+    def _snapshot_path(self, user_id: int) -> str:
+        return os.path.join(self.snapshot_dir, f"user_{user_id}.idx")
+
+    def _load_snapshot(self, user_id: int) -> Optional[UserKeywordIndex]:
+        path = self._snapshot_path(user_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("version") != SNAPSHOT_VERSION:
+                return None
+            return UserKeywordIndex.from_snapshot(data)
+        except Exception as e:
+            logger.warning(f"读取关键词索引快照失败: {path} - {e}")
+            return None
+
+    def _save_snapshot(self, index: UserKeywordIndex):
+        if not index.dirty:
+            return
+        path = self._snapshot_path(index.user_id)
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(index.to_snapshot(), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            index.dirty = False
+        except Exception as e:
+            logger.warning(f"保存关键词索引快照失败: {path} - {e}")
+
+    def _drop_snapshot(self, user_id: int):
+        try:
+            os.remove(self._snapshot_path(user_id))
+        except FileNotFoundError:
+            pass
+
+
+# 全局关键词索引实例
+keyword_index = KeywordIndexManager(
+    memory_budget_mb=settings.KEYWORD_INDEX_MEMORY_MB,
+    snapshot_dir=settings.KEYWORD_INDEX_SNAPSHOT_DIR
+)
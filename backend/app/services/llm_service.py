@@ -175,6 +175,7 @@ class iFlowLLMService:
         prompt: str,
         temperature: float = 0.3,
         max_tokens: int = 65535,
+        text_content: Optional[str] = None,
         **kwargs
     ) -> str:
         """
@@ -185,6 +186,7 @@ class iFlowLLMService:
             prompt: 解析提示词
             temperature: 温度参数（0-1）
             max_tokens: 最大生成 token 数
+            text_content: 调用方已提取的文本，提供时不再重复提取
             **kwargs: 其他参数
 
         Returns:
@@ -199,8 +201,10 @@ class iFlowLLMService:
             raise Exception(f"文件不存在: {file_path}")
 
         try:
-            # 1. 提取文本内容
-            text_content = self._extract_text_from_file(file_path)
+            # 1. 提取文本内容（统一提取器，进程池解析并按文件内容缓存）
+            if text_content is None:
+                from app.services.document_text_service import document_text_extractor
+                text_content = await document_text_extractor.extract(file_path, mode="raw")
             logger.info(f"文本提取完成，长度: {len(text_content)} 字符")
 
             # 2. 使用 LLM 解析文本
@@ -248,62 +252,8 @@ class iFlowLLMService:
         Returns:
             提取的文本内容
         """
-        import os
-        file_ext = os.path.splitext(file_path)[1].lower()
-
-        # 1. 处理文本文件
-        if file_ext == '.txt':
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except UnicodeDecodeError:
-                try:
-                    with open(file_path, 'r', encoding='gbk') as f:
-                        return f.read()
-                except Exception as e:
-                    logger.error(f"文本文件读取失败: {e}")
-                    raise
-
-        # 2. 处理 PDF 文件
-        if file_ext == '.pdf':
-            try:
-                import pdfplumber
-                text_content = ""
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_content += page_text + "\n"
-                return text_content
-            except ImportError:
-                logger.warning("pdfplumber 未安装，尝试使用 pypdf")
-                try:
-                    import pypdf
-                    reader = pypdf.PdfReader(file_path)
-                    text_content = ""
-                    for page in reader.pages:
-                        text_content += page.extract_text() + "\n"
-                    return text_content
-                except Exception as e:
-                    logger.error(f"PDF 提取失败: {e}")
-                    raise
-            except Exception as e:
-                logger.error(f"PDF 提取失败: {e}")
-                raise
-
-        # 3. 处理 Word 文件
-        if file_ext in ['.docx', '.doc']:
-            try:
-                import docx2txt
-                return docx2txt.process(file_path)
-            except ImportError:
-                logger.warning("docx2txt 未安装")
-                raise Exception("缺少 docx2txt 库，请安装: pip install docx2txt")
-            except Exception as e:
-                logger.error(f"Word 文档提取失败: {e}")
-                raise
-
-        raise Exception(f"不支持的文件类型: {file_ext}")
+        from app.services.document_text_service import document_text_extractor
+        return document_text_extractor.extract_sync(file_path, mode="raw")
 
 
 # 全局 LLM 服务实例
@@ -426,6 +376,38 @@ class OllamaEmbeddingService:
         Returns:
             向量嵌入列表
         """
+        import httpx
+
+        if not texts:
+            return []
+
+        try:
+            # 使用 /api/embed 接口一次请求完成整批文本的向量化
+            async with httpx.AsyncClient(timeout=120.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/api/embed",
+                    json={
+                        "model": self.model,
+                        "input": texts
+                    }
+                )
+                if response.status_code != 404:
+                    response.raise_for_status()
+                    result = response.json()
+                    embeddings = result.get("embeddings") if result else None
+                    if embeddings and len(embeddings) == len(texts):
+                        return embeddings
+                    raise Exception("Ollama API 返回的向量数量与输入不一致")
+
+        except httpx.TimeoutException:
+            raise Exception("Ollama API 调用超时，请稍后重试或检查 Ollama 服务是否正常运行")
+        except httpx.HTTPStatusError as e:
+            raise Exception(f"Ollama API 批量调用失败 (HTTP {e.response.status_code}): {e.response.text}")
+        except httpx.RequestError as e:
+            raise Exception(f"Ollama API 网络请求失败: {str(e)}")
+
+        # 旧版本 Ollama 不支持 /api/embed，逐条调用 /api/embeddings
+        logger.warning("Ollama 不支持 /api/embed 批量接口，降级为逐条向量化")
         embeddings = []
         for text in texts:
             embedding = await self.generate_embedding(text, **kwargs)
@@ -726,9 +708,21 @@ async def get_embedding_service():
         raise Exception(f"不支持的 Embedding 提供商: {provider}")
 
 
+def _embedding_cache_keys(service, texts: List[str]) -> list:
+    """生成 Embedding 缓存键列表"""
+    from app.services.embedding_cache_service import embedding_cache
+
+    provider = settings.EMBEDDING_PROVIDER.lower()
+    model = getattr(service, "model", "") or ""
+    return [
+        embedding_cache.make_key(text, provider, model, settings.VECTOR_DIMENSION)
+        for text in texts
+    ]
+
+
 async def create_embedding(text: str) -> List[float]:
     """
-    统一的 Embedding 生成接口
+    统一的 Embedding 生成接口（启用缓存时优先读取缓存）
 
     Args:
         text: 输入文本
@@ -737,7 +731,55 @@ async def create_embedding(text: str) -> List[float]:
         向量嵌入
     """
     service = await get_embedding_service()
-    return await service.generate_embedding(text)
+    if not settings.ENABLE_EMBEDDING_CACHE:
+        return await service.generate_embedding(text)
+
+    from app.services.embedding_cache_service import embedding_cache
+
+    key = _embedding_cache_keys(service, [text])[0]
+    cached = await embedding_cache.get_many([key])
+    if key in cached:
+        return cached[key]
+
+    embedding = await service.generate_embedding(text)
+    await embedding_cache.put_many({key: embedding})
+    return embedding
+
+
+async def create_embeddings_batch(texts: List[str]) -> List[List[float]]:
+    """
+    统一的批量 Embedding 生成接口（启用缓存时只对未命中的文本调用服务）
+
+    Args:
+        texts: 输入文本列表
+
+    Returns:
+        向量嵌入列表（与输入顺序一致）
+    """
+    if not texts:
+        return []
+    service = await get_embedding_service()
+    if not settings.ENABLE_EMBEDDING_CACHE:
+        return await service.generate_embeddings_batch(texts)
+
+    from app.services.embedding_cache_service import embedding_cache
+
+    keys = _embedding_cache_keys(service, texts)
+    embeddings = await embedding_cache.get_many(keys)
+
+    # 未命中的文本按缓存键去重后再请求
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in embeddings:
+            missing.setdefault(key, text)
+
+    if missing:
+        generated = await service.generate_embeddings_batch(list(missing.values()))
+        fresh = dict(zip(missing.keys(), generated))
+        await embedding_cache.put_many(fresh)
+        embeddings.update(fresh)
+
+    return [embeddings[key] for key in keys]
 
 
 # 全局 LiteLLM 服务实例
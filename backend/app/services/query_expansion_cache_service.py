@@ -0,0 +1,305 @@
+"""
+查询扩展缓存服务
+按 (归一化查询哈希, 提示词版本, 模型, 扩展数量) 缓存 LLM 生成的查询变体：
+进程内 LRU 作为一级缓存，PostgreSQL query_expansion_cache 表作为持久化二级缓存
+- 提示词版本取 query_expansion 提示词内容的哈希，配置中心切换版本或修改文件后自动使用新键
+- 激活版本变化时（非 A/B 测试）清除其他版本的条目
+- 条目超过 TTL 视为未命中，重新生成后覆盖
+- 启动时预热最近生成的条目到内存
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.services.embedding_cache_service import EmbeddingCache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 缓存键：(查询哈希, 提示词版本, 模型, 扩展数量)
+CacheKey = Tuple[str, str, str, int]
+
+PROMPT_NAME = "query_expansion"
+
+
+class QueryExpansionCache:
+    """两级查询扩展缓存"""
+
+    def __init__(self, max_memory_items: int = 5000, ttl_seconds: int = 604800, persist: bool = True):
+        self.max_memory_items = max_memory_items
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self._memory: "OrderedDict[CacheKey, Tuple[float, List[str]]]" = OrderedDict()
+        self._active_version: Optional[str] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "invalidated": 0,
+            "db_errors": 0
+        }
+
+    @staticmethod
+    def make_key(query: str, prompt_version: str, model: str, num_expansions: int) -> CacheKey:
+        """生成缓存键"""
+        normalized = EmbeddingCache.normalize_text(query)
+        query_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return (query_hash, prompt_version, model or "", num_expansions)
+
+    async def resolve_prompt(self) -> Tuple[str, str]:
+        """
+        解析当前生效的 query_expansion 提示词
+
+        激活版本（非 A/B 测试）变化时清除其他版本的缓存条目
+
+        Returns:
+            (提示词模板, 提示词版本)
+        """
+        from app.utils.prompt_loader import PromptLoader
+
+        resolution = await PromptLoader.get_prompt_async(PROMPT_NAME)
+        prompt_version = hashlib.sha256(resolution.content.encode("utf-8")).hexdigest()[:16]
+        if not resolution.is_ab_test:
+            await self.activate_version(prompt_version)
+        return resolution.content, prompt_version
+
+    async def get(self, key: CacheKey) -> Optional[List[str]]:
+        """
+        查询缓存（先查内存，再查数据库）
+
+        Returns:
+            查询变体列表（不含原始查询），未命中或已过期时返回 None
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, expansions = entry
+            if not self._expired(created_at):
+                self._memory.move_to_end(key)
+                self._count("memory_hits")
+                return list(expansions)
+            self._memory.pop(key, None)
+            self._count("expired")
+        elif self.persist:
+            found = await asyncio.to_thread(self._load_from_db, key)
+            if found is not None:
+                created_at, expansions = found
+                if not self._expired(created_at):
+                    self._remember(key, created_at, expansions)
+                    self._count("db_hits")
+                    return list(expansions)
+                self._count("expired")
+
+        self._count("misses")
+        return None
+
+    async def put(self, key: CacheKey, expansions: List[str]):
+        """写入缓存（内存 + 数据库，已存在的键覆盖）"""
+        self._remember(key, time.time(), list(expansions))
+        if self.persist:
+            await asyncio.to_thread(self._save_to_db, key, expansions)
+
+    async def activate_version(self, prompt_version: str):
+        """
+        记录当前激活的提示词版本，版本变化时清除其他版本的条目
+
+        进程内首次调用时同样清除数据库中其他版本的条目（进程重启期间版本可能已变化）
+        """
+        previous = self._active_version
+        if previous == prompt_version:
+            return
+        self._active_version = prompt_version
+
+        stale = [key for key in self._memory if key[1] != prompt_version]
+        for key in stale:
+            del self._memory[key]
+        removed = len(stale)
+        if self.persist:
+            removed = max(removed, await asyncio.to_thread(self._delete_other_versions, prompt_version))
+        self._count("invalidated", removed)
+        if removed:
+            logger.info(f"查询扩展提示词版本变化 {previous} -> {prompt_version}，清除 {removed} 条缓存")
+
+    async def warm_up(self, limit: int) -> int:
+        """
+        预热：加载当前提示词版本与模型下最近生成的未过期条目到内存
+
+        Args:
+            limit: 最多加载的条目数
+
+        Returns:
+            加载的条目数
+        """
+        if not self.persist or limit <= 0:
+            return 0
+
+        from app.services.llm_service import get_llm
+
+        _, prompt_version = await self.resolve_prompt()
+        model = getattr(await get_llm(), "model", "") or ""
+        rows = await asyncio.to_thread(self._load_recent, prompt_version, model, min(limit, self.max_memory_items))
+        # 按时间正序写入，最近的条目位于 LRU 末尾
+        for key, created_at, expansions in reversed(rows):
+            self._remember(key, created_at, expansions)
+        logger.info(f"查询扩展缓存预热: {len(rows)} 条")
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, float]:
+        """获取缓存命中统计"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["db_hits"]
+        total = hits + stats["misses"]
+        return {
+            **stats,
+            "hits": hits,
+            "requests": total,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_items": len(self._memory),
+            "max_memory_items": self.max_memory_items,
+            "active_prompt_version": self._active_version
+        }
+
+    def clear_memory(self):
+        """清空进程内缓存"""
+        self._memory.clear()
+
+    def _count(self, name: str, amount: int = 1):
+        """累加统计计数（事件循环与数据库读写线程都会调用）"""
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and created_at + self.ttl_seconds < time.time()
+
+    def _remember(self, key: CacheKey, created_at: float, expansions: List[str]):
+        """写入内存 LRU，超出容量时淘汰最久未使用的条目"""
+        self._memory[key] = (created_at, expansions)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _load_from_db(self, key: CacheKey) -> Optional[Tuple[float, List[str]]]:
+        """从数据库加载缓存（在线程中执行）"""
+        from app.core.database import SessionLocal
+        from app.models.knowledge import QueryExpansionCache as QueryExpansionCacheEntry
+
+        query_hash, prompt_version, model, num_expansions = key
+        db = SessionLocal()
+        try:
+            row = db.query(
+                QueryExpansionCacheEntry.created_at,
+                QueryExpansionCacheEntry.expansions
+            ).filter(
+                QueryExpansionCacheEntry.query_hash == query_hash,
+                QueryExpansionCacheEntry.prompt_version == prompt_version,
+                QueryExpansionCacheEntry.model == model,
+                QueryExpansionCacheEntry.num_expansions == num_expansions
+            ).first()
+            if row is None:
+                return None
+            return row.created_at.timestamp(), json.loads(row.expansions)
+        except Exception as e:
+            self._count("db_errors")
+            logger.warning(f"读取查询扩展缓存失败: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _load_recent(self, prompt_version: str, model: str, limit: int) -> List[Tuple[CacheKey, float, List[str]]]:
+        """读取最近生成的未过期条目（在线程中执行，按时间倒序）"""
+        from app.core.database import SessionLocal
+        from app.models.knowledge import QueryExpansionCache as QueryExpansionCacheEntry
+
+        db = SessionLocal()
+        try:
+            query = db.query(
+                QueryExpansionCacheEntry.query_hash,
+                QueryExpansionCacheEntry.num_expansions,
+                QueryExpansionCacheEntry.created_at,
+                QueryExpansionCacheEntry.expansions
+            ).filter(
+                QueryExpansionCacheEntry.prompt_version == prompt_version,
+                QueryExpansionCacheEntry.model == model
+            )
+            if self.ttl_seconds > 0:
+                query = query.filter(
+                    QueryExpansionCacheEntry.created_at >= datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+                )
+            rows = query.order_by(QueryExpansionCacheEntry.created_at.desc()).limit(limit).all()
+            return [
+                ((row.query_hash, prompt_version, model, row.num_expansions), row.created_at.timestamp(), json.loads(row.expansions))
+                for row in rows
+            ]
+        except Exception as e:
+            self._count("db_errors")
+            logger.warning(f"预热查询扩展缓存失败: {e}")
+            return []
+        finally:
+            db.close()
+
+    def _save_to_db(self, key: CacheKey, expansions: List[str]):
+        """写入数据库缓存（在线程中执行，已存在的键覆盖并刷新生成时间）"""
+        from sqlalchemy import func
+        from sqlalchemy.dialects.postgresql import insert
+        from app.core.database import SessionLocal
+        from app.models.knowledge import QueryExpansionCache as QueryExpansionCacheEntry
+
+        query_hash, prompt_version, model, num_expansions = key
+        statement = insert(QueryExpansionCacheEntry).values(
+            query_hash=query_hash,
+            prompt_version=prompt_version,
+            model=model,
+            num_expansions=num_expansions,
+            expansions=json.dumps(expansions, ensure_ascii=False)
+        )
+        statement = statement.on_conflict_do_update(
+            constraint="uq_query_expansion_cache_key",
+            set_={"expansions": statement.excluded.expansions, "created_at": func.now()}
+        )
+
+        db = SessionLocal()
+        try:
+            db.execute(statement)
+            db.commit()
+        except Exception as e:
+            self._count("db_errors")
+            logger.warning(f"写入查询扩展缓存失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _delete_other_versions(self, prompt_version: str) -> int:
+        """删除其他提示词版本的条目（在线程中执行）"""
+        from app.core.database import SessionLocal
+        from app.models.knowledge import QueryExpansionCache as QueryExpansionCacheEntry
+
+        db = SessionLocal()
+        try:
+            removed = db.query(QueryExpansionCacheEntry).filter(
+                QueryExpansionCacheEntry.prompt_version != prompt_version
+            ).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        except Exception as e:
+            self._count("db_errors")
+            logger.warning(f"清除查询扩展缓存失败: {e}")
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+
+
+# 全局查询扩展缓存实例
+query_expansion_cache = QueryExpansionCache(
+    max_memory_items=settings.QUERY_EXPANSION_CACHE_MEMORY_SIZE,
+    ttl_seconds=settings.QUERY_EXPANSION_CACHE_TTL_SECONDS,
+    persist=settings.QUERY_EXPANSION_CACHE_PERSIST
+)
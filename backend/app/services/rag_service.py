@@ -1,128 +1,424 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Awaitable, Tuple
+import asyncio
+import hashlib
+import logging
 import os
 import re
 from sqlalchemy.orm import Session
 from app.models.knowledge import KnowledgeDocument, VectorChunk
-from sqlalchemy import text
+from sqlalchemy import text, insert, update, delete, bindparam
+from pgvector.sqlalchemy import Vector
 import json
 from app.utils.prompt_loader import PromptLoader
+from app.utils import lexical, near_duplicate, text_chunker
+from app.services.keyword_index_service import keyword_index
+from app.services.vector_backend_service import vector_backend
+from app.services.search_cache_service import search_cache
+from app.services.query_expansion_cache_service import query_expansion_cache
+
+logger = logging.getLogger(__name__)
+
+# 分块文本：紧凑存储的分块（chunk_text 为空）按偏移从文档内容中截取
+CHUNK_TEXT_SQL = "COALESCE(vc.chunk_text, substr(kd.content, vc.start_offset + 1, vc.end_offset - vc.start_offset))"
+# 向量检索子查询返回的分块列（联表 knowledge_documents 后按 CHUNK_TEXT_SQL 取文本）
+CHUNK_COLUMNS_SQL = "vc.id, vc.document_id, vc.chunk_index, vc.chunk_text, vc.start_offset, vc.end_offset"
+
+# 迭代索引扫描（hnsw.iterative_scan / ivfflat.iterative_scan）需要的最低 pgvector 版本
+ITERATIVE_SCAN_MIN_VERSION = (0, 8, 0)
+# 数据库中 pgvector 扩展的版本（首次构建向量检索参数时读取）
+_pgvector_version: Optional[Tuple[int, ...]] = None
 
 
 class RAGService:
     """RAG 知识库服务"""
 
     @staticmethod
-    async def process_document(
+    async def ingest_document_content(
         document_id: int,
-        file_path: str,
+        segments: Iterable[str],
         db: Session,
-        chunk_strategy: str = "semantic"
-    ):
+        chunk_strategy: str = "semantic",
+        on_progress: Optional[Callable[[int, float], Awaitable[None]]] = None
+    ) -> int:
         """
-        处理知识库文档：切片、向量化、存储
+        对文档片段流式分段、向量化并存储（供入库队列使用）
+
+        片段由提取器逐页/逐段产出，边解析边分段，前面的分块向量化时后续页面仍在解析；
+        递归分段依赖全文，先完成提取再分段。重复执行是安全的：写入前会清除该文档已有的分块
 
         Args:
             document_id: 文档 ID
-            file_path: 文件路径
+            segments: 清理后的文档片段（同步迭代器，在线程池中推进；页面解析由提取器在进程池中完成），以空行拼接即为文档内容
             db: 数据库会话
             chunk_strategy: 分段策略（semantic, parent_child, recursive）
+            on_progress: 进度回调，参数为 (已写入分块数, 已写入部分占已解析内容的比例)
+
+        Returns:
+            写入的分块数量
+
+        Raises:
+            ValueError: 文档不存在或内容为空/过短（不可重试的错误）
         """
-        import os
+        doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == document_id).first()
+        if not doc:
+            raise ValueError("文档不存在")
 
-        try:
-            # 1. 读取文档内容
-            print(f"[RAG] 开始处理文档: {file_path}")
-            print(f"[RAG] 使用分段策略: {chunk_strategy}")
-
-            # 根据文件类型选择不同的处理方法
-            file_ext = os.path.splitext(file_path)[1].lower()
-
-            if file_ext == '.pdf':
-                # 使用 pypdf 处理 PDF
-                from pypdf import PdfReader
-                reader = PdfReader(file_path)
-                text_content = ""
-                for page in reader.pages:
-                    text_content += page.extract_text() + "\n\n"
-            elif file_ext in ['.docx', '.doc']:
-                # 使用 python-docx 处理 Word 文档
-                from docx import Document
-                doc = Document(file_path)
-                text_content = "\n\n".join([para.text for para in doc.paragraphs if para.text.strip()])
+        doc.status = "processing"
+        doc.chunk_strategy = chunk_strategy
+        db.commit()
+        RAGService._hide_processing_document(doc)
+
+        content_parts: List[str] = []
+        # 各片段在文档内容中的起始偏移（用于记录分块偏移）
+        bases: Dict[str, int] = {}
+        content_length = 0
+        # 已切分分块在文档内容中的结束偏移（用于估算进度）
+        chunk_ends: List[int] = []
+        reported_ratio = 0.0
+
+        def _iter_segments() -> Iterator[str]:
+            nonlocal content_length
+            for segment in segments:
+                if not segment:
+                    continue
+                if content_parts:
+                    content_length += 2
+                bases.setdefault(segment, content_length)
+                content_parts.append(segment)
+                content_length += len(segment)
+                yield segment
+
+        def _iter_chunk_infos() -> Iterator[Dict[str, Any]]:
+            if chunk_strategy == "recursive":
+                for _ in _iter_segments():
+                    pass
+                chunk_infos = RAGService._iter_chunks("\n\n".join(content_parts), chunk_strategy)
             else:
-                # 其他文本文件直接读取
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
+                paragraphs = (
+                    span for segment in _iter_segments() for span in text_chunker.iter_paragraph_spans(segment)
+                )
+                chunk_infos = RAGService._iter_paragraph_chunks(paragraphs, chunk_strategy, bases)
+
+            for chunk_info in chunk_infos:
+                offsets = chunk_info.get("offsets")
+                # 拼接生成的分块没有偏移，按上一块结束位置加本块长度估算
+                previous_end = chunk_ends[-1] if chunk_ends else 0
+                chunk_ends.append(offsets[1] if offsets else previous_end + len(chunk_info["text"]))
+                yield chunk_info
+
+        async def _report(stored: int):
+            nonlocal reported_ratio
+            if on_progress and stored:
+                # 解析尚未完成时以已解析内容为分母，比例只增不减
+                ratio = chunk_ends[min(stored, len(chunk_ends)) - 1] / max(content_length, 1)
+                reported_ratio = max(reported_ratio, min(ratio, 1.0))
+                await on_progress(stored, reported_ratio)
+
+        # 清除上次未完成的写入，与新分块在同一事务中提交
+        heir_document_ids = RAGService.release_duplicate_chunks(db, document_id=document_id)
+        db.execute(update(VectorChunk).where(VectorChunk.document_id == document_id).values(parent_chunk_id=None))
+        db.execute(delete(VectorChunk).where(VectorChunk.document_id == document_id))
+
+        chunk_count = await RAGService._store_chunk_stream(
+            document_id,
+            RAGService._aiter_in_thread(_iter_chunk_infos()),
+            db,
+            on_progress=_report
+        )
+
+        text_content = "\n\n".join(content_parts)
+        content_parts.clear()
+        if len(text_content.strip()) < 10:
+            # 未提交的分块由调用方回滚
+            raise ValueError("文档内容为空或过短")
+
+        doc.content = text_content
+        doc.status = "completed"
+        doc.chunk_count = chunk_count
+        doc.error_message = None
+        db.commit()
+        keyword_index.refresh_document(db, document_id)
+        vector_backend.refresh_document(db, document_id)
+        RAGService.refresh_heir_documents(db, heir_document_ids)
+
+        logger.info(f"文档入库完成: 文档 {document_id}, {len(text_content)} 字符，{chunk_count} 个文本块")
+        return chunk_count
+
+    @staticmethod
+    def _hide_processing_document(doc: KnowledgeDocument):
+        """
+        处理中的文档不可检索：从进程内索引中移出（与数据库检索按文档状态过滤一致），
+        其分块代表的近似重复组由其他文档中的重复分块返回，处理完成后由 refresh_document 重新加入
+
+        Args:
+            doc: 文档
+        """
+        keyword_index.remove_document(doc.id, doc.user_id)
+        vector_backend.remove_document(doc.id, doc.user_id)
+
+    @staticmethod
+    def _build_chunks(
+        text_content: str,
+        chunk_strategy: str = "semantic"
+    ) -> List[Dict[str, Any]]:
+        """
+        按分段策略切分文本，统一返回分块信息
+
+        Args:
+            text_content: 清理后的文档内容
+            chunk_strategy: 分段策略（semantic, parent_child, recursive）
+
+        Returns:
+            分块信息列表，字段同 parent_child_chunk_text 的返回值，另含 offsets（分块在文档内容中的偏移，
+            分块为拼接生成的文本时为 None）；非父子分段时 is_parent 为 False、parent_index 为 None
+        """
+        return list(RAGService._iter_chunks(text_content, chunk_strategy))
 
-            # 清理文本
-            text_content = RAGService.clean_text(text_content)
+    @staticmethod
+    def _iter_chunks(
+        text_content: str,
+        chunk_strategy: str = "semantic"
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式分段，逐块输出与 _build_chunks 一致的分块信息（递归分段依赖全文，先完成切分再逐块输出）
+
+        Args:
+            text_content: 清理后的文档内容
+            chunk_strategy: 分段策略（semantic, parent_child, recursive）
+
+        Yields:
+            分块信息字典
+        """
+        from config import settings
+
+        bases = {text_content: 0}
+
+        if chunk_strategy == "recursive":
+            spans = text_chunker.recursive_spans(
+                text_content,
+                chunk_size=settings.CHUNK_SIZE,
+                overlap=settings.CHUNK_OVERLAP
+            )
+            yield from RAGService._span_chunk_infos(spans, bases)
+            return
+
+        yield from RAGService._iter_paragraph_chunks(
+            text_chunker.iter_paragraph_spans(text_content), chunk_strategy, bases
+        )
+
+    @staticmethod
+    def _iter_paragraph_chunks(
+        paragraphs: Iterable[text_chunker.Span],
+        chunk_strategy: str,
+        bases: Dict[str, int]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        按段落流式分段（semantic / parent_child），段落可来自多个页面的文本
+
+        Args:
+            paragraphs: 段落片段迭代器
+            chunk_strategy: 分段策略
+            bases: 各页文本在文档内容中的起始偏移，用于计算分块偏移
+
+        Yields:
+            分块信息字典
+        """
+        from config import settings
+
+        if chunk_strategy == "parent_child":
+            # 父子分段策略，父块大小为子块的2倍
+            parent_chunks = text_chunker.iter_semantic_chunks(paragraphs, settings.CHUNK_SIZE * 2)
+            yield from RAGService._iter_parent_child_chunks(
+                parent_chunks, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP, bases
+            )
+            return
+
+        # 默认语义分段策略
+        chunks = text_chunker.iter_adjusted_chunks(
+            text_chunker.iter_semantic_chunks(paragraphs, settings.CHUNK_SIZE),
+            settings.CHUNK_SIZE
+        )
+        yield from RAGService._span_chunk_infos((chunk.as_span() for chunk in chunks), bases)
+
+    @staticmethod
+    def _span_chunk_infos(spans: Iterable[text_chunker.Span], bases: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+        """将分块片段转换为分块信息（非父子分段）"""
+        for idx, (src, start, end) in enumerate(spans):
+            yield {
+                "text": src[start:end],
+                "parent_text": None,
+                "is_parent": False,
+                "parent_index": None,
+                "chunk_index": idx,
+                "offsets": text_chunker.content_offsets((src, start, end), bases)
+            }
+
+    @staticmethod
+    async def _aiter_in_thread(iterator: Iterator):
+        """
+        在线程池中逐项推进同步迭代器（分段为 CPU 密集操作，读取进程池回传的页面会阻塞，避免阻塞事件循环）
 
-            if not text_content or len(text_content.strip()) < 10:
-                print(f"[RAG] 文档内容为空或过短: {file_path}")
+        Args:
+            iterator: 同步迭代器
+
+        Yields:
+            迭代器的每一项
+        """
+        sentinel = object()
+        while True:
+            item = await asyncio.to_thread(next, iterator, sentinel)
+            if item is sentinel:
                 return
+            yield item
 
-            # 保存原始内容到数据库
-            from app.models.knowledge import KnowledgeDocument
-            doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == document_id).first()
-            if doc:
-                doc.content = text_content
-                doc.status = "processing"
-                doc.chunk_strategy = chunk_strategy
-                db.commit()
+    @staticmethod
+    async def rechunk_document(
+        document_id: int,
+        chunk_strategy: str,
+        db: Session,
+        on_progress: Optional[Callable[[int, float], Awaitable[None]]] = None
+    ) -> Dict[str, int]:
+        """
+        增量重新分段：复用已存储的文档内容，按内容哈希对比新旧分块，
+        仅对新增分块向量化并插入，未变化的分块保留原有向量
 
-            print(f"[RAG] 文档内容长度: {len(text_content)} 字符")
+        Args:
+            document_id: 文档 ID
+            chunk_strategy: 新的分段策略
+            db: 数据库会话
+            on_progress: 进度回调，参数为 (已向量化的新增分块数, 向量化完成比例)
 
-            # 2. 根据策略选择分段方法
-            from config import settings
+        Returns:
+            统计信息 {"reused": 复用数, "inserted": 新增数, "deleted": 删除数}
+        """
+        doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == document_id).first()
+        if not doc:
+            raise ValueError("文档不存在")
+
+        # 没有已存储的内容时（旧数据），通过统一提取器（带缓存）重新提取后完整入库
+        if not doc.content:
+            from app.services.document_text_service import document_text_extractor
+            deleted = db.query(VectorChunk).filter(VectorChunk.document_id == document_id).count()
+            inserted = await RAGService.ingest_document_content(
+                document_id,
+                document_text_extractor.iter_clean_segments(doc.file_path),
+                db,
+                chunk_strategy=chunk_strategy,
+                on_progress=on_progress
+            )
+            return {"reused": 0, "inserted": inserted, "deleted": deleted}
 
-            if chunk_strategy == "parent_child":
-                # 父子分段策略
-                chunks_info = RAGService.parent_child_chunk_text(
-                    text_content,
-                    parent_size=settings.CHUNK_SIZE * 2,  # 父块大小为子块的2倍
-                    child_size=settings.CHUNK_SIZE,
-                    overlap=settings.CHUNK_OVERLAP
-                )
-                print(f"[RAG] 父子分段: {len(chunks_info)} 个文本块（包含父块和子块）")
-                await RAGService.store_parent_child_chunks(document_id, chunks_info, db)
-                chunk_count = len(chunks_info)
-
-            elif chunk_strategy == "recursive":
-                # 递归分段策略
-                chunks = RAGService.recursive_chunk_text(
-                    text_content,
-                    chunk_size=settings.CHUNK_SIZE,
-                    overlap=settings.CHUNK_OVERLAP
-                )
-                print(f"[RAG] 递归分段: {len(chunks)} 个文本块")
-                await RAGService.store_chunks(document_id, chunks, db)
-                chunk_count = len(chunks)
+        try:
+            doc.status = "processing"
+            doc.chunk_strategy = chunk_strategy
+            db.commit()
+            RAGService._hide_processing_document(doc)
 
-            else:
-                # 默认语义分段策略
-                chunks = RAGService.chunk_text(
-                    text_content,
-                    chunk_size=settings.CHUNK_SIZE,
-                    overlap=settings.CHUNK_OVERLAP
-                )
-                print(f"[RAG] 语义分段: {len(chunks)} 个文本块")
-                await RAGService.store_chunks(document_id, chunks, db)
-                chunk_count = len(chunks)
+            chunks_info = RAGService._build_chunks(doc.content, chunk_strategy)
 
-            # 3. 更新文档状态
-            if doc:
-                doc.status = "completed"
-                doc.chunk_count = chunk_count
-                db.commit()
+            # 1. 按内容哈希索引现有分块（同一文本可能出现多次），记录是否有向量（自身存储或复用近似重复分块）
+            existing_ids: Dict[str, List[Tuple[int, bool]]] = {}
+            for chunk_id, chunk_text, has_vector in db.query(
+                VectorChunk.id,
+                VectorChunk.content,
+                (VectorChunk.embedding.isnot(None)) | (VectorChunk.duplicate_of_id.isnot(None))
+            ).filter(
+                VectorChunk.document_id == document_id
+            ).order_by(VectorChunk.chunk_index).all():
+                existing_ids.setdefault(RAGService._content_hash(chunk_text), []).append((chunk_id, bool(has_vector)))
+
+            # 2. 匹配新分块：命中则复用，否则待插入（需要向量的分块不复用未向量化的父块）
+            chunk_ids: List[Optional[int]] = []
+            new_positions: List[int] = []
+            for pos, info in enumerate(chunks_info):
+                candidates = existing_ids.get(RAGService._content_hash(info["text"]), [])
+                needs_vector = RAGService._needs_embedding(info)
+                match = next((i for i, (_, has_vector) in enumerate(candidates) if has_vector or not needs_vector), None)
+                if match is not None:
+                    chunk_ids.append(candidates.pop(match)[0])
+                else:
+                    chunk_ids.append(None)
+                    new_positions.append(pos)
+            stale_ids = [chunk_id for ids in existing_ids.values() for chunk_id, _ in ids]
+            heir_document_ids: List[int] = []
+
+            # 3. 解除父子关联后删除不再使用的分块
+            db.execute(
+                update(VectorChunk)
+                .where(VectorChunk.document_id == document_id)
+                .values(parent_chunk_id=None)
+            )
+            if stale_ids:
+                heir_document_ids = RAGService.release_duplicate_chunks(db, chunk_ids=stale_ids)
+                db.execute(delete(VectorChunk).where(VectorChunk.id.in_(stale_ids)))
+
+            # 4. 只对新增分块向量化（近似重复分块复用已有向量），并一次性插入取回 ID
+            if new_positions:
+                duplicate_index = RAGService._load_duplicate_index(document_id, db)
+                if duplicate_index is not None:
+                    RAGService._link_near_duplicates([chunks_info[pos] for pos in new_positions], duplicate_index)
+                embed_positions = [pos for pos in new_positions if RAGService._needs_embedding(chunks_info[pos])]
+                embed_texts = [chunks_info[pos]["text"] for pos in embed_positions]
+                embeddings: List[Optional[List[float]]] = [None] * len(embed_texts)
+                embedded = 0
+                async for start, batch_embeddings in RAGService._iter_embedding_batches(embed_texts):
+                    embeddings[start:start + len(batch_embeddings)] = batch_embeddings
+                    embedded += len(batch_embeddings)
+                    if on_progress:
+                        await on_progress(embedded, embedded / len(embed_texts))
+                embedding_by_pos = dict(zip(embed_positions, embeddings))
+                new_ids = db.execute(
+                    insert(VectorChunk).returning(VectorChunk.id, sort_by_parameter_order=True),
+                    [
+                        RAGService._chunk_row(document_id, chunks_info[pos], embedding_by_pos.get(pos))
+                        for pos in new_positions
+                    ]
+                ).scalars().all()
+                for pos, chunk_id in zip(new_positions, new_ids):
+                    chunk_ids[pos] = chunk_id
+
+            # 5. 批量更新复用分块的序号、父块标记及所有子块的父块 ID
+            parent_chunk_ids = {
+                info["parent_index"]: chunk_id
+                for info, chunk_id in zip(chunks_info, chunk_ids)
+                if info["is_parent"]
+            }
+            new_set = set(new_positions)
+            updates = []
+            for pos, (info, chunk_id) in enumerate(zip(chunks_info, chunk_ids)):
+                parent_id = None
+                if not info["is_parent"] and info["parent_index"] is not None:
+                    parent_id = parent_chunk_ids.get(info["parent_index"])
+                if pos in new_set and parent_id is None:
+                    continue
+                updates.append({
+                    "id": chunk_id,
+                    "chunk_index": info["chunk_index"],
+                    "is_parent": info["is_parent"],
+                    "parent_chunk_id": parent_id
+                })
+            if updates:
+                db.execute(update(VectorChunk), updates)
 
-            print(f"[RAG] 文档处理完成: {file_path}")
+            doc.status = "completed"
+            doc.chunk_count = len(chunks_info)
+            doc.error_message = None
+            db.commit()
+            keyword_index.refresh_document(db, document_id)
+            vector_backend.refresh_document(db, document_id)
+            RAGService.refresh_heir_documents(db, [i for i in heir_document_ids if i != document_id])
+
+            stats = {
+                "reused": len(chunks_info) - len(new_positions),
+                "inserted": len(new_positions),
+                "deleted": len(stale_ids)
+            }
+            logger.info(f"增量重新分段完成: 文档 {document_id}, {stats}")
+            return stats
 
         except Exception as e:
-            print(f"[RAG] 文档处理失败: {e}")
-            import traceback
-            traceback.print_exc()
-
-            # 更新文档状态为失败
+            logger.exception(f"增量重新分段失败: {e}")
+            db.rollback()
             try:
                 doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == document_id).first()
                 if doc:
@@ -131,9 +427,13 @@ class RAGService:
                     db.commit()
             except:
                 pass
-
             raise
 
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        """计算分块内容哈希"""
+        return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
     @staticmethod
     def clean_text(text: str) -> str:
         """
@@ -145,14 +445,8 @@ class RAGService:
         Returns:
             清理后的文本
         """
-        # 移除多余的空白字符
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-        text = re.sub(r'[ \t]+', ' ', text)
-
-        # 移除特殊字符
-        text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', text)
-
-        return text.strip()
+        from app.utils.document_extractor import clean_text
+        return clean_text(text)
 
     @staticmethod
     def chunk_text(
@@ -171,70 +465,12 @@ class RAGService:
         Returns:
             文本块列表
         """
-        chunks = []
-        paragraphs = text.split('\n\n')
-
-        current_chunk = ""
-        current_size = 0
-
-        for para in paragraphs:
-            para = para.strip()
-            if not para:
-                continue
-
-            para_size = len(para)
-
-            # 检测语义边界
-            is_new_topic = RAGService._detect_semantic_boundary(para, current_chunk)
-
-            # 如果单个段落超过 chunk_size，需要进一步分割
-            if para_size > chunk_size:
-                # 先保存当前 chunk
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                    current_chunk = ""
-                    current_size = 0
-
-                # 按句子分割大段落
-                sentences = re.split(r'([。！？!?；;])', para)
-                sentences = [''.join(pair) for pair in zip(sentences[::2], sentences[1::2])]
-
-                for sentence in sentences:
-                    sentence = sentence.strip()
-                    if not sentence:
-                        continue
-
-                    if current_size + len(sentence) > chunk_size:
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        current_chunk = sentence
-                        current_size = len(sentence)
-                    else:
-                        current_chunk += sentence if not current_chunk else " " + sentence
-                        current_size += len(sentence)
-
-            # 如果检测到新主题或当前 chunk 加上新段落超过大小
-            elif is_new_topic or current_size + para_size > chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = para
-                current_size = para_size
-            else:
-                current_chunk += para if not current_chunk else "\n\n" + para
-                current_size += para_size
-
-        # 添加最后一个 chunk
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-
-        # 如果没有切分出任何 chunk，使用简单切分
-        if not chunks:
-            chunks = RAGService.simple_chunk_text(text, chunk_size, overlap)
-
-        # 动态调整块大小，确保每个块都在合理范围内
-        chunks = RAGService._adjust_chunk_sizes(chunks, chunk_size)
-
-        return chunks
+        # 语义分块（没有切分出任何 chunk 时使用简单切分），再动态调整块大小
+        chunks = text_chunker.iter_adjusted_chunks(
+            text_chunker.iter_semantic_or_window_chunks(text, chunk_size, overlap),
+            chunk_size
+        )
+        return [chunk.text() for chunk in chunks]
 
     @staticmethod
     def _detect_semantic_boundary(
@@ -251,31 +487,10 @@ class RAGService:
         Returns:
             是否为新主题
         """
-        if not previous_chunk:
-            return False
-
-        # 检测主题转换关键词
-        transition_keywords = [
-            '另外', '此外', '再者', '接下来', '然后', '此外',
-            '另一方面', '同时', '与此同时', '另外一方面',
-            '此外还有', '不仅如此', '更重要的是',
-            '首先', '其次', '再次', '最后',
-            '第一', '第二', '第三', '第四',
-            '总之', '综上所述', '因此', '所以',
-            '然而', '但是', '不过', '相反',
-            '例如', '比如', '举例来说'
-        ]
-
-        # 检查段落开头是否包含主题转换词
-        for keyword in transition_keywords:
-            if current_para.startswith(keyword):
-                return True
-
-        # 检查段落长度差异（如果新段落很短，可能是新主题）
-        if len(previous_chunk) > 300 and len(current_para) < 100:
-            return True
-
-        return False
+        return text_chunker.is_semantic_boundary(
+            (current_para, 0, len(current_para)),
+            len(previous_chunk)
+        )
 
     @staticmethod
     def _adjust_chunk_sizes(
@@ -292,25 +507,11 @@ class RAGService:
         Returns:
             调整后的文本块列表
         """
-        adjusted_chunks = []
-
-        for chunk in chunks:
-            # 如果块太大，进一步分割
-            if len(chunk) > target_size * 1.5:
-                sub_chunks = RAGService.simple_chunk_text(chunk, target_size, 0)
-                adjusted_chunks.extend(sub_chunks)
-            # 如果块太小，尝试合并
-            elif len(chunk) < target_size * 0.3 and adjusted_chunks:
-                # 合并到前一个块
-                last_chunk = adjusted_chunks[-1]
-                if len(last_chunk) + len(chunk) < target_size * 1.2:
-                    adjusted_chunks[-1] = last_chunk + "\n\n" + chunk
-                else:
-                    adjusted_chunks.append(chunk)
-            else:
-                adjusted_chunks.append(chunk)
-
-        return adjusted_chunks
+        adjusted = text_chunker.iter_adjusted_chunks(
+            (text_chunker.Chunk.from_text(chunk) for chunk in chunks),
+            target_size
+        )
+        return [chunk.text() for chunk in adjusted]
 
     @staticmethod
     def simple_chunk_text(
@@ -373,101 +574,63 @@ class RAGService:
                     "parent_text": "父块文本",
                     "is_parent": False,
                     "parent_index": 0,
-                    "chunk_index": 0
+                    "chunk_index": 0,
+                    "offsets": (0, 300)  # 分块在 text 中的偏移，拼接生成的分块为 None
                 },
                 ...
             ]
         """
-        chunks = []
-        paragraphs = text.split('\n\n')
-
-        # 1. 先生成父块（按段落优先）
-        parent_chunks = []
-        current_parent = ""
-        current_size = 0
-
-        for para in paragraphs:
-            para = para.strip()
-            if not para:
-                continue
-
-            para_size = len(para)
-
-            # 检测语义边界
-            is_new_topic = RAGService._detect_semantic_boundary(para, current_parent)
-
-            # 如果单个段落超过 parent_size，需要进一步分割
-            if para_size > parent_size:
-                # 先保存当前父块
-                if current_parent:
-                    parent_chunks.append(current_parent.strip())
-                    current_parent = ""
-                    current_size = 0
-
-                # 按句子分割大段落
-                sentences = re.split(r'([。！？!?；;])', para)
-                sentences = [''.join(pair) for pair in zip(sentences[::2], sentences[1::2])]
-
-                for sentence in sentences:
-                    sentence = sentence.strip()
-                    if not sentence:
-                        continue
-
-                    if current_size + len(sentence) > parent_size:
-                        if current_parent:
-                            parent_chunks.append(current_parent.strip())
-                        current_parent = sentence
-                        current_size = len(sentence)
-                    else:
-                        current_parent += sentence if not current_parent else " " + sentence
-                        current_size += len(sentence)
-
-            # 如果检测到新主题或当前父块加新段落超过大小
-            elif is_new_topic or current_size + para_size > parent_size:
-                if current_parent:
-                    parent_chunks.append(current_parent.strip())
-                current_parent = para
-                current_size = para_size
-            else:
-                current_parent += para if not current_parent else "\n\n" + para
-                current_size += para_size
+        parent_chunks = text_chunker.iter_semantic_or_window_chunks(text, parent_size, overlap)
+        return list(RAGService._iter_parent_child_chunks(parent_chunks, child_size, overlap, {text: 0}))
 
-        # 添加最后一个父块
-        if current_parent:
-            parent_chunks.append(current_parent.strip())
+    @staticmethod
+    def _iter_parent_child_chunks(
+        parent_chunks: Iterable[text_chunker.Chunk],
+        child_size: int,
+        overlap: int,
+        bases: Optional[Dict[str, int]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        依次输出每个父块及其子块
 
-        # 如果没有切分出任何父块，使用简单切分
-        if not parent_chunks:
-            parent_chunks = RAGService.simple_chunk_text(text, parent_size, overlap)
+        Args:
+            parent_chunks: 父块迭代器
+            child_size: 子块大小
+            overlap: 重叠大小
+            bases: 源文本在文档内容中的起始偏移，用于计算分块偏移（不需要偏移时为 None）
 
-        # 2. 为每个父块生成子块
+        Yields:
+            分块信息字典（字段同 parent_child_chunk_text，另含 offsets）
+        """
         chunk_index = 0
-        for parent_idx, parent_text in enumerate(parent_chunks):
-            # 先添加父块本身（可选，用于直接检索）
-            chunks.append({
+        for parent_idx, parent_chunk in enumerate(parent_chunks):
+            # 单片段父块直接引用原文，拼接生成的父块只生成一次文本
+            parent_span = parent_chunk.as_span()
+            parent_text = parent_span[0][parent_span[1]:parent_span[2]]
+
+            # 先输出父块本身（可选，用于直接检索）
+            yield {
                 "text": parent_text,
                 "parent_text": parent_text,
                 "is_parent": True,
                 "parent_index": parent_idx,
-                "chunk_index": chunk_index
-            })
+                "chunk_index": chunk_index,
+                "offsets": text_chunker.content_offsets(parent_span, bases)
+            }
             chunk_index += 1
 
-            # 将父块分割成子块
-            child_chunks = RAGService.simple_chunk_text(parent_text, child_size, overlap)
-
-            for child_text in child_chunks:
-                chunks.append({
-                    "text": child_text,
+            # 子块直接在父块片段上按偏移切分
+            for child_span in text_chunker.iter_window_spans(parent_span, child_size, overlap):
+                yield {
+                    "text": child_span[0][child_span[1]:child_span[2]],
                     "parent_text": parent_text,
                     "is_parent": False,
                     "parent_index": parent_idx,
-                    "chunk_index": chunk_index
-                })
+                    "chunk_index": chunk_index,
+                    "offsets": text_chunker.content_offsets(child_span, bases)
+                }
                 chunk_index += 1
 
-        return chunks
-
     @staticmethod
     def recursive_chunk_text(
         text: str,
@@ -492,73 +655,8 @@ class RAGService:
         Returns:
             文本块列表
         """
-        if separators is None:
-            # 默认分隔符优先级：段落 > 句子 > 空格 > 字符
-            separators = ['\n\n', '\n', '。', '！', '？', '；', ';', ' ', '']
-
-        chunks = []
-
-        def _recursive_split(text_to_split, separators_list, depth=0):
-            """递归分割函数"""
-            if not text_to_split:
-                return []
-
-            # 如果文本长度小于等于 chunk_size，直接返回
-            if len(text_to_split) <= chunk_size:
-                return [text_to_split.strip()]
-
-            # 如果没有更多分隔符，使用字符分割
-            if not separators_list:
-                return RAGService.simple_chunk_text(text_to_split, chunk_size, overlap)
-
-            # 尝试使用当前分隔符分割
-            separator = separators_list[0]
-            parts = text_to_split.split(separator)
-
-            # 如果分割后只有一个部分，使用下一个分隔符
-            if len(parts) <= 1:
-                return _recursive_split(text_to_split, separators_list[1:], depth + 1)
-
-            # 构建文本块
-            current_chunk = ""
-            result = []
-
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-
-                # 如果当前块加上新部分超过大小
-                if len(current_chunk) + len(part) + len(separator) > chunk_size:
-                    if current_chunk:
-                        result.append(current_chunk.strip())
-                    current_chunk = part
-                else:
-                    current_chunk += part if not current_chunk else separator + part
-
-            # 添加最后一个块
-            if current_chunk:
-                result.append(current_chunk.strip())
-
-            # 检查是否有块仍然过大，递归处理
-            final_result = []
-            for chunk in result:
-                if len(chunk) > chunk_size * 1.5:
-                    # 块太大，递归分割
-                    sub_chunks = _recursive_split(chunk, separators_list[1:], depth + 1)
-                    final_result.extend(sub_chunks)
-                else:
-                    final_result.append(chunk)
-
-            return final_result
-
-        chunks = _recursive_split(text, separators)
-
-        # 如果没有切分出任何 chunk，使用简单切分
-        if not chunks:
-            chunks = RAGService.simple_chunk_text(text, chunk_size, overlap)
-
-        return chunks
+        spans = text_chunker.recursive_spans(text, chunk_size, overlap, separators)
+        return [src[start:end] for src, start, end in spans]
 
     @staticmethod
     async def expand_query(
@@ -577,12 +675,25 @@ class RAGService:
         """
         try:
             from app.services.llm_service import get_llm
+            from config import settings
 
             llm = await get_llm()
 
-            # 加载提示词模板
-            prompt = PromptLoader.format_prompt(
-                'query_expansion',
+            # 加载提示词模板（启用缓存时从配置中心解析，按提示词版本查询缓存）
+            cache_key = None
+            if settings.ENABLE_QUERY_EXPANSION_CACHE:
+                template, prompt_version = await query_expansion_cache.resolve_prompt()
+                cache_key = query_expansion_cache.make_key(
+                    query, prompt_version, getattr(llm, "model", ""), num_expansions
+                )
+                cached = await query_expansion_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"查询扩展命中缓存: {len(cached) + 1} 个查询变体")
+                    return [query] + [q for q in cached if q != query]
+            else:
+                template = PromptLoader.get_prompt('query_expansion')
+            prompt = PromptLoader.render(
+                template,
                 num_expansions=num_expansions,
                 query=query
             )
@@ -599,14 +710,15 @@ class RAGService:
                 if cleaned and cleaned not in expanded_queries:
                     expanded_queries.append(cleaned)
 
-            print(f"[RAG] 查询扩展: {len(expanded_queries)} 个查询变体")
-            for i, q in enumerate(expanded_queries):
-                print(f"  {i+1}. {q}")
+            logger.info(f"查询扩展: {len(expanded_queries)} 个查询变体: " + " | ".join(expanded_queries))
+
+            if cache_key is not None and len(expanded_queries) > 1:
+                await query_expansion_cache.put(cache_key, expanded_queries[1:])
 
             return expanded_queries
 
         except Exception as e:
-            print(f"[RAG] 查询扩展失败: {e}")
+            logger.warning(f"查询扩展失败: {e}")
             # 失败时返回原始查询
             return [query]
 
@@ -618,11 +730,23 @@ class RAGService:
         use_query_expansion: bool = True,
         use_hybrid_search: bool = True,
         use_reranking: bool = True,
-        db: Session = None
+        db: Session = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None,
+        latency_budget_ms: Optional[int] = None,
+        stage_report: Optional[Dict[str, Any]] = None,
+        use_adaptive: Optional[bool] = None
     ) -> List[Dict[str, Any]]:
         """
         搜索知识库（支持查询扩展、混合检索、重排序）
 
+        自适应模式下先用原始查询做一次向量检索，首轮结果置信度足够时跳过查询扩展与重排序
+        （见 _adaptive_decision）
+        开启 PARENT_CONTEXT_RETRIEVAL 时只检索子块，取 top_k × PARENT_CONTEXT_CANDIDATE_FACTOR 个子块候选，
+        替换为父块上下文并按父块去重后返回 top_k 个上下文（见 expand_parent_context）
+
         Args:
             query: 查询文本
             user_id: 用户 ID
@@ -630,370 +754,1098 @@ class RAGService:
             use_query_expansion: 是否使用查询扩展
             use_hybrid_search: 是否使用混合检索
             use_reranking: 是否使用重排序
-            db: 数据库会话（AsyncSession）
+            db: 数据库会话
+            ef_search: HNSW 查询候选列表大小（默认使用 HNSW_EF_SEARCH）
+            probes: IVFFlat 查询扫描的聚类数量（默认使用 IVFFLAT_PROBES）
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+            latency_budget_ms: 延迟预算（毫秒），给出时使用流水线检索（见 _search_knowledge_pipeline）
+            stage_report: 各阶段执行情况的输出字典（可选）
+            use_adaptive: 是否按首轮检索置信度跳过查询扩展与重排序（默认使用 ENABLE_ADAPTIVE_RETRIEVAL）
 
         Returns:
             搜索结果列表
         """
-        try:
-            # 1. 查询扩展（可选）
-            queries = [query]
-            if use_query_expansion:
-                queries = await RAGService.expand_query(query, num_expansions=3)
+        from config import settings
+
+        report = stage_report if stage_report is not None else {}
+        if use_adaptive is None:
+            use_adaptive = settings.ENABLE_ADAPTIVE_RETRIEVAL
+
+        # 检索结果缓存（版本在检索开始前读取，检索期间进程内索引更新时不写入）
+        cache_key = None
+        if settings.ENABLE_SEARCH_CACHE:
+            cache_key = search_cache.make_key(
+                user_id, query, top_k,
+                use_query_expansion=use_query_expansion,
+                use_hybrid_search=use_hybrid_search,
+                use_reranking=use_reranking,
+                use_adaptive=use_adaptive,
+                ef_search=ef_search,
+                probes=probes,
+                document_ids=document_ids or (),
+                category=category or ""
+            )
+            cache_version = search_cache.version(db, user_id)
+            cached = search_cache.get(cache_key, cache_version)
+            if cached is not None:
+                report["cache"] = "hit"
+                return cached
+            report["cache"] = "miss"
+
+        # 父子分段：多个子块可能属于同一父块，多取子块候选，按父块去重后再截取 top_k
+        fetch_k = top_k
+        if settings.PARENT_CONTEXT_RETRIEVAL:
+            fetch_k = top_k * max(settings.PARENT_CONTEXT_CANDIDATE_FACTOR, 1)
+
+        if latency_budget_ms:
+            results = await RAGService._search_knowledge_pipeline(
+                query, user_id, fetch_k, use_query_expansion, use_hybrid_search, use_reranking, db,
+                latency_budget_ms, ef_search=ef_search, probes=probes,
+                document_ids=document_ids, category=category, stage_report=report,
+                use_adaptive=use_adaptive
+            )
+        else:
+            results = await RAGService._search_knowledge_serial(
+                query, user_id, fetch_k, use_query_expansion, use_hybrid_search, use_reranking, db,
+                ef_search=ef_search, probes=probes, document_ids=document_ids, category=category,
+                report=report, use_adaptive=use_adaptive
+            )
 
-            # 2. 混合检索（向量 + 关键词）
-            all_results = []
-            if use_hybrid_search:
-                # 向量检索
-                vector_results = await RAGService._vector_search_multiple(queries, user_id, top_k * 2, db)
-                all_results.extend(vector_results)
+        # 父子分段：命中的子块批量替换为父块上下文
+        if settings.PARENT_CONTEXT_RETRIEVAL:
+            results = RAGService.expand_parent_context(results, db, report)[:top_k]
 
-                # 关键词检索
-                keyword_results = await RAGService._keyword_search(query, user_id, top_k * 2, db)
-                all_results.extend(keyword_results)
+        # 空结果与有阶段超时/失败的结果不缓存
+        degraded = any(
+            stage.get("status") in ("timeout", "failed") for stage in report.get("stages", {}).values()
+        )
+        if cache_key is not None and results and not degraded:
+            search_cache.put(cache_key, cache_version, results)
+        return results
 
-                # 合并并去重
-                all_results = RAGService._merge_results(all_results)
-            else:
-                # 仅向量检索
-                from app.services.llm_service import create_embedding
-                query_embedding = await create_embedding(query)
-                all_results = await RAGService.vector_search(
-                    query_embedding=query_embedding,
-                    user_id=user_id,
-                    top_k=top_k * 2,
-                    db=db
+    @staticmethod
+    async def _search_knowledge_serial(
+        query: str,
+        user_id: int,
+        top_k: int,
+        use_query_expansion: bool,
+        use_hybrid_search: bool,
+        use_reranking: bool,
+        db: Session,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None,
+        report: Optional[Dict[str, Any]] = None,
+        use_adaptive: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        按顺序执行各阶段的检索：首轮检索 -> 查询扩展（可选）-> 重排序（可选）
+
+        混合检索时向量与关键词在一条 SQL 中召回并融合（见 hybrid_search）；自适应模式下
+        首轮只用原始查询检索，需要查询扩展时再用原始查询与扩展查询的向量重新融合检索一次
+
+        参数含义同 search_knowledge，report 为各阶段执行情况的输出字典
+        """
+        from config import settings
+
+        report = report if report is not None else {}
+        report["mode"] = "serial"
+        if use_adaptive is None:
+            use_adaptive = settings.ENABLE_ADAPTIVE_RETRIEVAL
+        search_options = {
+            "ef_search": ef_search, "probes": probes,
+            "document_ids": document_ids, "category": category
+        }
+
+        try:
+            from app.services.llm_service import create_embedding, create_embeddings_batch
+
+            query_embedding = await create_embedding(query)
+            query_embeddings = [query_embedding]
+            use_expansion = use_query_expansion and use_hybrid_search  # 查询扩展只在混合检索时使用
+
+            # 1. 首轮检索（自适应模式）并按首轮结果的置信度决定是否需要查询扩展与重排序
+            all_results = None
+            if use_adaptive:
+                if use_hybrid_search:
+                    all_results = await RAGService.hybrid_search(
+                        query, query_embeddings, user_id, top_k=top_k * 2, db=db, **search_options
+                    )
+                    vector_results = RAGService._vector_ranking(all_results)
+                else:
+                    all_results = vector_results = await RAGService.vector_search(
+                        query_embedding, user_id, top_k=top_k * 2, db=db, **search_options
+                    )
+                need_expansion, need_rerank = RAGService._adaptive_decision(
+                    query, vector_results, use_expansion, use_reranking, use_adaptive, report
                 )
+            else:
+                need_expansion, need_rerank = use_expansion, use_reranking
+
+            # 2. 查询扩展：扩展查询的向量与原始查询一起参与融合
+            if need_expansion:
+                queries = await RAGService.expand_query(query, num_expansions=settings.QUERY_EXPANSION_COUNT)
+                if len(queries) > 1:
+                    try:
+                        query_embeddings = query_embeddings + await create_embeddings_batch(queries[1:])
+                        all_results = None
+                    except Exception as e:
+                        logger.warning(f"扩展查询向量生成失败: {e}")
+
+            # 3. 检索（混合检索：各路候选在一条 SQL 中按排名融合）
+            if all_results is None:
+                if use_hybrid_search:
+                    all_results = await RAGService.hybrid_search(
+                        query, query_embeddings, user_id, top_k=top_k * 2, db=db, **search_options
+                    )
+                else:
+                    all_results = await RAGService.vector_search(
+                        query_embedding, user_id, top_k=top_k * 2, db=db, **search_options
+                    )
 
-            # 3. 重排序（可选）
-            if use_reranking and len(all_results) > top_k:
-                all_results = await RAGService._rerank_results(query, all_results, top_k)
+            # 4. 重排序（可选）
+            if need_rerank and len(all_results) > top_k:
+                all_results = await RAGService._rerank_results(query, all_results, top_k, db)
             else:
                 # 截取 top_k
                 all_results = all_results[:top_k]
 
-            # 4. 返回搜索结果
+            # 5. 返回搜索结果
             return all_results
 
         except Exception as e:
-            print(f"[RAG] 知识库搜索失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"知识库搜索失败: {e}")
             return []
 
     @staticmethod
-    async def store_chunks(
-        document_id: int,
-        chunks: List[str],
-        db: Session
-    ):
+    async def _search_knowledge_pipeline(
+        query: str,
+        user_id: int,
+        top_k: int,
+        use_query_expansion: bool,
+        use_hybrid_search: bool,
+        use_reranking: bool,
+        db: Session,
+        latency_budget_ms: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None,
+        stage_report: Optional[Dict[str, Any]] = None,
+        use_adaptive: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
         """
-        存储文本块到数据库
+        流水线检索：在延迟预算内完成检索
+
+        - 原始查询的首轮检索（混合检索时为 hybrid_search，与串行检索相同）与查询扩展同时开始
+        - 自适应模式下首轮检索置信度足够时取消查询扩展、跳过重排序
+        - 扩展查询生成向量后，与原始查询向量一起再做一次 hybrid_search；在 QUERY_EXPANSION_DEADLINE_MS 内完成时
+          替换首轮结果，否则取消并返回首轮结果。融合只由 hybrid_search 完成，同一查询与串行检索的排序一致
+        - 剩余预算低于 RERANK_MIN_BUDGET_MS 时跳过重排序，重排序超出预算时按原始分数返回
+        - 各阶段在事件循环中共用 db（同步调用之间不会交错），在线程中执行的部分使用独立会话（见 _search_vector_backend）
+        各阶段的状态（completed / failed / timeout / skipped）与完成时间写入 stage_report
 
         Args:
-            document_id: 文档 ID
-            chunks: 文本块列表
+            query: 查询文本
+            user_id: 用户 ID
+            top_k: 返回结果数量
+            use_query_expansion: 是否使用查询扩展
+            use_hybrid_search: 是否使用混合检索（查询扩展只在混合检索时使用）
+            use_reranking: 是否使用重排序
             db: 数据库会话
+            latency_budget_ms: 延迟预算（毫秒）
+            ef_search: HNSW 查询候选列表大小
+            probes: IVFFlat 查询扫描的聚类数量
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+            stage_report: 各阶段执行情况的输出字典（可选）
+            use_adaptive: 是否按首轮检索置信度跳过查询扩展与重排序
+
+        Returns:
+            搜索结果列表
         """
-        from app.services.llm_service import create_embedding
+        import time
+        from config import settings
+
+        started = time.perf_counter()
+        deadline = started + latency_budget_ms / 1000
+        report = stage_report if stage_report is not None else {}
+        report.update({"mode": "pipeline", "budget_ms": latency_budget_ms, "stages": {}})
+        stages = report["stages"]
+        search_options = {
+            "ef_search": ef_search, "probes": probes,
+            "document_ids": document_ids, "category": category
+        }
+
+        def _elapsed_ms() -> float:
+            return round((time.perf_counter() - started) * 1000, 1)
+
+        def _remaining() -> float:
+            return max(0.0, deadline - time.perf_counter())
+
+        async def _run_stage(name: str, coro: Awaitable[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+            try:
+                results = await coro
+                stages[name] = {"status": "completed", "elapsed_ms": _elapsed_ms(), "results": len(results)}
+                return results
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"检索阶段 {name} 失败: {e}")
+                stages[name] = {"status": "failed", "elapsed_ms": _elapsed_ms(), "error": str(e)}
+                return []
 
-        for idx, chunk_text in enumerate(chunks):
-            # 创建向量嵌入
-            embedding = await create_embedding(chunk_text)
+        from app.services.llm_service import create_embedding, create_embeddings_batch
 
-            # 存储到数据库
-            vector_chunk = VectorChunk(
-                document_id=document_id,
-                chunk_text=chunk_text,
-                embedding=embedding,
-                chunk_index=idx
-            )
-            db.add(vector_chunk)
+        # 原始查询向量由首轮检索与扩展检索共用（shield：任一方取消时不取消向量生成）
+        embedding_task = asyncio.create_task(create_embedding(query))
 
-        db.commit()
+        async def _base_search() -> List[Dict[str, Any]]:
+            query_embedding = await asyncio.shield(embedding_task)
+            if use_hybrid_search:
+                return await RAGService.hybrid_search(
+                    query, [query_embedding], user_id, top_k=top_k * 2, db=db, **search_options
+                )
+            return await RAGService.vector_search(query_embedding, user_id, top_k=top_k * 2, db=db, **search_options)
 
-    @staticmethod
-    async def store_parent_child_chunks(
-        document_id: int,
-        chunks_info: List[Dict[str, Any]],
-        db: Session
-    ):
-        """
-        存储父子分块到数据库
+        async def _expanded_search() -> List[Dict[str, Any]]:
+            queries = await RAGService.expand_query(query, num_expansions=settings.QUERY_EXPANSION_COUNT)
+            stages["expansion"] = {"status": "completed", "elapsed_ms": _elapsed_ms(), "queries": len(queries) - 1}
+            if len(queries) <= 1:
+                return []
+            expanded_embeddings = await create_embeddings_batch(queries[1:])
+            query_embeddings = [await asyncio.shield(embedding_task)] + expanded_embeddings
+            return await RAGService.hybrid_search(
+                query, query_embeddings, user_id, top_k=top_k * 2, db=db, **search_options
+            )
 
-        Args:
-            document_id: 文档 ID
-            chunks_info: 包含父块和子块信息的字典列表
-            db: 数据库会话
-        """
-        from app.services.llm_service import create_embedding
+        async def _wait(tasks: Dict[str, asyncio.Task], timeout: float) -> Dict[str, List[Dict[str, Any]]]:
+            """等待各阶段完成，超时的阶段取消并记录"""
+            if not tasks:
+                return {}
+            await asyncio.wait(tasks.values(), timeout=timeout)
+            results = {}
+            for name, task in tasks.items():
+                if task.done():
+                    results[name] = task.result()
+                else:
+                    task.cancel()
+                    stages[name] = {"status": "timeout", "elapsed_ms": _elapsed_ms()}
+            return results
 
-        # 用于跟踪父块 ID
-        parent_chunk_ids = {}
+        expansion_tasks: Dict[str, asyncio.Task] = {}
+        if use_query_expansion and use_hybrid_search:
+            expansion_tasks["expanded_hybrid"] = asyncio.create_task(
+                _run_stage("expanded_hybrid", _expanded_search())
+            )
+        else:
+            stages["expansion"] = {"status": "skipped"}
 
-        for chunk_info in chunks_info:
-            chunk_text = chunk_info["text"]
-            chunk_index = chunk_info["chunk_index"]
-            parent_index = chunk_info["parent_index"]
-            is_parent = chunk_info["is_parent"]
+        base_stage = "hybrid" if use_hybrid_search else "vector"
+        base_tasks = {base_stage: asyncio.create_task(_run_stage(base_stage, _base_search()))}
 
-            # 创建向量嵌入
-            embedding = await create_embedding(chunk_text)
+        try:
+            base_results = (await _wait(base_tasks, _remaining())).get(base_stage, [])
+            all_results = base_results
 
-            # 存储到数据库
-            vector_chunk = VectorChunk(
-                document_id=document_id,
-                chunk_text=chunk_text,
-                embedding=embedding,
-                chunk_index=chunk_index
+            vector_results = RAGService._vector_ranking(base_results) if use_hybrid_search else base_results
+            need_expansion, need_rerank = RAGService._adaptive_decision(
+                query, vector_results, bool(expansion_tasks), use_reranking, use_adaptive, report
             )
+            if expansion_tasks and not need_expansion:
+                expansion_tasks.pop("expanded_hybrid").cancel()
+                stages["expansion"] = {"status": "skipped", "reason": "confident", "elapsed_ms": _elapsed_ms()}
+
+            expansion_timeout = min(_remaining(), max(0.0, started + settings.QUERY_EXPANSION_DEADLINE_MS / 1000 - time.perf_counter()))
+            expanded_results = (await _wait(expansion_tasks, expansion_timeout)).get("expanded_hybrid")
+            # 扩展检索已包含原始查询的各路结果，完成时替换首轮结果
+            if expanded_results:
+                all_results = expanded_results
+        finally:
+            for task in [embedding_task] + list(base_tasks.values()) + list(expansion_tasks.values()):
+                task.cancel()
+
+        # 重排序（首轮置信度足够或剩余预算不足时跳过）
+        if not use_reranking or len(all_results) <= top_k:
+            stages["rerank"] = {"status": "skipped"}
+            all_results = all_results[:top_k]
+        elif not need_rerank:
+            stages["rerank"] = {"status": "skipped", "reason": "confident"}
+            all_results = all_results[:top_k]
+        elif _remaining() * 1000 < settings.RERANK_MIN_BUDGET_MS:
+            stages["rerank"] = {"status": "skipped", "reason": "budget", "elapsed_ms": _elapsed_ms()}
+            all_results = all_results[:top_k]
+        else:
+            try:
+                all_results = await asyncio.wait_for(
+                    RAGService._rerank_results(query, all_results, top_k, db), timeout=_remaining()
+                )
+                stages["rerank"] = {"status": "completed", "elapsed_ms": _elapsed_ms()}
+            except asyncio.TimeoutError:
+                stages["rerank"] = {"status": "timeout", "elapsed_ms": _elapsed_ms()}
+                all_results = all_results[:top_k]
 
-            db.add(vector_chunk)
-            db.flush()  # 获取 ID
-
-            # 如果是父块，记录其 ID
-            if is_parent:
-                parent_chunk_ids[parent_index] = vector_chunk.id
-            else:
-                # 如果是子块，设置父块 ID
-                if parent_index in parent_chunk_ids:
-                    vector_chunk.parent_chunk_id = parent_chunk_ids[parent_index]
-                    db.flush()
-
-        db.commit()
+        report["total_ms"] = _elapsed_ms()
+        logger.info(f"流水线检索完成: {report['total_ms']}ms / 预算 {latency_budget_ms}ms, " + ", ".join(
+            f"{name}={stage['status']}" for name, stage in stages.items()
+        ))
+        return all_results
 
     @staticmethod
-    async def _vector_search_multiple(
-        queries: List[str],
-        user_id: int,
-        top_k: int,
-        db: Session
+    def expand_parent_context(
+        results: List[Dict[str, Any]],
+        db: Session,
+        report: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """
-        对多个查询进行向量检索并合并结果
+        父子分段的上下文扩展：命中的子块替换为父块文本
+
+        一次查询取回全部命中子块的父块；共享同一父块的子块只保留排名最前的一个，
+        返回的上下文中不会出现重复的父块文本。没有父块的分块原样返回
 
         Args:
-            queries: 查询列表
-            user_id: 用户 ID
-            top_k: 返回结果数量
-            db: 数据库会话（AsyncSession）
+            results: 检索结果（按分数降序）
+            db: 数据库会话
+            report: 扩展情况的输出字典（可选，写入 parent_context 字段）
 
         Returns:
-            搜索结果列表
+            扩展后的结果列表（子块结果的 content 为父块文本，child_content 为命中的子块文本，parent_id 为父块 ID）
         """
-        from app.services.llm_service import create_embedding
+        if db is None or not results:
+            return results
 
-        all_results = []
+        try:
+            rows = db.execute(
+                text(f"""
+                    SELECT c.id, vc.id, {CHUNK_TEXT_SQL}
+                    FROM vector_chunks c
+                    JOIN vector_chunks vc ON vc.id = c.parent_chunk_id
+                    JOIN knowledge_documents kd ON vc.document_id = kd.id
+                    WHERE c.id = ANY(:chunk_ids)
+                """),
+                {"chunk_ids": [result['id'] for result in results]}
+            ).fetchall()
+        except Exception as e:
+            logger.warning(f"读取父块失败: {e}")
+            return results
 
-        for query in queries:
-            try:
-                query_embedding = await create_embedding(query)
-                results = await RAGService.vector_search(
-                    query_embedding=query_embedding,
-                    user_id=user_id,
-                    top_k=top_k,
-                    db=db
-                )
-                all_results.extend(results)
-            except Exception as e:
-                print(f"[RAG] 向量检索失败: {query} - {e}")
+        if not rows:
+            return results
+
+        parents = {row[0]: (row[1], row[2]) for row in rows}
+        expanded = []
+        seen = set()
+        for result in results:
+            parent = parents.get(result['id'])
+            context_id = parent[0] if parent else result['id']
+            if context_id in seen:
                 continue
+            seen.add(context_id)
+            if parent:
+                expanded.append({
+                    **result,
+                    'content': parent[1],
+                    'child_content': result['content'],
+                    'parent_id': parent[0]
+                })
+            else:
+                expanded.append(result)
 
-        return all_results
+        stats = {"children": len(parents), "parents": len({parent[0] for parent in parents.values()})}
+        if report is not None:
+            report["parent_context"] = stats
+        logger.info(f"父块上下文: {stats['children']} 个子块 -> {stats['parents']} 个父块，返回 {len(expanded)} 条结果")
+        return expanded
 
     @staticmethod
-    async def _keyword_search(
-        query: str,
-        user_id: int,
-        top_k: int,
-        db: Session
-    ) -> List[Dict[str, Any]]:
+    def _first_pass_signals(query: str, vector_results: List[Dict[str, Any]]) -> Dict[str, float]:
         """
-        关键词检索（使用全文搜索）
+        首轮向量检索的置信度信号
+
+        - top_score: 首条结果的相似度
+        - margin: 首条与第二条结果的相似度差（只有一条结果时等于 top_score）
+        - overlap: 查询词位在首条结果中出现的比例
 
         Args:
             query: 查询文本
-            user_id: 用户 ID
-            top_k: 返回结果数量
-            db: 数据库会话（AsyncSession）
+            vector_results: 原始查询的向量检索结果（按相似度降序）
 
         Returns:
-            搜索结果列表
+            置信度信号
         """
-        if db is None:
-            return []
+        if not vector_results:
+            return {"top_score": 0.0, "margin": 0.0, "overlap": 0.0}
+
+        top_score = vector_results[0]["score"]
+        margin = top_score - vector_results[1]["score"] if len(vector_results) > 1 else top_score
+        terms = lexical.query_terms(query)
+        overlap = 0.0
+        if terms:
+            tokens = set(lexical.tokenize(vector_results[0].get("content") or ""))
+            overlap = sum(1 for term in terms if term in tokens) / len(terms)
+        return {"top_score": round(top_score, 4), "margin": round(margin, 4), "overlap": round(overlap, 4)}
+
+    @staticmethod
+    def _adaptive_decision(
+        query: str,
+        vector_results: List[Dict[str, Any]],
+        use_query_expansion: bool,
+        use_reranking: bool,
+        use_adaptive: Optional[bool] = None,
+        report: Optional[Dict[str, Any]] = None,
+        thresholds: Optional[Dict[str, float]] = None
+    ) -> Tuple[bool, bool]:
+        """
+        根据首轮检索结果决定是否需要查询扩展与重排序
+
+        - 首条结果相似度不低于 ADAPTIVE_MIN_TOP_SCORE 且查询词位覆盖率不低于 ADAPTIVE_MIN_LEXICAL_OVERLAP
+          时认为首轮已命中，跳过查询扩展
+        - 首轮已命中且首条领先第二条不少于 ADAPTIVE_MIN_SCORE_MARGIN 时排序已经明确，跳过重排序
+
+        Args:
+            query: 查询文本
+            vector_results: 原始查询的向量检索结果
+            use_query_expansion: 调用方是否要求查询扩展
+            use_reranking: 调用方是否要求重排序
+            use_adaptive: 是否启用自适应（默认使用 ENABLE_ADAPTIVE_RETRIEVAL）
+            report: 判断依据的输出字典（可选，写入 adaptive 字段）
+            thresholds: 覆盖默认阈值（min_top_score / min_score_margin / min_lexical_overlap，用于阈值评估）
+
+        Returns:
+            (是否需要查询扩展, 是否需要重排序)
+        """
+        from config import settings
+
+        if use_adaptive is None:
+            use_adaptive = settings.ENABLE_ADAPTIVE_RETRIEVAL
+        if not use_adaptive or not (use_query_expansion or use_reranking):
+            return use_query_expansion, use_reranking
+
+        thresholds = thresholds or {}
+        min_top_score = thresholds.get("min_top_score", settings.ADAPTIVE_MIN_TOP_SCORE)
+        min_margin = thresholds.get("min_score_margin", settings.ADAPTIVE_MIN_SCORE_MARGIN)
+        min_overlap = thresholds.get("min_lexical_overlap", settings.ADAPTIVE_MIN_LEXICAL_OVERLAP)
+
+        signals = RAGService._first_pass_signals(query, vector_results)
+        confident = signals["top_score"] >= min_top_score and signals["overlap"] >= min_overlap
+        need_expansion = use_query_expansion and not confident
+        need_rerank = use_reranking and not (confident and signals["margin"] >= min_margin)
+
+        if report is not None:
+            report["adaptive"] = {
+                **signals,
+                "expansion": need_expansion if use_query_expansion else None,
+                "rerank": need_rerank if use_reranking else None
+            }
+            logger.info(
+                f"自适应检索: 相似度 {signals['top_score']}, 领先 {signals['margin']}, "
+                f"词位覆盖 {signals['overlap']} -> 查询扩展 {'是' if need_expansion else '否'}, "
+                f"重排序 {'是' if need_rerank else '否'}"
+            )
+        return need_expansion, need_rerank
 
+    @staticmethod
+    async def _iter_embedding_batches(texts: List[str]):
+        """
+        分批并发生成向量嵌入，按完成顺序逐批返回
+
+        批次大小与并发数由 EMBEDDING_BATCH_SIZE / EMBEDDING_CONCURRENCY 控制
+
+        Args:
+            texts: 文本列表
+
+        Yields:
+            (批次起始下标, 该批次的向量列表)
+        """
+        from app.services.llm_service import create_embeddings_batch
+        from config import settings
+
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        semaphore = asyncio.Semaphore(max(1, settings.EMBEDDING_CONCURRENCY))
+
+        async def _embed_batch(start: int):
+            async with semaphore:
+                embeddings = await create_embeddings_batch(texts[start:start + batch_size])
+            return start, embeddings
+
+        tasks = [
+            asyncio.create_task(_embed_batch(start))
+            for start in range(0, len(texts), batch_size)
+        ]
         try:
-            # 提取关键词
-            keywords = RAGService._extract_keywords(query)
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # 任一批次失败时取消剩余批次
+            for task in tasks:
+                task.cancel()
 
-            if not keywords:
-                return []
+    @staticmethod
+    def _load_duplicate_index(
+        document_id: int,
+        db: Session
+    ) -> Optional["near_duplicate.SimHashIndex[int]"]:
+        """
+        加载近似重复检测索引：同一用户其他文档中带签名且存储了向量的分块
 
-            # 构建全文搜索查询
-            keyword_pattern = '|'.join(keywords)
+        Args:
+            document_id: 正在入库的文档 ID（排除自身，其分块即将被替换）
+            db: 数据库会话
 
-            sql = f"""
-                SELECT
-                    vc.id,
-                    vc.chunk_text,
-                    vc.chunk_index,
-                    kd.file_name,
-                    kd.id as document_id,
-                    0.5 as similarity
+        Returns:
+            SimHash 索引（键为分块 ID），未启用检测时返回 None
+        """
+        from config import settings
+
+        if not settings.ENABLE_NEAR_DUPLICATE_DETECTION:
+            return None
+
+        index = near_duplicate.SimHashIndex(settings.NEAR_DUPLICATE_MAX_DISTANCE)
+        rows = db.execute(
+            text("""
+                SELECT vc.id, vc.simhash
                 FROM vector_chunks vc
-                JOIN knowledge_documents kd ON vc.document_id = kd.id
-                WHERE kd.user_id = {user_id}
-                  AND kd.status = 'completed'
-                  AND vc.chunk_text ~* '{keyword_pattern}'
-                LIMIT {top_k}
-            """
+                WHERE vc.document_id IN (
+                      SELECT kd.id
+                      FROM knowledge_documents kd
+                      WHERE kd.user_id = (SELECT user_id FROM knowledge_documents WHERE id = :document_id)
+                        AND kd.id != :document_id
+                        AND kd.status = 'completed'
+                  )
+                  AND vc.simhash IS NOT NULL
+                  AND vc.duplicate_of_id IS NULL
+                  AND vc.embedding IS NOT NULL
+            """),
+            {"document_id": document_id}
+        ).fetchall()
+        for chunk_id, signature in rows:
+            index.add(near_duplicate.from_signed64(signature), chunk_id)
+        return index
 
-            result = db.execute(text(sql))
-            result = result.fetchall()
+    @staticmethod
+    def _link_near_duplicates(
+        chunks_info: List[Dict[str, Any]],
+        index: "near_duplicate.SimHashIndex[int]"
+    ) -> int:
+        """
+        计算分块签名并查找近似重复的已有分块（CPU 密集，可在线程中执行）
 
-            # 计算关键词匹配分数
-            results = []
-            for row in result:
-                chunk_text = row[1]
-                match_count = sum(1 for kw in keywords if kw.lower() in chunk_text.lower())
-                score = 0.5 + (match_count / len(keywords)) * 0.5
+        结果写回分块信息：simhash 为签名，duplicate_of 为近似重复的已有分块 ID
 
-                results.append({
-                    "id": row[0],
-                    "content": row[1],
-                    "chunk_index": row[2],
-                    "source": row[3],
-                    "document_id": row[4],
-                    "score": score
-                })
+        Args:
+            chunks_info: 分块信息列表
+            index: SimHash 索引
 
-            return results
+        Returns:
+            近似重复的分块数量
+        """
+        from config import settings
+
+        linked = 0
+        for info in chunks_info:
+            # 过短的分块、不向量化的父块不参与近似重复检测
+            if len(info["text"]) < settings.NEAR_DUPLICATE_MIN_LENGTH or not RAGService._needs_embedding(info):
+                info["simhash"] = None
+                info["duplicate_of"] = None
+                continue
+            signature = near_duplicate.simhash(info["text"])
+            info["simhash"] = signature
+            info["duplicate_of"] = index.find(signature)
+            if info["duplicate_of"] is not None:
+                linked += 1
+        return linked
 
-        except Exception as e:
-            print(f"[RAG] 关键词检索失败: {e}")
+    @staticmethod
+    def release_duplicate_chunks(
+        db: Session,
+        document_id: Optional[int] = None,
+        chunk_ids: Optional[List[int]] = None
+    ) -> List[int]:
+        """
+        删除分块前解除近似重复关联：被其他文档分块引用的分块即将删除时，
+        将其向量转移给第一个引用它的分块，其余引用改为指向该分块
+
+        返回的文档的分块组发生了变化，调用方提交事务后需调用 refresh_heir_documents 刷新进程内索引
+
+        Args:
+            db: 数据库会话（调用方负责提交事务）
+            document_id: 即将删除该文档的全部分块
+            chunk_ids: 即将删除的分块 ID 列表
+
+        Returns:
+            分块被更新的文档 ID 列表
+        """
+        if document_id is not None:
+            condition, params = "document_id = :document_id", {"document_id": document_id}
+        elif chunk_ids:
+            condition, params = "id = ANY(:chunk_ids)", {"chunk_ids": list(chunk_ids)}
+        else:
             return []
 
+        result = db.execute(
+            text(f"""
+                WITH doomed AS (
+                    SELECT id, embedding FROM vector_chunks WHERE {condition}
+                ),
+                heirs AS (
+                    SELECT DISTINCT ON (d.duplicate_of_id) d.duplicate_of_id AS old_id, d.id AS new_id
+                    FROM vector_chunks d
+                    WHERE d.duplicate_of_id IN (SELECT id FROM doomed)
+                      AND d.id NOT IN (SELECT id FROM doomed)
+                    ORDER BY d.duplicate_of_id, d.id
+                )
+                UPDATE vector_chunks vc
+                SET duplicate_of_id = CASE WHEN vc.id = heirs.new_id THEN NULL ELSE heirs.new_id END,
+                    embedding = CASE WHEN vc.id = heirs.new_id THEN doomed.embedding ELSE vc.embedding END
+                FROM heirs
+                JOIN doomed ON doomed.id = heirs.old_id
+                WHERE vc.duplicate_of_id = heirs.old_id
+                  AND vc.id NOT IN (SELECT id FROM doomed)
+                RETURNING vc.document_id
+            """),
+            params
+        )
+        return sorted({row[0] for row in result})
+
     @staticmethod
-    def _extract_keywords(text: str) -> List[str]:
+    def refresh_heir_documents(db: Session, document_ids: Iterable[int]):
         """
-        从文本中提取关键词
+        release_duplicate_chunks 提交后刷新接管向量的文档在进程内索引中的分块
+        （组 ID 已变化，numpy 向量后端中重复分块的向量取自已删除的代表分块）
 
         Args:
-            text: 输入文本
+            db: 数据库会话
+            document_ids: release_duplicate_chunks 返回的文档 ID
+        """
+        for document_id in document_ids:
+            keyword_index.refresh_document(db, document_id)
+            vector_backend.refresh_document(db, document_id)
+
+    @staticmethod
+    def _needs_embedding(info: Dict[str, Any]) -> bool:
+        """
+        分块是否需要向量化：近似重复分块复用已有向量；未开启 EMBED_PARENT_CHUNKS 时父块只存文本，
+        不参与向量检索，检索后作为命中子块的上下文返回（见 expand_parent_context）
+        """
+        from config import settings
+
+        if info.get("duplicate_of") is not None:
+            return False
+        return settings.EMBED_PARENT_CHUNKS or not info.get("is_parent")
+
+    @staticmethod
+    def _chunk_row(document_id: int, info: Dict[str, Any], embedding: List[float]) -> Dict[str, Any]:
+        """
+        构造分块写入行
+
+        已知偏移的分块总是记录偏移；启用紧凑存储时不再重复存储文本，读取时从文档内容截取。
+        近似重复分块（info["duplicate_of"]）不存储向量，检索时由其关联的分块代表；
+        未开启 EMBED_PARENT_CHUNKS 时父块同样不存储向量
+
+        Args:
+            document_id: 文档 ID
+            info: 分块信息
+            embedding: 分块向量（近似重复分块与不向量化的父块为 None）
 
         Returns:
-            关键词列表
+            vector_chunks 写入行
+        """
+        from config import settings
+
+        offsets = info.get("offsets")
+        start_offset, end_offset = offsets if offsets else (None, None)
+        compact = offsets is not None and settings.ENABLE_COMPACT_CHUNK_STORAGE
+        signature = info.get("simhash")
+        tokens = lexical.tokenize(info["text"])
+        return {
+            "document_id": document_id,
+            "chunk_text": None if compact else info["text"],
+            "start_offset": start_offset,
+            "end_offset": end_offset,
+            "embedding": embedding,
+            "chunk_index": info["chunk_index"],
+            "is_parent": bool(info.get("is_parent")),
+            "simhash": near_duplicate.to_signed64(signature) if signature is not None else None,
+            "duplicate_of_id": info.get("duplicate_of"),
+            "search_vector": lexical.to_tsvector_text(tokens) if tokens else None,
+            "search_length": len(tokens)
+        }
+
+    @staticmethod
+    async def _store_chunk_stream(
+        document_id: int,
+        chunk_stream,
+        db: Session,
+        on_progress: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> int:
         """
-        # 移除停用词
-        stopwords = {'的', '了', '是', '在', '我', '有', '和', '就', '不', '人', '都', '一', '一个',
-                     '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好',
-                     '自己', '这', '那', '什么', '怎么', '如何', '为什么', '吗', '呢', '啊', '吧'}
+        向量化入库流水线：边接收分块边按批次并发向量化，按提交顺序逐批写入
 
-        # 简单分词（按空格和标点）
-        words = re.findall(r'[\w\u4e00-\u9fff]+', text)
+        在途批次数不超过 2 * EMBEDDING_CONCURRENCY，内存占用与文档大小无关；
+        父块总是先于其子块产出，因此按顺序写入时子块的父块 ID 已就绪。
+        调用方负责提交事务。
 
-        # 过滤停用词和短词
-        keywords = [
-            word for word in words
-            if len(word) > 1 and word not in stopwords
-        ]
+        Args:
+            document_id: 文档 ID
+            chunk_stream: 分块信息异步迭代器（字段同 parent_child_chunk_text）
+            db: 数据库会话
+            on_progress: 每批写入后的回调，参数为已写入的分块数量
+
+        Returns:
+            写入的分块数量
+        """
+        from collections import deque
+        from app.services.llm_service import create_embeddings_batch
+        from config import settings
+
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        concurrency = max(1, settings.EMBEDDING_CONCURRENCY)
+        semaphore = asyncio.Semaphore(concurrency)
+        pending = deque()
+        parent_chunk_ids: Dict[int, int] = {}
+        stored = 0
+        linked = 0
+        duplicate_index = RAGService._load_duplicate_index(document_id, db)
+
+        async def _embed_batch(batch: List[Dict[str, Any]]):
+            nonlocal linked
+            # 与已有分块近似重复的分块复用其向量，不再调用 Embedding 服务
+            if duplicate_index is not None:
+                batch_linked = await asyncio.to_thread(RAGService._link_near_duplicates, batch, duplicate_index)
+                linked += batch_linked
+            texts = [info["text"] for info in batch if RAGService._needs_embedding(info)]
+            embeddings = []
+            if texts:
+                async with semaphore:
+                    embeddings = await create_embeddings_batch(texts)
+            embedding_iter = iter(embeddings)
+            return batch, [
+                next(embedding_iter) if RAGService._needs_embedding(info) else None
+                for info in batch
+            ]
+
+        def _write_batch(batch: List[Dict[str, Any]], embeddings: List[List[float]]):
+            parent_rows, parent_indexes, child_rows = [], [], []
+            for info, embedding in zip(batch, embeddings):
+                row = RAGService._chunk_row(document_id, info, embedding)
+                if info.get("is_parent"):
+                    parent_rows.append(row)
+                    parent_indexes.append(info["parent_index"])
+                else:
+                    child_rows.append((row, info.get("parent_index")))
+
+            # 父块一次性插入，按参数顺序取回 ID
+            if parent_rows:
+                parent_ids = db.execute(
+                    insert(VectorChunk).returning(VectorChunk.id, sort_by_parameter_order=True),
+                    parent_rows
+                ).scalars().all()
+                parent_chunk_ids.update(zip(parent_indexes, parent_ids))
+
+            # 子块的父块可能位于本批或之前的批次
+            if child_rows:
+                for row, parent_index in child_rows:
+                    row["parent_chunk_id"] = parent_chunk_ids.get(parent_index)
+                db.execute(insert(VectorChunk), [row for row, _ in child_rows])
+
+            return len(batch)
+
+        async def _flush_head():
+            nonlocal stored
+            stored += _write_batch(*await pending.popleft())
+            if on_progress:
+                await on_progress(stored)
+
+        try:
+            batch: List[Dict[str, Any]] = []
+            async for chunk_info in chunk_stream:
+                batch.append(chunk_info)
+                if len(batch) < batch_size:
+                    continue
+
+                pending.append(asyncio.create_task(_embed_batch(batch)))
+                batch = []
 
-        return keywords
+                # 写入已完成的队首批次；在途批次过多时等待队首完成（背压）
+                while pending and (pending[0].done() or len(pending) >= concurrency * 2):
+                    await _flush_head()
+
+            if batch:
+                pending.append(asyncio.create_task(_embed_batch(batch)))
+
+            while pending:
+                await _flush_head()
+
+        finally:
+            # 出错时取消尚未完成的批次
+            for task in pending:
+                task.cancel()
+
+        if linked:
+            logger.info(f"近似重复分块: 文档 {document_id} 有 {linked} 个分块复用已有向量")
+        return stored
+
+    @staticmethod
+    def _bm25_params(terms: List[str], limit: int) -> Dict[str, Any]:
+        """_bm25_ctes 的绑定参数（limit 为 scored 返回的候选数量）"""
+        from config import settings
+
+        return {
+            "terms": terms,
+            "term_queries": [lexical.to_tsquery_text(term) for term in terms],
+            "candidate_limit": settings.KEYWORD_SEARCH_CANDIDATES,
+            "k1": settings.KEYWORD_SEARCH_BM25_K1,
+            "b": settings.KEYWORD_SEARCH_BM25_B,
+            "keyword_limit": limit
+        }
 
     @staticmethod
-    def _merge_results(
-        results: List[Dict[str, Any]]
+    def _bm25_ctes(conditions: str) -> str:
+        """
+        BM25 关键词检索的公共表表达式（terms / corpus / term_stats / candidates / bm25 / scored）
+
+        corpus 为检索范围内（conditions）的分块数与平均长度，与词位的文档频率取自同一范围；
+        scored 为 BM25 得分最高的 :keyword_limit 个候选分块 (id, score)，按得分降序；
+        近似重复分块与代表分块按组合并（组得分取组内最高分），每组返回一个分块（见 _group_representative_sql）；
+        查询的理论最高分为 SELECT SUM(idf) * (k1 + 1) FROM term_stats
+
+        Args:
+            conditions: 可检索分块的过滤条件（见 _searchable_chunk_filter）
+
+        Returns:
+            WITH 之后的 CTE 定义
+        """
+        return f"""
+            terms AS (
+                SELECT t.term, t.query
+                FROM unnest(CAST(:terms AS text[]), CAST(:term_queries AS tsquery[])) AS t(term, query)
+            ),
+            corpus AS (
+                SELECT
+                    GREATEST(COUNT(*), 1) AS size,
+                    GREATEST(COALESCE(AVG(vc.search_length), 1), 1) AS length
+                FROM vector_chunks vc
+                WHERE {conditions}
+            ),
+            term_stats AS (
+                SELECT
+                    terms.term,
+                    terms.query,
+                    df.n AS df,
+                    ln(1 + (GREATEST(corpus.size, df.n) - df.n + 0.5) / (df.n + 0.5)) AS idf
+                FROM terms
+                CROSS JOIN corpus
+                CROSS JOIN LATERAL (
+                    SELECT COUNT(*) AS n
+                    FROM vector_chunks vc
+                    WHERE {conditions}
+                      AND vc.search_vector @@ terms.query
+                ) df
+            ),
+            candidates AS (
+                SELECT
+                    vc.id, vc.duplicate_of_id,
+                    vc.search_vector, vc.search_length
+                FROM vector_chunks vc
+                WHERE {conditions}
+                  AND vc.search_vector @@ (
+                      SELECT COALESCE(
+                          string_agg(ts.query::text, ' | ') FILTER (WHERE ts.df < :candidate_limit),
+                          string_agg(ts.query::text, ' | ')
+                      )::tsquery
+                      FROM term_stats ts
+                  )
+                ORDER BY
+                    (SELECT SUM(ts.idf) FROM term_stats ts WHERE vc.search_vector @@ ts.query) DESC,
+                    vc.search_length,
+                    vc.id
+                LIMIT :candidate_limit
+            ),
+            bm25 AS (
+                SELECT
+                    COALESCE(c.duplicate_of_id, c.id) AS group_id,
+                    SUM(
+                        ts.idf * array_length(lex.positions, 1) * (CAST(:k1 AS float8) + 1)
+                        / (array_length(lex.positions, 1)
+                           + CAST(:k1 AS float8) * (1 - CAST(:b AS float8) + CAST(:b AS float8) * c.search_length / corpus.length))
+                    ) AS score
+                FROM candidates c
+                CROSS JOIN corpus
+                CROSS JOIN LATERAL unnest(c.search_vector) AS lex(lexeme, positions, weights)
+                JOIN term_stats ts ON ts.term = lex.lexeme
+                GROUP BY c.id, c.duplicate_of_id
+            ),
+            scored AS (
+                SELECT rep.id, top.score
+                FROM (
+                    SELECT group_id, MAX(score) AS score
+                    FROM bm25
+                    GROUP BY group_id
+                    ORDER BY score DESC, group_id
+                    LIMIT :keyword_limit
+                ) top
+                CROSS JOIN LATERAL ({RAGService._group_representative_sql("top.group_id", conditions, "vc.id")}) rep
+                ORDER BY top.score DESC, rep.id
+            )
+        """
+
+    @staticmethod
+    async def _search_keyword_index(
+        user_id: int,
+        query: str,
+        top_k: int,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        在线程中检索进程内倒排索引（不阻塞事件循环，冷启动时需从数据库构建索引）
+
+        线程使用独立的数据库会话（只在索引未加载、需要从数据库构建时连接），原因同 _search_vector_backend
+
+        Returns:
+            [(分块 ID, 归一化得分 0~1)]，按得分降序
+        """
+        from app.core.database import SessionLocal
+
+        def _search() -> List[Tuple[int, float]]:
+            db = SessionLocal()
+            try:
+                return keyword_index.search(db, user_id, query, top_k, document_ids=document_ids, category=category)
+            finally:
+                db.close()
+
+        return await asyncio.to_thread(_search)
+
+    @staticmethod
+    def _fetch_hits(
+        db: Session,
+        user_id: int,
+        hits: List[Tuple[int, float]],
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        合并并去重搜索结果
+        进程内索引（关键词 / 向量）命中的分块回表读取内容，并校验仍可检索
 
         Args:
-            results: 搜索结果列表
+            db: 数据库会话
+            user_id: 用户 ID
+            hits: [(分块 ID, 分数)]，按分数降序
+            document_ids: 只保留这些文档中的分块（可选）
+            category: 只保留该分类的分块（可选）
 
         Returns:
-            合并后的结果列表
+            搜索结果列表（顺序与 hits 一致）
         """
-        # 按 chunk_id 去重，保留最高分数
-        seen = {}
-        for result in results:
-            chunk_id = result['id']
-            if chunk_id not in seen or result['score'] > seen[chunk_id]['score']:
-                seen[chunk_id] = result
+        if not hits:
+            return []
+
+        conditions, params = RAGService._searchable_chunk_filter(user_id, document_ids, category)
+        params["chunk_ids"] = [chunk_id for chunk_id, _ in hits]
+        rows = db.execute(
+            text(f"""
+                SELECT
+                    vc.id,
+                    {CHUNK_TEXT_SQL} as chunk_text,
+                    vc.chunk_index,
+                    kd.file_name,
+                    kd.id as document_id
+                FROM vector_chunks vc
+                JOIN knowledge_documents kd ON vc.document_id = kd.id
+                WHERE vc.id = ANY(:chunk_ids) AND {conditions}
+            """),
+            params
+        ).fetchall()
+        rows_by_id = {row[0]: row for row in rows}
+
+        return [
+            {
+                "id": chunk_id,
+                "content": rows_by_id[chunk_id][1],
+                "chunk_index": rows_by_id[chunk_id][2],
+                "source": rows_by_id[chunk_id][3],
+                "document_id": rows_by_id[chunk_id][4],
+                "score": score
+            }
+            for chunk_id, score in hits
+            if chunk_id in rows_by_id
+        ]
+
+    @staticmethod
+    def _vector_ranking(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        混合检索结果中被向量召回的分块，按向量相似度降序（score 替换为向量相似度，用于首轮置信度判断）
 
-        # 按分数排序
-        merged = sorted(seen.values(), key=lambda x: x['score'], reverse=True)
+        Args:
+            results: hybrid_search 的结果
 
-        return merged
+        Returns:
+            向量检索视角的结果列表
+        """
+        ranked = [
+            {**result, 'score': result['vector_score']}
+            for result in results
+            if result.get('vector_score') is not None
+        ]
+        ranked.sort(key=lambda x: x['score'], reverse=True)
+        return ranked
 
     @staticmethod
     async def _rerank_results(
         query: str,
         results: List[Dict[str, Any]],
-        top_k: int
+        top_k: int,
+        db: Optional[Session] = None
     ) -> List[Dict[str, Any]]:
         """
-        使用 LLM 对搜索结果进行重排序
+        对搜索结果进行重排序（重排序器由 RERANKER 配置，默认为本地 CPU 重排序）
+
+        只对前 2*top_k 个结果重新评分，得分按 (查询, 分块, 重排序器版本) 缓存；
+        得分依赖整个候选集的重排序器（本地重排序的 BM25 文档频率与平均长度）在有未命中时整组重新评分
 
         Args:
             query: 原始查询
             results: 搜索结果列表
             top_k: 返回结果数量
+            db: 数据库会话（本地重排序读取分块向量时使用）
 
         Returns:
             重排序后的结果列表
         """
         try:
-            from app.services.llm_service import get_llm
-
-            llm = await get_llm()
-
-            # 构建重排序 prompt
-            candidates_text = ""
-            for i, result in enumerate(results[:top_k * 2]):  # 只重排序前 2*top_k 个结果
-                candidates_text += f"\n{i+1}. {result['content']}\n"
-
-            # 加载提示词模板
-            prompt = PromptLoader.format_prompt(
-                'rerank_results',
-                query=query,
-                candidates_text=candidates_text,
-                num_candidates=len(results[:top_k * 2])
-            )
+            from app.services.reranker_service import FallbackScores, get_reranker, rerank_score_cache, RerankScoreCache
+
+            reranker = get_reranker()
+            candidates = results[:top_k * 2]  # 只重排序前 2*top_k 个结果
+            query_hash = RerankScoreCache.query_hash(query)
+            keys = [(query_hash, candidate['id'], reranker.version) for candidate in candidates]
+
+            scores = rerank_score_cache.get_many(keys)
+            missing = [(key, candidate) for key, candidate in zip(keys, candidates) if key not in scores]
+            if missing and reranker.candidate_dependent:
+                missing = list(zip(keys, candidates))
+            if missing:
+                new_scores = await reranker.score(query, [candidate for _, candidate in missing], db)
+                computed = {key: score for (key, _), score in zip(missing, new_scores)}
+                if not isinstance(new_scores, FallbackScores):
+                    rerank_score_cache.put_many(computed)
+                scores.update(computed)
+
+            # 混合原始分数和重排序分数
+            reranked = [
+                {**candidate, 'score': candidate['score'] * 0.3 + scores[key] * 0.7}
+                for key, candidate in zip(keys, candidates)
+            ]
+            reranked.extend(results[top_k * 2:])
+            reranked.sort(key=lambda x: x['score'], reverse=True)
 
-            response = await llm.generate_text(prompt, temperature=0.3)
-
-            # 去除可能存在的 markdown 代码块标记
-            response = response.strip()
-            if response.startswith("```json"):
-                response = response[7:]
-            elif response.startswith("```"):
-                response = response[3:]
-            if response.endswith("```"):
-                response = response[:-3]
-            response = response.strip()
-
-            # 解析响应
-            import json
-            rerank_scores = json.loads(response)
-
-            # 应用重排序分数
-            for score_info in rerank_scores:
-                idx = score_info.get('index', 0) - 1
-                if 0 <= idx < len(results):
-                    # 混合原始分数和重排序分数
-                    original_score = results[idx]['score']
-                    rerank_score = score_info.get('score', 0.5)
-                    results[idx]['score'] = (original_score * 0.3 + rerank_score * 0.7)
-
-            # 重新排序
-            results = sorted(results, key=lambda x: x['score'], reverse=True)
-
-            print(f"[RAG] 重排序完成，返回前 {top_k} 个结果")
-            return results[:top_k]
+            logger.info(f"重排序完成（{reranker.name}，缓存命中 {len(candidates) - len(missing)}/{len(candidates)}），返回前 {top_k} 个结果")
+            return reranked[:top_k]
 
         except Exception as e:
-            print(f"[RAG] 重排序失败: {e}")
+            logger.warning(f"重排序失败: {e}")
             # 失败时返回原始排序
             return results[:top_k]
 
@@ -1002,16 +1854,35 @@ class RAGService:
         query_embedding: List[float],
         user_id: int,
         top_k: int = 5,
-        db: Session = None
+        db: Session = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None,
+        exact: bool = False,
+        quantization: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        使用 pgvector 进行向量搜索
+        使用 pgvector 进行向量搜索（有 HNSW/IVFFlat 索引时为近似搜索）
+
+        过滤条件作用于 vector_chunks 的冗余字段（文档状态按已完成文档的 ID 过滤），先在分块表上完成过滤与距离排序，
+        再为 Top-K 结果联表取文档信息，过滤与索引扫描在同一张表上进行。
+        查询向量作为参数绑定：ENABLE_ASYNCPG_VECTOR_SEARCH 时经 asyncpg 连接池以二进制传输
+        并复用预编译语句，否则在传入的会话上执行。
+        VECTOR_BACKEND 不是 pgvector 时由进程内向量索引检索（见 _vector_search_in_memory），
+        开启量化检索时先按量化距离取候选再用全精度向量重新打分（见 _nearest_chunks_sql）
 
         Args:
             query_embedding: 查询向量
             user_id: 用户 ID
             top_k: 返回结果数量
-            db: 数据库会话（AsyncSession）
+            db: 数据库会话
+            ef_search: HNSW 查询候选列表大小（默认使用 HNSW_EF_SEARCH）
+            probes: IVFFlat 查询扫描的聚类数量（默认使用 IVFFLAT_PROBES）
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+            exact: 精确搜索（禁用索引扫描且不量化，用于评估近似搜索的召回率）
+            quantization: 量化方式（none / halfvec / binary，默认使用 VECTOR_QUANTIZATION，用于对比召回率）
 
         Returns:
             搜索结果列表
@@ -1020,29 +1891,34 @@ class RAGService:
             return []
 
         try:
-            # 将向量转换为字符串格式
-            vector_str = f"[{','.join(map(str, query_embedding))}]"
+            if not vector_backend.in_database:
+                return await RAGService._vector_search_in_memory(
+                    [query_embedding], user_id, top_k, db, document_ids=document_ids, category=category
+                )
+
+            conditions, params = RAGService._searchable_chunk_filter(user_id, document_ids, category)
+            params.update({"embedding": query_embedding, "top_k": top_k})
+            quantization = "none" if exact else quantization
+            session_settings = RAGService._vector_search_settings(top_k, ef_search, probes, exact, quantization)
+            nearest_sql = RAGService._nearest_chunks_sql(
+                conditions, "CAST(:embedding AS vector)", CHUNK_COLUMNS_SQL, ":top_k", quantization
+            )
 
-            # 使用 pgvector 的余弦相似度搜索
-            # 注意: 使用字符串格式化来避免参数绑定问题
+            # 使用 pgvector 的余弦相似度搜索（SQL 文本只随过滤条件的组合变化，可复用预编译语句）
             sql = f"""
                 SELECT
                     vc.id,
-                    vc.chunk_text,
+                    {CHUNK_TEXT_SQL} as chunk_text,
                     vc.chunk_index,
                     kd.file_name,
                     kd.id as document_id,
-                    1 - (vc.embedding <=> '{vector_str}'::vector) as similarity
-                FROM vector_chunks vc
+                    1 - vc.distance as similarity
+                FROM ({nearest_sql}) vc
                 JOIN knowledge_documents kd ON vc.document_id = kd.id
-                WHERE kd.user_id = {user_id}
-                  AND kd.status = 'completed'
-                ORDER BY vc.embedding <=> '{vector_str}'::vector
-                LIMIT {top_k}
+                ORDER BY vc.distance
             """
 
-            result = db.execute(text(sql))
-            result = result.fetchall()
+            result = await RAGService._fetch_vector_rows(db, sql, params, session_settings, ["embedding"])
 
             return [
                 {
@@ -1057,11 +1933,538 @@ class RAGService:
             ]
 
         except Exception as e:
-            print(f"[RAG] 向量搜索失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"向量搜索失败: {e}")
+            return []
+
+    @staticmethod
+    async def _vector_search_in_memory(
+        query_embeddings: List[List[float]],
+        user_id: int,
+        top_k: int,
+        db: Session,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        进程内向量索引检索（在线程中计算，不阻塞事件循环），命中的分块回表读取内容并校验仍可检索
+
+        Args:
+            query_embeddings: 查询向量列表
+            user_id: 用户 ID
+            top_k: 每个查询返回结果数量
+            db: 数据库会话
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+
+        Returns:
+            搜索结果列表（每个分块只出现一次，取各查询中的最高分，按分数降序）
+        """
+        hits_per_query = await RAGService._search_vector_backend(
+            user_id, query_embeddings, top_k, document_ids, category
+        )
+        best: Dict[int, float] = {}
+        for hits in hits_per_query:
+            for chunk_id, score in hits:
+                if score > best.get(chunk_id, -1.0):
+                    best[chunk_id] = score
+        hits = sorted(best.items(), key=lambda hit: hit[1], reverse=True)
+        return RAGService._fetch_hits(db, user_id, hits, document_ids=document_ids, category=category)
+
+    @staticmethod
+    async def _search_vector_backend(
+        user_id: int,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        在线程中检索进程内向量索引（不阻塞事件循环）
+
+        线程使用独立的数据库会话（只在索引未加载、需要从数据库构建时连接）：请求的会话不是线程安全的，
+        流水线检索的其他阶段同时在事件循环中使用它
+
+        Returns:
+            与 query_embeddings 顺序一致的 [(分块 ID, 余弦相似度)] 列表
+        """
+        from app.core.database import SessionLocal
+
+        def _search() -> List[List[Tuple[int, float]]]:
+            db = SessionLocal()
+            try:
+                return vector_backend.search(db, user_id, query_embeddings, top_k, document_ids, category)
+            finally:
+                db.close()
+
+        return await asyncio.to_thread(_search)
+
+    @staticmethod
+    async def hybrid_search(
+        query: str,
+        query_embeddings: List[List[float]],
+        user_id: int,
+        top_k: int = 5,
+        db: Session = None,
+        candidate_k: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        混合检索：向量与关键词候选在一条 SQL 中召回，按倒数排名融合（RRF）后返回 Top-K
+
+        - 每个查询向量是一路排名（LATERAL 子查询各走一次 Top-K 索引扫描），BM25 关键词检索是另一路
+        - 分块得分为各路 1 / (HYBRID_RRF_K + 排名) 之和，按各路均排第一时的理论最高分归一化到 0 ~ 1
+        - 关键词使用进程内倒排索引、向量使用进程内向量索引（VECTOR_BACKEND）时，
+          命中的分块 ID 按排名作为数组参数传入，仍在一条 SQL 中融合
+        结果中 vector_score 为分块在各查询向量下的最高相似度（未被向量召回时为 None）；
+        第一个查询向量相似度最高的两个分块总会返回（首轮置信度判断使用），结果可能多于 top_k 条
+
+        Args:
+            query: 查询文本（关键词检索使用）
+            query_embeddings: 查询向量列表（第一个为原始查询）
+            user_id: 用户 ID
+            top_k: 返回结果数量
+            db: 数据库会话
+            candidate_k: 每路召回的候选数量（默认等于 top_k）
+            ef_search: HNSW 查询候选列表大小（默认使用 HNSW_EF_SEARCH）
+            probes: IVFFlat 查询扫描的聚类数量（默认使用 IVFFLAT_PROBES）
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+
+        Returns:
+            搜索结果列表（按融合分数降序）
+        """
+        if db is None or not query_embeddings:
+            return []
+
+        try:
+            from config import settings
+
+            candidate_k = candidate_k or top_k
+            conditions, params = RAGService._searchable_chunk_filter(user_id, document_ids, category)
+            params.update({"top_k": top_k, "candidate_k": candidate_k, "rrf_k": settings.HYBRID_RRF_K})
+            # 关键词一路：全文索引在 SQL 中计算 BM25，进程内倒排索引的命中结果作为参数传入
+            ctes = []
+            if keyword_index.enabled:
+                hits = await RAGService._search_keyword_index(user_id, query, candidate_k, document_ids, category)
+                if hits:
+                    params["keyword_ids"] = [chunk_id for chunk_id, _ in hits]
+                    ctes.append(f"""
+                        keyword_ranked AS (
+                            SELECT k.id, k.rank
+                            FROM unnest(CAST(:keyword_ids AS bigint[])) WITH ORDINALITY AS k(id, rank)
+                            JOIN vector_chunks vc ON vc.id = k.id
+                            WHERE {conditions}
+                        )
+                    """)
+            else:
+                terms = lexical.query_terms(query)
+                if terms:
+                    params.update(RAGService._bm25_params(terms, candidate_k))
+                    ctes.append(RAGService._bm25_ctes(conditions))
+                    ctes.append("""
+                        keyword_ranked AS (
+                            SELECT s.id, ROW_NUMBER() OVER (ORDER BY s.score DESC, s.id) AS rank
+                            FROM scored s
+                        )
+                    """)
+            keyword_leg = """
+                UNION ALL
+                SELECT id, rank, CAST(NULL AS float8), CAST(NULL AS integer) FROM keyword_ranked
+            """ if ctes else ""
+
+            # 向量一路：pgvector 在 SQL 中检索，进程内向量索引的命中结果作为参数传入
+            vector_params = []
+            if vector_backend.in_database:
+                values = []
+                for i, embedding in enumerate(query_embeddings):
+                    vector_params.append(f"embedding_{i}")
+                    params[f"embedding_{i}"] = embedding
+                    values.append(f"({i}, CAST(:embedding_{i} AS vector))")
+                nearest_sql = RAGService._nearest_chunks_sql(conditions, "q.embedding", "vc.id", ":candidate_k")
+                ctes.append(f"""
+                    vector_ranked AS (
+                        SELECT
+                            h.id, h.distance, q.query_index,
+                            ROW_NUMBER() OVER (PARTITION BY q.query_index ORDER BY h.distance, h.id) AS rank
+                        FROM (VALUES {', '.join(values)}) AS q(query_index, embedding)
+                        CROSS JOIN LATERAL ({nearest_sql}) h
+                    )
+                """)
+            else:
+                hits_per_query = await RAGService._search_vector_backend(
+                    user_id, query_embeddings, candidate_k, document_ids, category
+                )
+                flat = [
+                    (chunk_id, score, query_index, rank)
+                    for query_index, hits in enumerate(hits_per_query)
+                    for rank, (chunk_id, score) in enumerate(hits, start=1)
+                ]
+                params.update({
+                    "vector_ids": [hit[0] for hit in flat],
+                    "vector_scores": [hit[1] for hit in flat],
+                    "vector_queries": [hit[2] for hit in flat],
+                    "vector_ranks": [hit[3] for hit in flat]
+                })
+                ctes.append(f"""
+                    vector_ranked AS (
+                        SELECT h.id, 1 - h.score AS distance, h.query_index, h.rank
+                        FROM unnest(
+                            CAST(:vector_ids AS bigint[]), CAST(:vector_scores AS float8[]),
+                            CAST(:vector_queries AS integer[]), CAST(:vector_ranks AS bigint[])
+                        ) AS h(id, score, query_index, rank)
+                        JOIN vector_chunks vc ON vc.id = h.id
+                        WHERE {conditions}
+                    )
+                """)
+
+            ctes.append(f"""
+                fused AS (
+                    SELECT
+                        legs.id,
+                        SUM(1.0 / (CAST(:rrf_k AS integer) + legs.rank)) AS rrf,
+                        MIN(legs.distance) AS distance,
+                        MIN(legs.rank) FILTER (WHERE legs.query_index = 0) AS primary_rank
+                    FROM (
+                        SELECT id, rank, distance, query_index FROM vector_ranked
+                        {keyword_leg}
+                    ) legs
+                    GROUP BY legs.id
+                ),
+                ranked AS (
+                    SELECT fused.*, ROW_NUMBER() OVER (ORDER BY fused.rrf DESC, fused.id) AS position
+                    FROM fused
+                )
+            """)
+            legs = len(query_embeddings) + (1 if keyword_leg else 0)
+
+            sql = f"""
+                WITH {','.join(ctes)}
+                SELECT
+                    vc.id,
+                    {CHUNK_TEXT_SQL} as chunk_text,
+                    vc.chunk_index,
+                    kd.file_name,
+                    kd.id as document_id,
+                    CAST(f.rrf AS float8) as rrf,
+                    1 - f.distance as similarity
+                FROM ranked f
+                JOIN vector_chunks vc ON vc.id = f.id
+                JOIN knowledge_documents kd ON vc.document_id = kd.id
+                WHERE f.position <= :top_k OR f.primary_rank <= 2
+                ORDER BY f.rrf DESC, f.id
+            """
+
+            session_settings = RAGService._vector_search_settings(candidate_k, ef_search, probes)
+            result = await RAGService._fetch_vector_rows(db, sql, params, session_settings, vector_params)
+
+            max_score = legs / (settings.HYBRID_RRF_K + 1)
+            return [
+                {
+                    "id": row[0],
+                    "content": row[1],
+                    "chunk_index": row[2],
+                    "source": row[3],
+                    "document_id": row[4],
+                    "score": float(row[5]) / max_score,
+                    "vector_score": float(row[6]) if row[6] is not None else None
+                }
+                for row in result
+            ]
+
+        except Exception as e:
+            logger.exception(f"混合检索失败: {e}")
             return []
 
+    @staticmethod
+    async def _fetch_vector_rows(
+        db: Session,
+        sql: str,
+        params: Dict[str, Any],
+        session_settings: Dict[str, str],
+        vector_params: List[str]
+    ) -> List[Any]:
+        """
+        执行向量查询：ENABLE_ASYNCPG_VECTOR_SEARCH 时经 asyncpg 连接池二进制传输，否则在传入的会话上执行
+
+        Args:
+            db: 数据库会话
+            sql: 查询 SQL
+            params: 绑定参数
+            session_settings: 索引查询参数
+            vector_params: 向量类型的参数名
+
+        Returns:
+            查询结果行
+        """
+        from config import settings
+
+        if settings.ENABLE_ASYNCPG_VECTOR_SEARCH:
+            from app.core import vector_db
+            return await vector_db.fetch_rows(sql, params, session_settings)
+
+        RAGService._apply_session_settings(db, session_settings)
+        statement = text(sql).bindparams(*[
+            bindparam(name, type_=Vector(settings.VECTOR_DIMENSION)) for name in vector_params
+        ])
+        return db.execute(statement, params).fetchall()
+
+    @staticmethod
+    def _searchable_chunk_filter(
+        user_id: int,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        可检索分块的过滤条件（作用于 vector_chunks 的冗余字段；文档状态只保存在文档上，
+        按该用户已完成文档的 ID 过滤，子查询只执行一次）
+
+        近似重复分块（duplicate_of_id 指向代表分块，不存向量）与代表分块属于同一组，条件作用于每个分块
+        自身所属的文档与分类：代表分块不在检索范围内（其他文档、其他分类或所属文档正在处理）时，
+        组内在范围内的重复分块仍可检索。检索结果每组只返回一个分块（见 _group_representative_sql）
+
+        开启 PARENT_CONTEXT_RETRIEVAL 时只检索子块与普通分块，父块由 expand_parent_context 补充
+
+        Args:
+            user_id: 用户 ID
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+
+        Returns:
+            (SQL 条件, 绑定参数)
+        """
+        conditions = [
+            "vc.user_id = :user_id",
+            "vc.document_id IN (SELECT kd.id FROM knowledge_documents kd "
+            "WHERE kd.user_id = :user_id AND kd.status = 'completed')"
+        ]
+        from config import settings
+
+        if settings.PARENT_CONTEXT_RETRIEVAL:
+            conditions.append("vc.is_parent = false")
+        params: Dict[str, Any] = {"user_id": user_id}
+        if document_ids:
+            conditions.append("vc.document_id = ANY(:document_ids)")
+            params["document_ids"] = [int(doc_id) for doc_id in document_ids]
+        if category:
+            conditions.append("vc.category = :category")
+            params["category"] = category
+        return " AND ".join(conditions), params
+
+    @staticmethod
+    def _searchable_group_filter(conditions: str) -> str:
+        """
+        向量检索的过滤条件：作用于代表分块（存储向量的分块），组内任一分块满足 conditions 即可检索
+
+        重复分块满足条件的组很少，IN 子查询只扫描重复分块（duplicate_of_id 索引），执行一次
+
+        Args:
+            conditions: 可检索分块的过滤条件（见 _searchable_chunk_filter）
+
+        Returns:
+            SQL 条件
+        """
+        return f"""
+            vc.user_id = :user_id
+            AND vc.duplicate_of_id IS NULL
+            AND (
+                ({conditions})
+                OR vc.id IN (
+                    SELECT vc.duplicate_of_id
+                    FROM vector_chunks vc
+                    WHERE vc.duplicate_of_id IS NOT NULL AND {conditions}
+                )
+            )
+        """
+
+    @staticmethod
+    def _group_representative_sql(group_id: str, conditions: str, columns: str) -> str:
+        """
+        组内代表检索结果的分块（LATERAL 子查询）：代表分块在检索范围内时为代表分块，
+        否则为范围内 ID 最小的重复分块。各路检索使用同一规则，同一组总是返回同一个分块 ID
+
+        Args:
+            group_id: 组 ID（代表分块 ID）的 SQL 表达式
+            conditions: 可检索分块的过滤条件（见 _searchable_chunk_filter）
+            columns: 返回的分块列
+
+        Returns:
+            子查询 SQL
+        """
+        return f"""
+            SELECT {columns}
+            FROM vector_chunks vc
+            WHERE (vc.id = {group_id} OR vc.duplicate_of_id = {group_id}) AND {conditions}
+            ORDER BY vc.duplicate_of_id IS NOT NULL, vc.id
+            LIMIT 1
+        """
+
+    @staticmethod
+    def _vector_search_settings(
+        top_k: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        exact: bool = False,
+        quantization: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        向量检索的会话参数
+
+        HNSW 每次最多返回 ef_search 条候选，ef_search 不小于 top_k（量化检索时为候选数）才能返回足够的结果。
+        索引覆盖全部用户的分块，过滤条件在索引扫描之后应用，开启迭代扫描（VECTOR_ITERATIVE_SCAN）后
+        过滤剩余结果不足时继续扫描索引；relaxed_order 的结果可能略微乱序，由外层查询按距离重新排序。
+        数据库中的 pgvector 低于 0.8 时不设置迭代扫描参数（见 _pgvector_version）
+
+        Args:
+            top_k: 返回结果数量
+            ef_search: HNSW 查询候选列表大小
+            probes: IVFFlat 查询扫描的聚类数量
+            exact: 精确搜索（禁用索引扫描）
+            quantization: 量化方式（默认使用 VECTOR_QUANTIZATION）
+
+        Returns:
+            参数名到取值的映射
+        """
+        from config import settings
+
+        if RAGService._vector_quantization(quantization) != "none":
+            top_k *= max(settings.VECTOR_RESCORE_FACTOR, 1)
+        session_settings = {
+            # pgvector 的 hnsw.ef_search 上限为 1000
+            "hnsw.ef_search": str(min(max(ef_search or settings.HNSW_EF_SEARCH, top_k), 1000)),
+            "ivfflat.probes": str(max(probes or settings.IVFFLAT_PROBES, 1)),
+            "enable_indexscan": "off" if exact else "on"
+        }
+        if settings.VECTOR_ITERATIVE_SCAN != "off" and RAGService._pgvector_version() >= ITERATIVE_SCAN_MIN_VERSION:
+            session_settings["hnsw.iterative_scan"] = settings.VECTOR_ITERATIVE_SCAN
+            session_settings["ivfflat.iterative_scan"] = settings.VECTOR_ITERATIVE_SCAN
+        return session_settings
+
+    @staticmethod
+    def _pgvector_version() -> Tuple[int, ...]:
+        """
+        数据库中 pgvector 扩展的版本（读取一次后缓存）
+
+        低于 0.8 的版本没有 hnsw.iterative_scan 参数，设置会报错，检索参数中不包含迭代扫描；
+        读取失败时按 (0,) 处理（不开启迭代扫描），下次再读取
+        """
+        global _pgvector_version
+        if _pgvector_version is not None:
+            return _pgvector_version
+
+        from app.core.database import sync_engine
+
+        try:
+            with sync_engine.connect() as conn:
+                version = conn.execute(
+                    text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+                ).scalar()
+        except Exception as e:
+            logger.warning(f"读取 pgvector 版本失败: {e}")
+            return (0,)
+
+        _pgvector_version = tuple(int(part) for part in re.findall(r"\d+", version or "0"))
+        if _pgvector_version < ITERATIVE_SCAN_MIN_VERSION:
+            logger.warning(f"pgvector {version} 不支持迭代索引扫描（需要 0.8+），VECTOR_ITERATIVE_SCAN 不生效")
+        return _pgvector_version
+
+    @staticmethod
+    def _vector_quantization(quantization: Optional[str] = None) -> str:
+        """
+        pgvector 检索使用的量化方式（none / halfvec / binary）
+
+        int8 只用于 numpy 后端（pgvector 没有 int8 向量类型），在数据库中按全精度检索
+        """
+        from config import settings
+
+        quantization = (quantization or settings.VECTOR_QUANTIZATION).lower()
+        return quantization if quantization in ("halfvec", "binary") else "none"
+
+    @staticmethod
+    def _nearest_chunks_sql(
+        conditions: str,
+        embedding: str,
+        columns: str,
+        limit: str,
+        quantization: Optional[str] = None
+    ) -> str:
+        """
+        最近分块子查询：返回 columns 与余弦距离 distance，按距离取前 limit 条（结果不保证顺序）
+
+        向量只存储在代表分块上：先在检索范围内有分块的组中按代表分块的向量取最近的 limit 组，
+        再为每组取代表检索结果的分块（见 _group_representative_sql）。
+        量化检索分两阶段：先按量化距离（与 manage_vector_index.py 构建的量化索引表达式一致，可走量化索引）
+        取 limit × VECTOR_RESCORE_FACTOR 个候选，再用全精度向量重新计算距离取前 limit 条，
+        全精度向量只为候选读取
+
+        Args:
+            conditions: 过滤条件（作用于 vector_chunks vc）
+            embedding: 查询向量的 SQL 表达式（vector 类型）
+            columns: 返回的分块列
+            limit: 返回数量的 SQL 表达式
+            quantization: 量化方式（默认使用 VECTOR_QUANTIZATION）
+
+        Returns:
+            子查询 SQL
+        """
+        from config import settings
+
+        distance = f"vc.embedding <=> {embedding}"
+        group_filter = RAGService._searchable_group_filter(conditions)
+        quantization = RAGService._vector_quantization(quantization)
+        if quantization == "none":
+            nearest = f"""
+                SELECT vc.id, {distance} as distance
+                FROM vector_chunks vc
+                WHERE {group_filter}
+                ORDER BY {distance}
+                LIMIT {limit}
+            """
+        else:
+            dimension = int(settings.VECTOR_DIMENSION)
+            if quantization == "halfvec":
+                quantized = f"CAST(vc.embedding AS halfvec({dimension})) <=> CAST({embedding} AS halfvec({dimension}))"
+            else:
+                quantized = f"CAST(binary_quantize(vc.embedding) AS bit({dimension})) <~> binary_quantize({embedding})"
+            nearest = f"""
+                SELECT vc.id, {distance} as distance
+                FROM (
+                    SELECT vc.id
+                    FROM vector_chunks vc
+                    WHERE {group_filter}
+                    ORDER BY {quantized}
+                    LIMIT {limit} * {max(int(settings.VECTOR_RESCORE_FACTOR), 1)}
+                ) candidates
+                JOIN vector_chunks vc ON vc.id = candidates.id
+                ORDER BY {distance}
+                LIMIT {limit}
+            """
+
+        return f"""
+            SELECT {columns}, nearest.distance
+            FROM ({nearest}) nearest
+            CROSS JOIN LATERAL ({RAGService._group_representative_sql("nearest.id", conditions, columns)}) vc
+        """
+
+    @staticmethod
+    def _apply_session_settings(db: Session, session_settings: Dict[str, str]):
+        """
+        在当前事务内设置会话参数（set_config 的 is_local=true，事务结束后失效）
+
+        Args:
+            db: 数据库会话
+            session_settings: 参数名到取值的映射
+        """
+        params = {}
+        calls = []
+        for i, (name, value) in enumerate(session_settings.items()):
+            params[f"name_{i}"] = name
+            params[f"value_{i}"] = value
+            calls.append(f"set_config(:name_{i}, :value_{i}, true)")
+        db.execute(text(f"SELECT {', '.join(calls)}"), params)
+
     @staticmethod
     async def delete_document_chunks(
         document_id: int,
@@ -1075,12 +2478,16 @@ class RAGService:
             db: 数据库会话
         """
         try:
+            heir_document_ids = RAGService.release_duplicate_chunks(db, document_id=document_id)
             db.query(VectorChunk).filter(
                 VectorChunk.document_id == document_id
             ).delete()
             db.commit()
+            keyword_index.remove_document(document_id)
+            vector_backend.remove_document(document_id)
+            RAGService.refresh_heir_documents(db, heir_document_ids)
         except Exception as e:
-            print(f"[RAG] 删除文档块失败: {e}")
+            logger.exception(f"删除文档块失败: {e}")
             db.rollback()
             raise
 
@@ -1115,5 +2522,5 @@ class RAGService:
             }
 
         except Exception as e:
-            print(f"[RAG] 获取文档状态失败: {e}")
+            logger.warning(f"获取文档状态失败: {e}")
             return None
\ No newline at end of file
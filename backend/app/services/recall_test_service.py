@@ -1,5 +1,6 @@
 """召回测试服务"""
 import json
+import time
 from typing import List, Dict, Any
 from sqlalchemy.orm import Session
 from app.models.knowledge import RecallTestCase, RecallTestResult, VectorChunk
@@ -131,14 +132,15 @@ class RecallTestService:
             use_query_expansion=use_query_expansion,
             use_hybrid_search=use_hybrid_search,
             use_reranking=use_reranking,
-            db=db
+            db=db,
+            use_adaptive=False
         )
 
         # 提取召回的分段 ID 和分数
         retrieved_ids = []
         retrieved_scores = []
         for result in results:
-            chunk_id = result.get("chunk_id")
+            chunk_id = result.get("id")
             score = result.get("score", 0)
             if chunk_id:
                 retrieved_ids.append(chunk_id)
@@ -171,6 +173,160 @@ class RecallTestService:
 
         return test_result
 
+    @staticmethod
+    async def evaluate_adaptive_thresholds(
+        user_id: int,
+        top_k: int,
+        thresholds_grid: List[Dict[str, float]],
+        db: Session
+    ) -> Dict[str, Any]:
+        """
+        评估自适应检索阈值
+
+        每个测试用例分别执行四种检索（是否查询扩展 × 是否重排序，均为混合检索）并记录首轮向量检索结果，
+        再按每组阈值模拟自适应检索的选择，统计召回率与跳过 LLM 调用的比例。
+        阈值组合只在内存中模拟，不会重复调用 LLM
+
+        Args:
+            user_id: 用户 ID
+            top_k: 返回结果数量
+            thresholds_grid: 阈值组合列表（min_top_score / min_score_margin / min_lexical_overlap）
+            db: 数据库会话
+
+        Returns:
+            {"case_count", "full": 完整检索的指标, "results": 每组阈值的指标与跳过比例}
+        """
+        from app.services.llm_service import create_embedding
+        from app.services.rag_service import RAGService
+
+        test_cases = RecallTestService.get_test_cases(user_id, db)
+        cases = []
+        for test_case in test_cases:
+            expected_ids = json.loads(test_case.expected_chunk_ids)
+            first_pass = await RAGService.vector_search(
+                await create_embedding(test_case.query), user_id, top_k=top_k * 2, db=db
+            )
+            variants = {}
+            for use_query_expansion in (False, True):
+                for use_reranking in (False, True):
+                    results = await RAGService.search_knowledge(
+                        query=test_case.query,
+                        user_id=user_id,
+                        top_k=top_k,
+                        use_query_expansion=use_query_expansion,
+                        use_hybrid_search=True,
+                        use_reranking=use_reranking,
+                        db=db,
+                        use_adaptive=False
+                    )
+                    variants[(use_query_expansion, use_reranking)] = RecallTestService.calculate_metrics(
+                        [result["id"] for result in results], expected_ids
+                    )
+            cases.append({"query": test_case.query, "first_pass": first_pass, "variants": variants})
+
+        if not cases:
+            return {"case_count": 0, "full": {}, "results": []}
+
+        def _average(metrics: List[Dict[str, float]]) -> Dict[str, float]:
+            return {
+                name: round(sum(m[name] for m in metrics) / len(metrics), 4)
+                for name in ("recall", "precision", "f1_score", "mrr")
+            }
+
+        results = []
+        for thresholds in thresholds_grid:
+            chosen = []
+            expansion_skipped = 0
+            rerank_skipped = 0
+            for case in cases:
+                need_expansion, need_rerank = RAGService._adaptive_decision(
+                    case["query"], case["first_pass"], True, True, use_adaptive=True, thresholds=thresholds
+                )
+                expansion_skipped += not need_expansion
+                rerank_skipped += not need_rerank
+                chosen.append(case["variants"][(need_expansion, need_rerank)])
+            results.append({
+                "thresholds": thresholds,
+                **_average(chosen),
+                "expansion_skip_rate": round(expansion_skipped / len(cases), 4),
+                "rerank_skip_rate": round(rerank_skipped / len(cases), 4)
+            })
+
+        return {
+            "case_count": len(cases),
+            "full": _average([case["variants"][(True, True)] for case in cases]),
+            "results": results
+        }
+
+    @staticmethod
+    async def evaluate_quantization(
+        user_id: int,
+        top_k: int,
+        quantizations: List[str],
+        db: Session
+    ) -> Dict[str, Any]:
+        """
+        对比量化向量检索与全精度精确检索
+
+        每个测试用例先执行一次全精度精确检索作为基准，再按每种量化方式（两阶段：量化候选 + 全精度重新打分）检索，统计：
+        - 用例召回率 / MRR：命中测试用例期望分段的比例（与召回测试功能的指标一致）
+        - 基准重合率：与全精度精确检索 Top-K 的重合比例
+        - 延迟 P50 / P95（未创建对应量化索引时为顺序扫描，只有召回率可参考）
+        只对 pgvector 后端有效（numpy 后端的量化方式由 VECTOR_QUANTIZATION 决定）
+
+        Args:
+            user_id: 用户 ID
+            top_k: 返回结果数量
+            quantizations: 量化方式列表（none / halfvec / binary）
+            db: 数据库会话
+
+        Returns:
+            {"case_count", "results": 每种量化方式的指标}
+        """
+        from app.services.llm_service import create_embedding
+        from app.services.rag_service import RAGService
+
+        cases = []
+        for test_case in RecallTestService.get_test_cases(user_id, db):
+            embedding = await create_embedding(test_case.query)
+            baseline = await RAGService.vector_search(embedding, user_id, top_k=top_k, db=db, exact=True)
+            cases.append({
+                "embedding": embedding,
+                "expected_ids": json.loads(test_case.expected_chunk_ids),
+                "baseline_ids": {result["id"] for result in baseline}
+            })
+
+        if not cases:
+            return {"case_count": 0, "results": []}
+
+        results = []
+        for quantization in quantizations:
+            metrics = []
+            overlaps = []
+            latencies = []
+            for case in cases:
+                started = time.perf_counter()
+                retrieved = await RAGService.vector_search(
+                    case["embedding"], user_id, top_k=top_k, db=db, quantization=quantization
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                retrieved_ids = [result["id"] for result in retrieved]
+                metrics.append(RecallTestService.calculate_metrics(retrieved_ids, case["expected_ids"]))
+                if case["baseline_ids"]:
+                    overlaps.append(len(case["baseline_ids"].intersection(retrieved_ids)) / len(case["baseline_ids"]))
+
+            latencies.sort()
+            results.append({
+                "quantization": quantization,
+                "recall": round(sum(m["recall"] for m in metrics) / len(metrics), 4),
+                "mrr": round(sum(m["mrr"] for m in metrics) / len(metrics), 4),
+                "baseline_overlap": round(sum(overlaps) / len(overlaps), 4) if overlaps else 1.0,
+                "p50_ms": round(latencies[len(latencies) // 2], 2),
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2)
+            })
+
+        return {"case_count": len(cases), "results": results}
+
     @staticmethod
     def get_test_results(
         user_id: int,
@@ -228,7 +384,7 @@ class RecallTestService:
         return [
             {
                 "id": chunk.id,
-                "content": chunk.chunk_text,
+                "content": chunk.content,
                 "document_id": chunk.document_id
             }
             for chunk in chunks
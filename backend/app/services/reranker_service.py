@@ -0,0 +1,315 @@
+"""
+检索结果重排序
+- LocalReranker（默认）：纯 CPU 计算，词位覆盖率 + 候选集内 BM25 + 向量余弦相似度，按权重线性组合
+- LLMReranker（可选，RERANKER=llm）：由 LLM 对候选片段逐一评分
+- RerankScoreCache：按 (查询哈希, 分块 ID, 重排序器版本) 缓存得分，权重或模型变化时版本随之变化
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.services.embedding_cache_service import EmbeddingCache
+from app.utils import lexical
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 缓存键：(查询哈希, 分块 ID, 重排序器版本)
+CacheKey = Tuple[str, int, str]
+
+
+class FallbackScores(list):
+    """重排序失败时回退的原始得分（与重排序得分混合后保持原有排序），不写入得分缓存"""
+
+
+class BaseReranker:
+    """重排序器接口：为每个候选片段给出 0~1 的相关性得分"""
+
+    name = "base"
+    # 得分是否依赖整个候选集（是则候选中有缓存未命中时整组重新评分，不与其他候选集的缓存得分混用）
+    candidate_dependent = False
+
+    @property
+    def version(self) -> str:
+        """重排序器版本（参与缓存键，影响得分的配置变化时应随之变化）"""
+        return self.name
+
+    async def score(self, query: str, candidates: List[Dict[str, Any]], db: Optional[Session] = None) -> List[float]:
+        """
+        计算候选片段的相关性得分
+
+        Args:
+            query: 查询文本
+            candidates: 候选结果（含 id、content）
+            db: 数据库会话（可选，需要读取分块向量时使用）
+
+        Returns:
+            与 candidates 顺序一致的得分列表
+        """
+        raise NotImplementedError
+
+
+class LocalReranker(BaseReranker):
+    """CPU 重排序器：词位覆盖率、BM25、向量余弦相似度的加权和"""
+
+    name = "local"
+    candidate_dependent = True
+
+    @property
+    def version(self) -> str:
+        weights = self._weights()
+        return (
+            f"local-v1:{weights[0]:g}/{weights[1]:g}/{weights[2]:g}:"
+            f"{settings.KEYWORD_SEARCH_BM25_K1:g}/{settings.KEYWORD_SEARCH_BM25_B:g}"
+        )
+
+    @staticmethod
+    def _weights() -> Tuple[float, float, float]:
+        return (
+            settings.RERANK_WEIGHT_OVERLAP,
+            settings.RERANK_WEIGHT_BM25,
+            settings.RERANK_WEIGHT_COSINE
+        )
+
+    async def score(self, query: str, candidates: List[Dict[str, Any]], db: Optional[Session] = None) -> List[float]:
+        if not candidates:
+            return []
+
+        w_overlap, w_bm25, w_cosine = self._weights()
+        features = [self._lexical_features(query, candidates)]
+        weights = [w_overlap, w_bm25]
+
+        cosine = await self._cosine_feature(query, candidates, db) if w_cosine > 0 else None
+        if cosine is not None:
+            features.append(cosine[:, None])
+            weights.append(w_cosine)
+
+        matrix = np.hstack(features)
+        weight_vector = np.asarray(weights, dtype=np.float64)
+        total = weight_vector.sum()
+        if total <= 0:
+            return [0.0] * len(candidates)
+        return (matrix @ weight_vector / total).clip(0.0, 1.0).tolist()
+
+    @staticmethod
+    def _lexical_features(query: str, candidates: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        词位特征：[覆盖率, BM25]，形状 (候选数, 2)
+
+        BM25 的文档频率与平均长度取自候选集，得分按查询的理论最高分归一化到 0~1
+        """
+        terms = lexical.query_terms(query)
+        features = np.zeros((len(candidates), 2), dtype=np.float64)
+        if not terms:
+            return features
+
+        term_positions = {term: i for i, term in enumerate(terms)}
+        tf = np.zeros((len(candidates), len(terms)), dtype=np.float64)
+        lengths = np.zeros(len(candidates), dtype=np.float64)
+        for row, candidate in enumerate(candidates):
+            tokens = lexical.tokenize(candidate.get("content") or "")
+            lengths[row] = len(tokens)
+            for token in tokens:
+                column = term_positions.get(token)
+                if column is not None:
+                    tf[row, column] += 1
+
+        present = tf > 0
+        features[:, 0] = present.mean(axis=1)
+
+        k1 = settings.KEYWORD_SEARCH_BM25_K1
+        b = settings.KEYWORD_SEARCH_BM25_B
+        n = len(candidates)
+        df = present.sum(axis=0)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        avgdl = max(lengths.mean(), 1.0)
+        norm = k1 * (1 - b + b * lengths / avgdl)
+        bm25 = (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+        max_score = (idf * (k1 + 1)).sum()
+        if max_score > 0:
+            features[:, 1] = bm25 / max_score
+        return features
+
+    @staticmethod
+    async def _cosine_feature(
+        query: str,
+        candidates: List[Dict[str, Any]],
+        db: Optional[Session]
+    ) -> Optional[np.ndarray]:
+        """查询向量与分块向量的余弦相似度（查询向量走 Embedding 缓存，分块向量一次查询读取）"""
+        if db is None:
+            return None
+
+        from pgvector.sqlalchemy import Vector
+        from sqlalchemy import text
+        from app.services.llm_service import create_embedding
+
+        try:
+            query_vector = np.asarray(await create_embedding(query), dtype=np.float32)
+            # 近似重复分块不存向量，读取其代表分块的向量
+            statement = text("""
+                SELECT vc.id, rep.embedding
+                FROM vector_chunks vc
+                JOIN vector_chunks rep ON rep.id = COALESCE(vc.duplicate_of_id, vc.id)
+                WHERE vc.id = ANY(:chunk_ids) AND rep.embedding IS NOT NULL
+            """).columns(embedding=Vector(settings.VECTOR_DIMENSION))
+            rows = db.execute(statement, {"chunk_ids": [candidate["id"] for candidate in candidates]}).fetchall()
+        except Exception as e:
+            logger.warning(f"读取分块向量失败，跳过余弦特征: {e}")
+            return None
+
+        embeddings = {row[0]: row[1] for row in rows}
+        matrix = np.zeros((len(candidates), len(query_vector)), dtype=np.float32)
+        for row, candidate in enumerate(candidates):
+            embedding = embeddings.get(candidate["id"])
+            if embedding is not None:
+                matrix[row] = np.asarray(embedding, dtype=np.float32)
+
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        cosine = np.divide(matrix @ query_vector, norms, out=np.zeros(len(candidates), dtype=np.float32), where=norms > 0)
+        return cosine.astype(np.float64).clip(0.0, 1.0)
+
+
+class LLMReranker(BaseReranker):
+    """LLM 重排序器：一次请求为全部候选片段评分"""
+
+    name = "llm"
+
+    @property
+    def version(self) -> str:
+        return f"llm:{settings.IFLOW_MODEL}"
+
+    async def score(self, query: str, candidates: List[Dict[str, Any]], db: Optional[Session] = None) -> List[float]:
+        try:
+            return await self._score_with_llm(query, candidates)
+        except Exception as e:
+            # LLM 调用失败或返回无法解析时保持原有排序
+            logger.warning(f"LLM 重排序失败，使用原始得分: {e}")
+            return FallbackScores(float(candidate.get("score", 0.0)) for candidate in candidates)
+
+    @staticmethod
+    async def _score_with_llm(query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        """一次 LLM 请求为全部候选片段评分（未评分的片段记为 0.5）"""
+        from app.services.llm_service import get_llm
+        from app.utils.prompt_loader import PromptLoader
+
+        llm = await get_llm()
+
+        # 构建重排序 prompt
+        candidates_text = ""
+        for i, candidate in enumerate(candidates):
+            candidates_text += f"\n{i+1}. {candidate['content']}\n"
+
+        # 加载提示词模板
+        prompt = PromptLoader.format_prompt(
+            'rerank_results',
+            query=query,
+            candidates_text=candidates_text,
+            num_candidates=len(candidates)
+        )
+
+        response = await llm.generate_text(prompt, temperature=0.3)
+
+        # 去除可能存在的 markdown 代码块标记
+        response = response.strip()
+        if response.startswith("```json"):
+            response = response[7:]
+        elif response.startswith("```"):
+            response = response[3:]
+        if response.endswith("```"):
+            response = response[:-3]
+        response = response.strip()
+
+        # 解析响应
+        scores = [0.5] * len(candidates)
+        for score_info in json.loads(response):
+            idx = score_info.get('index', 0) - 1
+            if 0 <= idx < len(candidates):
+                scores[idx] = float(score_info.get('score', 0.5))
+        return scores
+
+
+class RerankScoreCache:
+    """重排序得分 LRU 缓存"""
+
+    def __init__(self, max_items: int = 50000):
+        self.max_items = max_items
+        self._scores: "OrderedDict[CacheKey, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def query_hash(query: str) -> str:
+        """归一化查询的哈希"""
+        return hashlib.sha256(EmbeddingCache.normalize_text(query).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[CacheKey]) -> Dict[CacheKey, float]:
+        """批量读取缓存"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                score = self._scores.get(key)
+                if score is None:
+                    self._stats["misses"] += 1
+                    continue
+                self._scores.move_to_end(key)
+                found[key] = score
+                self._stats["hits"] += 1
+        return found
+
+    def put_many(self, items: Dict[CacheKey, float]):
+        """批量写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            for key, score in items.items():
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_items:
+                self._scores.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, float]:
+        """获取缓存命中统计"""
+        total = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "requests": total,
+            "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+            "items": len(self._scores),
+            "max_items": self.max_items
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._scores.clear()
+
+
+_RERANKERS = {
+    LocalReranker.name: LocalReranker(),
+    LLMReranker.name: LLMReranker()
+}
+
+
+def get_reranker(name: Optional[str] = None) -> BaseReranker:
+    """
+    获取重排序器
+
+    Args:
+        name: 重排序器名称（local / llm，默认使用 RERANKER 配置）
+
+    Returns:
+        重排序器实例
+    """
+    name = (name or settings.RERANKER).lower()
+    if name not in _RERANKERS:
+        raise ValueError(f"不支持的重排序器: {name}")
+    return _RERANKERS[name]
+
+
+# 全局重排序得分缓存实例
+rerank_score_cache = RerankScoreCache(max_items=settings.RERANK_CACHE_MAX_ITEMS)
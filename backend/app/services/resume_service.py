@@ -16,7 +16,7 @@ class ResumeParser:
     @staticmethod
     def _extract_text_with_unstructured(file_path: str) -> str:
         """
-        提取文档文本 - 使用多种方法
+        提取文档文本 - 使用多种方法（统一提取器，按文件内容缓存）
 
         Args:
             file_path: 文档文件路径
@@ -24,93 +24,8 @@ class ResumeParser:
         Returns:
             提取的文本内容
         """
-        file_ext = os.path.splitext(file_path)[1].lower()
-        logger.info(f"开始提取文档文本，文件类型: {file_ext}")
-
-        # 1. 优先处理文本文件
-        if file_ext == '.txt':
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
-                logger.info(f"成功提取文本文件，共 {len(text_content)} 字符")
-                return text_content
-            except UnicodeDecodeError:
-                # 尝试其他编码
-                try:
-                    with open(file_path, 'r', encoding='gbk') as f:
-                        text_content = f.read()
-                    logger.info(f"成功提取文本文件（GBK编码），共 {len(text_content)} 字符")
-                    return text_content
-                except Exception as e:
-                    logger.error(f"文本文件读取失败: {e}")
-                    raise Exception(f"文本文件读取失败: {str(e)}")
-
-        # 2. 处理 PDF 文件
-        if file_ext == '.pdf':
-            try:
-                import pdfplumber
-                text_content = ""
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages:
-                        # 提取文本，保持布局顺序
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_content += page_text + "\n"
-                        
-                        # 提取表格（PDF 中的表格信息）
-                        tables = page.extract_tables()
-                        if tables:
-                            for table in tables:
-                                for row in table:
-                                    row_text = " | ".join([str(cell) if cell else "" for cell in row])
-                                    if row_text.strip():
-                                        text_content += row_text + "\n"
-                logger.info(f"pdfplumber 成功提取 PDF，共 {len(text_content)} 字符，{len(pdf.pages)} 页")
-                return text_content
-            except ImportError:
-                logger.warning("pdfplumber 未安装，尝试使用 pypdf")
-                # 回退到 pypdf
-                try:
-                    import pypdf
-                    reader = pypdf.PdfReader(file_path)
-                    text_content = ""
-                    for page in reader.pages:
-                        text_content += page.extract_text() + "\n"
-                    logger.info(f"pypdf 成功提取 PDF，共 {len(text_content)} 字符，{len(reader.pages)} 页")
-                    return text_content
-                except Exception as e:
-                    logger.error(f"pypdf 也失败: {e}")
-            except Exception as e:
-                logger.error(f"PDF 提取失败: {e}")
-
-        # 3. 处理 Word 文件
-        if file_ext in ['.docx', '.doc']:
-            try:
-                import docx2txt
-                text_content = docx2txt.process(file_path)
-                logger.info(f"docx2txt 成功提取 Word 文档，共 {len(text_content)} 字符")
-                return text_content
-            except ImportError:
-                logger.warning("docx2txt 未安装，尝试使用其他方法")
-            except Exception as e:
-                logger.error(f"Word 文档提取失败: {e}")
-
-        # 4. 尝试使用 unstructured（处理其他格式）
-        try:
-            from unstructured.partition.auto import partition
-            elements = partition(filename=file_path)
-            text_content = ""
-            for element in elements:
-                text_content += str(element) + "\n"
-            logger.info(f"unstructured.io 成功提取，共 {len(text_content)} 字符，{len(elements)} 个元素")
-            return text_content
-        except ImportError:
-            logger.warning("unstructured 未安装")
-        except Exception as e:
-            logger.warning(f"unstructured 提取失败: {e}")
-
-        # 5. 如果所有方法都失败，返回错误
-        raise Exception(f"无法提取文件 {file_ext} 的文本内容，请检查文件格式或安装相应的依赖库")
+        from app.services.document_text_service import document_text_extractor
+        return document_text_extractor.extract_sync(file_path, mode="raw")
 
     @staticmethod
     def parse_resume(file_path: str) -> Dict[str, Any]:
@@ -654,8 +569,9 @@ async def parse_resume_with_llm(file_path: str, llm_service) -> Dict[str, Any]:
     logger.info(f"开始使用 LLM 解析简历文件: {file_path}")
 
     try:
-        # 1. 提取原始文本内容
-        text_content = ResumeParser._extract_text_with_unstructured(file_path)
+        # 1. 提取原始文本内容（进程池解析，同一文件只解析一次）
+        from app.services.document_text_service import document_text_extractor
+        text_content = await document_text_extractor.extract(file_path, mode="raw")
         logger.info(f"原始文本提取完成，长度: {len(text_content)} 字符")
 
         from app.utils.prompt_loader import PromptLoader
@@ -670,7 +586,8 @@ async def parse_resume_with_llm(file_path: str, llm_service) -> Dict[str, Any]:
         full_response = await llm_service.parse_document(
             file_path=file_path,
             prompt=full_parse_prompt,
-            temperature=0.3
+            temperature=0.3,
+            text_content=text_content
         )
 
         logger.info(f"LLM 文档解析完成，响应长度: {len(full_response)} 字符")
@@ -0,0 +1,215 @@
+"""
+知识库检索结果缓存
+按 (用户, 归一化查询, top_k, 检索选项) 缓存 search_knowledge 的结果，条目记录写入时用户知识库的版本：
+- 数据库版本号（knowledge_corpus_versions）：知识库文档新增、修改（状态、分类、分段）、删除时，
+  在同一事务中递增该用户的版本号；由 ORM 会话事件维护，覆盖所有经 ORM 修改 knowledge_documents 的路径。
+  检索开始前读取，多进程部署时其他进程的修改提交后即失效
+- 进程内版本号：进程内索引（关键词索引、numpy 向量后端）在事务提交后才更新，更新后递增，
+  避免两者之间开始的检索按新版本缓存旧索引的结果（索引各进程独立，版本号也只在本进程有效）
+- 版本不一致的条目读取时即失效；进程内 LRU，按条目数与估算内存双重上限淘汰，TTL 兜底
+"""
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.models.knowledge import KnowledgeCorpusVersion, KnowledgeDocument
+from app.services.embedding_cache_service import EmbeddingCache
+from config import settings
+
+# 会话信息中记录本事务已递增数据库版本号的用户（同一事务只递增一次）
+_BUMPED_USERS_KEY = "knowledge_bumped_users"
+
+# 缓存版本：(数据库版本号, 进程内版本号)
+CacheVersion = Tuple[int, int]
+
+# 估算内存时每个条目 / 每条结果的固定开销（字典、元组、数字对象）
+_ENTRY_OVERHEAD_BYTES = 400
+_RESULT_OVERHEAD_BYTES = 600
+
+
+class SearchResultCache:
+    """带版本号的检索结果 LRU 缓存"""
+
+    def __init__(self, max_entries: int = 2000, memory_mb: int = 64, ttl_seconds: int = 600):
+        self.max_entries = max_entries
+        self.max_bytes = memory_mb * 1024 * 1024
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[CacheVersion, float, int, List[Dict[str, Any]]]]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "expired": 0,
+            "evictions": 0
+        }
+
+    @staticmethod
+    def make_key(user_id: int, query: str, top_k: int, **options: Any) -> Hashable:
+        """
+        生成缓存键
+
+        Args:
+            user_id: 用户 ID
+            query: 查询文本（NFKC 归一化并折叠空白）
+            top_k: 返回结果数量
+            **options: 影响结果的检索选项（列表按集合处理）
+
+        Returns:
+            缓存键
+        """
+        normalized = tuple(sorted(
+            (name, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+            for name, value in options.items()
+        ))
+        return (user_id, EmbeddingCache.normalize_text(query), top_k, normalized)
+
+    def version(self, db: Session, user_id: int) -> CacheVersion:
+        """
+        用户知识库的当前版本（检索开始前读取，读取与写入缓存时使用）
+
+        Args:
+            db: 数据库会话
+            user_id: 用户 ID
+
+        Returns:
+            (数据库版本号, 进程内版本号)
+        """
+        corpus_version = db.query(KnowledgeCorpusVersion.version).filter(
+            KnowledgeCorpusVersion.user_id == user_id
+        ).scalar()
+        return corpus_version or 0, self._versions.get(user_id, 0)
+
+    def bump(self, user_id: Optional[int]):
+        """递增用户的进程内版本号，该用户已缓存的结果全部失效（user_id 为 None 时忽略）"""
+        if user_id is None:
+            return
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def get(self, key: Hashable, version: CacheVersion) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取缓存（版本不一致或已过期视为未命中）
+
+        Args:
+            key: 缓存键
+            version: 检索开始前读取的版本
+
+        Returns:
+            检索结果副本，未命中时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            entry_version, expires_at, _, results = entry
+            if entry_version != version or expires_at < time.monotonic():
+                self._stats["stale" if entry_version != version else "expired"] += 1
+                self._stats["misses"] += 1
+                self._discard(key)
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return [dict(result) for result in results]
+
+    def put(self, key: Hashable, version: CacheVersion, results: List[Dict[str, Any]]):
+        """
+        写入缓存（检索期间进程内索引已更新时不写入；数据库版本号已变化时条目写入后不会再命中）
+
+        Args:
+            key: 缓存键
+            version: 检索开始前读取的版本
+            results: 检索结果
+        """
+        size = _ENTRY_OVERHEAD_BYTES + sum(
+            _RESULT_OVERHEAD_BYTES + len(result.get("content") or "") * 4 + len(result.get("source") or "") * 4
+            for result in results
+        )
+        with self._lock:
+            if version[1] != self._versions.get(key[0], 0) or size > self.max_bytes:
+                return
+            self._discard(key)
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, size, [dict(r) for r in results])
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        total = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "requests": total,
+            "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_bytes": self._bytes,
+            "max_memory_bytes": self.max_bytes
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+# 全局检索结果缓存实例
+search_cache = SearchResultCache(
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    memory_mb=settings.SEARCH_CACHE_MEMORY_MB,
+    ttl_seconds=settings.SEARCH_CACHE_TTL_SECONDS
+)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_users(session: Session, flush_context):
+    """本次刷新中新增、修改、删除了知识库文档的用户，在同一事务中递增其数据库版本号"""
+    bumped = session.info.setdefault(_BUMPED_USERS_KEY, set())
+    changed = {
+        obj.user_id
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, KnowledgeDocument) and obj.user_id is not None
+    } - bumped
+    if not changed:
+        return
+
+    # 按用户 ID 顺序加锁，避免并发事务死锁
+    connection = session.connection()
+    for user_id in sorted(changed):
+        connection.execute(
+            text("""
+                INSERT INTO knowledge_corpus_versions (user_id, version)
+                VALUES (:user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = knowledge_corpus_versions.version + 1
+            """),
+            {"user_id": user_id}
+        )
+    bumped.update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _reset_bumped_users(session: Session):
+    session.info.pop(_BUMPED_USERS_KEY, None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_bumped_users(session: Session):
+    session.info.pop(_BUMPED_USERS_KEY, None)
@@ -0,0 +1,714 @@
+"""
+向量检索后端（VECTOR_BACKEND 配置）
+- PgVectorBackend（默认，pgvector）：向量距离在数据库中计算，检索 SQL 由 RAGService 构建
+- NumpyVectorBackend（numpy）：每个用户一个归一化 float16 矩阵，存放在内存映射文件中，
+  检索时一次矩阵-向量乘法 + argpartition 取 Top-K（精确检索），只为命中的分块回表读取内容
+
+NumpyVectorBackend 适合单用户分块数较少（数万以内）的部署，省去数据库向量扫描：
+- 文档入库、重新分段、删除、修改分类时增量更新；删除只标记槽位失效，失效过半时压缩
+- 近似重复分块使用代表分块的向量，检索时每组只保留一个槽位（与数据库检索的代表规则一致）
+- 元数据（分块 ID、组 ID、所属文档、分类、存活标记）与矩阵一起落盘，加载时用（分块数, 最大分块 ID）
+  校验是否与数据库一致，不一致则从数据库重建
+- 活跃用户在内存中保留一份 float32 工作副本（float16 转换比矩阵乘法本身慢数倍，不在每次检索时转换），
+  按内存预算 LRU 释放冷用户的副本并关闭映射（文件保留，下次检索时重新映射）
+- VECTOR_QUANTIZATION 为 int8（每行一个缩放系数）/ binary（符号位打包）时工作副本分别缩小为 1/4、1/32，
+  先按量化得分取 Top-K × VECTOR_RESCORE_FACTOR 个候选，再从 float16 矩阵读取候选向量重新打分
+
+多进程部署时各进程的索引独立维护，检索结果总是回表校验分块状态，索引滞后只会漏召回，不会返回已删除的分块
+"""
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from pgvector.sqlalchemy import Vector
+
+from app.services.search_cache_service import search_cache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 元数据格式版本（结构变化时递增，旧文件自动失效）
+META_VERSION = 3
+
+# 矩阵初始容量（行）与每次读写矩阵文件的行数
+_INITIAL_CAPACITY = 1024
+_BLOCK_ROWS = 8192
+
+# 检索命中：[(分块 ID, 余弦相似度)]，按相似度降序
+Hits = List[Tuple[int, float]]
+
+# 字节中置位的数量（二值量化的汉明距离）
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+class VectorBackend:
+    """向量检索后端接口"""
+
+    name = "base"
+
+    # 为 True 时向量距离在数据库中计算（RAGService 直接构建 pgvector SQL），search 不会被调用
+    in_database = False
+
+    def search(
+        self,
+        db: Session,
+        user_id: int,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Hits]:
+        """
+        检索用户的分块向量
+
+        Args:
+            db: 数据库会话（索引未加载时用于构建）
+            user_id: 用户 ID
+            query_embeddings: 查询向量列表
+            top_k: 每个查询返回结果数量
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+
+        Returns:
+            与 query_embeddings 顺序一致的命中列表
+        """
+        raise NotImplementedError
+
+    def refresh_document(self, db: Session, document_id: int):
+        """按数据库中的当前状态刷新文档的分块向量（入库、重新分段完成后调用）"""
+
+    def remove_document(self, document_id: int, user_id: Optional[int] = None):
+        """移除文档的分块向量（删除文档或其分块时调用）"""
+
+    def set_document_category(self, user_id: int, document_id: int, category: str):
+        """更新文档分类"""
+
+    def close(self):
+        """服务关闭时释放资源"""
+
+
+class PgVectorBackend(VectorBackend):
+    """pgvector：分块向量与 HNSW/IVFFlat 索引由数据库维护，无需增量更新"""
+
+    name = "pgvector"
+    in_database = True
+
+
+class UserVectorIndex:
+    """单个用户的内存映射向量矩阵"""
+
+    def __init__(self, user_id: int, dimension: int, path: str, quantization: str = "none", rescore_factor: int = 4):
+        self.user_id = user_id
+        self.dimension = dimension
+        self.path = path
+        # 工作副本的量化方式：none / halfvec（float32）、int8、binary
+        self.quantization = quantization if quantization in ("int8", "binary") else "none"
+        self.rescore_factor = max(rescore_factor, 1)
+        self.capacity = 0
+        self.size = 0
+        self.matrix: Optional[np.memmap] = None
+        # 工作副本（首次检索时从矩阵文件转换，与矩阵同容量）与 int8 量化的每行缩放系数
+        self.resident: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        # 槽位数据（槽位即矩阵行号）
+        self.chunk_ids = np.zeros(0, dtype=np.int64)
+        self.groups = np.zeros(0, dtype=np.int64)
+        self.documents = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        # 文档 -> 分类
+        self.categories: Dict[int, str] = {}
+        self.live_count = 0
+
+    @property
+    def matrix_path(self) -> str:
+        return f"{self.path}.f16"
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self.path}.meta"
+
+    def add_document(
+        self,
+        document_id: int,
+        category: str,
+        rows: Iterable[Tuple[int, int, np.ndarray]],
+        save: bool = True
+    ):
+        """
+        写入文档的分块向量（已存在的文档先移除旧分块）
+
+        Args:
+            document_id: 文档 ID
+            category: 文档分类
+            rows: (分块 ID, 组 ID, 向量)；组 ID 为近似重复分块的代表分块 ID（向量取自代表分块），其他分块为自身 ID
+            save: 是否立即写入元数据（批量构建时最后统一写入）
+        """
+        self.remove_document(document_id, save=False)
+        rows = list(rows)
+        if rows:
+            vectors = np.asarray([vector for _, _, vector in rows], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+            self._reserve(self.size + len(rows))
+            start, end = self.size, self.size + len(rows)
+            self.matrix[start:end] = vectors.astype(np.float16)
+            if self.resident is not None:
+                self._encode(start, end)
+            self.chunk_ids[start:end] = [chunk_id for chunk_id, _, _ in rows]
+            self.groups[start:end] = [group_id for _, group_id, _ in rows]
+            self.documents[start:end] = document_id
+            self.alive[start:end] = True
+            self.size = end
+            self.live_count += len(rows)
+            self.categories[document_id] = category
+        if save:
+            self.save()
+
+    def remove_document(self, document_id: int, save: bool = True) -> bool:
+        """标记文档的分块失效，失效槽位过半时压缩"""
+        self.categories.pop(document_id, None)
+        slots = np.flatnonzero(self.alive[:self.size] & (self.documents[:self.size] == document_id))
+        if not len(slots):
+            return False
+
+        self.alive[slots] = False
+        self.live_count -= len(slots)
+        if self.size - self.live_count > max(self.live_count, _INITIAL_CAPACITY):
+            self.compact()
+        elif save:
+            self.save()
+        return True
+
+    def set_category(self, document_id: int, category: str):
+        if document_id in self.categories:
+            self.categories[document_id] = category
+            self.save()
+
+    def compact(self):
+        """移除失效槽位（重写矩阵文件）"""
+        keep = np.flatnonzero(self.alive[:self.size])
+        capacity = max(_INITIAL_CAPACITY, len(keep) * 2)
+        self._rewrite(capacity, keep)
+        self.chunk_ids = self._resized(self.chunk_ids[keep], capacity)
+        self.groups = self._resized(self.groups[keep], capacity)
+        self.documents = self._resized(self.documents[keep], capacity)
+        self.alive = self._resized(self.alive[keep], capacity)
+        self.size = len(keep)
+        self.save()
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Hits]:
+        """
+        精确检索：float32 工作副本与全部查询向量一次相乘，再用 argpartition 取 Top-K；
+        量化时先按量化得分取候选，再用 float16 矩阵中的候选向量重新打分
+
+        Args:
+            queries: 归一化查询矩阵 (查询数, 维度)
+            top_k: 每个查询返回结果数量
+            document_ids: 只在这些文档中检索（可选）
+            category: 只在该分类的文档中检索（可选）
+
+        Returns:
+            与 queries 顺序一致的命中列表
+        """
+        if not self.live_count or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        mask = self.alive[:self.size].copy()
+        if document_ids:
+            mask &= np.isin(self.documents[:self.size], np.asarray(document_ids, dtype=np.int32))
+        if category:
+            allowed = [document_id for document_id, value in self.categories.items() if value == category]
+            mask &= np.isin(self.documents[:self.size], np.asarray(allowed, dtype=np.int32))
+        mask = self._group_representatives(mask)
+
+        scores = self._scores(queries)
+        scores[:, ~mask] = -np.inf
+
+        live = int(mask.sum())
+        k = min(top_k, live)
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+        candidate_k = k if self.quantization == "none" else min(k * self.rescore_factor, live)
+
+        hits = []
+        for query, row in zip(queries, scores):
+            top = np.argpartition(-row, candidate_k - 1)[:candidate_k]
+            if self.quantization != "none":
+                top = np.sort(top)
+                row = np.full(self.size, -np.inf, dtype=np.float32)
+                row[top] = np.asarray(self.matrix[top], dtype=np.float32) @ query
+                top = top[np.argpartition(-row[top], k - 1)[:k]]
+            top = top[np.argsort(-row[top], kind="stable")]
+            hits.append([(int(self.chunk_ids[slot]), float(row[slot])) for slot in top])
+        return hits
+
+    def _group_representatives(self, mask: np.ndarray) -> np.ndarray:
+        """
+        近似重复组只保留一个检索范围内的槽位：代表分块优先，其次 ID 最小的重复分块
+        （组内向量相同，保留哪个槽位不影响得分）
+        """
+        chunk_ids = self.chunk_ids[:self.size]
+        groups = self.groups[:self.size]
+        duplicate_groups = np.unique(groups[mask & (groups != chunk_ids)])
+        if not len(duplicate_groups):
+            return mask
+
+        members = np.flatnonzero(mask & np.isin(groups, duplicate_groups))
+        members = members[np.lexsort((
+            chunk_ids[members], groups[members] != chunk_ids[members], groups[members]
+        ))]
+        member_groups = groups[members]
+        first = np.r_[True, member_groups[1:] != member_groups[:-1]]
+        mask[members[~first]] = False
+        return mask
+
+    def signature(self) -> Tuple[int, int]:
+        """索引内容签名（与数据库中可检索分块的数量、最大 ID 比较；最大 ID 只统计有效槽位）"""
+        if not self.live_count:
+            return 0, 0
+        return self.live_count, int(self.chunk_ids[:self.size][self.alive[:self.size]].max())
+
+    def memory_bytes(self) -> int:
+        """估算常驻内存（工作副本与槽位数据，映射文件的页由操作系统管理）"""
+        resident = self.resident.nbytes if self.resident is not None else 0
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return resident + scales + self.capacity * 21
+
+    def file_bytes(self) -> int:
+        """矩阵文件大小（字节）"""
+        return self.capacity * self.dimension * 2
+
+    def save(self):
+        """刷新矩阵并写入元数据（先写临时文件再替换）"""
+        if self.matrix is not None:
+            self.matrix.flush()
+        meta = {
+            "version": META_VERSION,
+            "user_id": self.user_id,
+            "dimension": self.dimension,
+            "capacity": self.capacity,
+            "size": self.size,
+            "chunk_ids": self.chunk_ids[:self.size].tobytes(),
+            "groups": self.groups[:self.size].tobytes(),
+            "documents": self.documents[:self.size].tobytes(),
+            "alive": self.alive[:self.size].tobytes(),
+            "categories": self.categories,
+            "live_count": self.live_count
+        }
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.meta_path)
+
+    @classmethod
+    def load(cls, user_id: int, dimension: int, path: str, **options) -> Optional["UserVectorIndex"]:
+        """从元数据与矩阵文件加载（格式、维度不符或文件缺失时返回 None）"""
+        index = cls(user_id, dimension, path, **options)
+        if not os.path.exists(index.meta_path) or not os.path.exists(index.matrix_path):
+            return None
+        with open(index.meta_path, "rb") as f:
+            meta = pickle.load(f)
+        if meta.get("version") != META_VERSION or meta.get("dimension") != dimension:
+            return None
+
+        index.capacity = meta["capacity"]
+        index.size = meta["size"]
+        if os.path.getsize(index.matrix_path) != index.capacity * dimension * 2:
+            return None
+        index.matrix = np.memmap(index.matrix_path, dtype=np.float16, mode="r+", shape=(index.capacity, dimension))
+        index.chunk_ids = cls._resized(np.frombuffer(meta["chunk_ids"], dtype=np.int64), index.capacity)
+        index.groups = cls._resized(np.frombuffer(meta["groups"], dtype=np.int64), index.capacity)
+        index.documents = cls._resized(np.frombuffer(meta["documents"], dtype=np.int32), index.capacity)
+        index.alive = cls._resized(np.frombuffer(meta["alive"], dtype=bool), index.capacity)
+        index.categories = meta["categories"]
+        index.live_count = meta["live_count"]
+        return index
+
+    def close(self):
+        """释放工作副本并关闭矩阵映射（文件保留）"""
+        self.resident = None
+        self.scales = None
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+
+    def drop(self):
+        """关闭映射并删除文件"""
+        self.resident = None
+        self.scales = None
+        self.matrix = None
+        for path in (self.matrix_path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _reserve(self, rows: int):
+        """容量不足时按两倍扩容（重写矩阵文件）"""
+        if self.matrix is not None and rows <= self.capacity:
+            return
+        capacity = max(_INITIAL_CAPACITY, self.capacity * 2, rows)
+        self._rewrite(capacity, np.arange(self.size))
+        self.chunk_ids = self._resized(self.chunk_ids, capacity)
+        self.groups = self._resized(self.groups, capacity)
+        self.documents = self._resized(self.documents, capacity)
+        self.alive = self._resized(self.alive, capacity)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """查询与全部槽位的得分 (查询数, 槽位数)：余弦相似度，int8 为近似值，binary 为负汉明距离"""
+        if self.resident is None:
+            self._build_resident()
+
+        if self.quantization == "none":
+            return queries @ self.resident[:self.size].T
+
+        scores = np.empty((len(queries), self.size), dtype=np.float32)
+        if self.quantization == "int8":
+            # 按行块转换为 float32 后相乘（numpy 的整数矩阵乘法没有 BLAS 加速）
+            block = np.empty((min(_BLOCK_ROWS, self.size), self.dimension), dtype=np.float32)
+            for start in range(0, self.size, _BLOCK_ROWS):
+                end = min(start + _BLOCK_ROWS, self.size)
+                np.copyto(block[:end - start], self.resident[start:end], casting="unsafe")
+                scores[:, start:end] = (queries @ block[:end - start].T) * self.scales[start:end]
+        else:
+            bits = np.packbits(queries > 0, axis=1)
+            for row, query_bits in enumerate(bits):
+                distance = _POPCOUNT[np.bitwise_xor(self.resident[:self.size], query_bits)].sum(axis=1, dtype=np.int32)
+                scores[row] = -distance
+        return scores
+
+    def _build_resident(self):
+        """按行块从矩阵文件创建工作副本"""
+        if self.quantization == "int8":
+            self.resident = np.zeros((self.capacity, self.dimension), dtype=np.int8)
+            self.scales = np.zeros(self.capacity, dtype=np.float32)
+        elif self.quantization == "binary":
+            self.resident = np.zeros((self.capacity, (self.dimension + 7) // 8), dtype=np.uint8)
+        else:
+            self.resident = np.zeros((self.capacity, self.dimension), dtype=np.float32)
+        for start in range(0, self.size, _BLOCK_ROWS):
+            self._encode(start, min(start + _BLOCK_ROWS, self.size))
+
+    def _encode(self, start: int, end: int):
+        """将矩阵文件的 [start, end) 行写入工作副本"""
+        if self.quantization == "none":
+            self.resident[start:end] = self.matrix[start:end]
+            return
+
+        vectors = np.asarray(self.matrix[start:end], dtype=np.float32)
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            self.resident[start:end] = np.rint(vectors / scales[:, None])
+            self.scales[start:end] = scales
+        else:
+            self.resident[start:end] = np.packbits(vectors > 0, axis=1)
+
+    def _rewrite(self, capacity: int, slots: np.ndarray):
+        """将指定槽位的向量写入新容量的矩阵文件并重新映射（工作副本在下次检索时重建）"""
+        tmp_path = f"{self.matrix_path}.tmp"
+        matrix = np.memmap(tmp_path, dtype=np.float16, mode="w+", shape=(capacity, self.dimension))
+        for start in range(0, len(slots), _BLOCK_ROWS):
+            block = slots[start:start + _BLOCK_ROWS]
+            matrix[start:start + len(block)] = self.matrix[block]
+        matrix.flush()
+        del matrix
+        self.resident = None
+        self.scales = None
+        self.matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float16, mode="r+", shape=(capacity, self.dimension))
+        self.capacity = capacity
+
+    @staticmethod
+    def _resized(values: np.ndarray, capacity: int) -> np.ndarray:
+        resized = np.zeros(capacity, dtype=values.dtype)
+        resized[:min(len(values), capacity)] = values[:capacity]
+        return resized
+
+
+class NumpyVectorBackend(VectorBackend):
+    """
+    按用户管理内存映射向量矩阵：按需加载（文件或数据库）、增量更新、LRU 关闭冷用户
+
+    每个用户一把锁，保护该用户矩阵的加载、构建、检索与增量更新；管理器的锁只保护已加载矩阵的字典，
+    从数据库构建矩阵、矩阵乘法都不持有管理器的锁，某个用户的冷启动构建不阻塞其他用户的检索。
+    加锁顺序为先用户锁、后管理器锁；淘汰时以非阻塞方式获取被淘汰用户的锁，正在使用的矩阵不淘汰
+    """
+
+    name = "numpy"
+
+    def __init__(
+        self,
+        memory_budget_mb: int = 512,
+        index_dir: str = "./uploads/vector_index",
+        quantization: str = "none",
+        rescore_factor: int = 4
+    ):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.index_dir = index_dir
+        self.index_options = {"quantization": quantization, "rescore_factor": rescore_factor}
+        self._indexes: "OrderedDict[int, UserVectorIndex]" = OrderedDict()
+        self._user_locks: Dict[int, threading.RLock] = {}
+        self._lock = threading.Lock()
+
+    def search(
+        self,
+        db: Session,
+        user_id: int,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        document_ids: Optional[List[int]] = None,
+        category: Optional[str] = None
+    ) -> List[Hits]:
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+
+        with self._user_lock(user_id):
+            index = self._get_index(db, user_id)
+            hits = index.search(queries, top_k, document_ids=document_ids, category=category)
+        # 首次检索会创建工作副本，按内存预算重新检查
+        self._evict()
+        return hits
+
+    def refresh_document(self, db: Session, document_id: int):
+        try:
+            owner = db.execute(
+                text("SELECT user_id, category FROM knowledge_documents WHERE id = :document_id"),
+                {"document_id": document_id}
+            ).first()
+            if owner is None:
+                search_cache.bump(self._remove_from_loaded(document_id))
+                return
+
+            user_id, category = owner
+            with self._user_lock(user_id):
+                index = self._loaded(user_id)
+                if index is None:
+                    # 未加载时删除元数据，下次加载时从数据库重建
+                    self._drop_files(user_id)
+                else:
+                    index.add_document(document_id, category, (
+                        (row[2], row[3], row[4]) for row in self._load_vectors(db, user_id, document_id)
+                    ))
+            self._evict()
+            search_cache.bump(user_id)
+        except Exception as e:
+            logger.error(f"刷新向量索引失败: 文档 {document_id} - {e}")
+
+    def remove_document(self, document_id: int, user_id: Optional[int] = None):
+        if user_id is None:
+            search_cache.bump(self._remove_from_loaded(document_id))
+            return
+
+        with self._user_lock(user_id):
+            index = self._loaded(user_id)
+            if index is not None:
+                index.remove_document(document_id)
+            else:
+                self._drop_files(user_id)
+        search_cache.bump(user_id)
+
+    def set_document_category(self, user_id: int, document_id: int, category: str):
+        with self._user_lock(user_id):
+            index = self._loaded(user_id)
+            if index is not None:
+                index.set_category(document_id, category)
+            else:
+                self._drop_files(user_id)
+        search_cache.bump(user_id)
+
+    def close(self):
+        with self._lock:
+            indexes = list(self._indexes.values())
+            self._indexes.clear()
+        for index in indexes:
+            with self._user_lock(index.user_id):
+                index.close()
+
+    def _user_lock(self, user_id: int) -> threading.RLock:
+        """用户矩阵的锁（不存在时创建）"""
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = threading.RLock()
+            return lock
+
+    def _loaded(self, user_id: int) -> Optional[UserVectorIndex]:
+        """已加载的用户矩阵（调用方持有该用户的锁）"""
+        with self._lock:
+            return self._indexes.get(user_id)
+
+    def _remove_from_loaded(self, document_id: int) -> Optional[int]:
+        """从已加载的矩阵中移除文档，返回文档所属用户（不在已加载的矩阵中时为 None）"""
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            with self._user_lock(index.user_id):
+                if index.remove_document(document_id):
+                    return index.user_id
+        return None
+
+    def _get_index(self, db: Session, user_id: int) -> UserVectorIndex:
+        """
+        获取用户矩阵：已映射 > 有效的索引文件 > 从数据库构建（调用方持有该用户的锁）
+
+        读取数据库与构建矩阵不持有管理器的锁，完成后再放入已加载的矩阵
+        """
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index
+
+        signature = self._database_signature(db, user_id)
+        index = None
+        try:
+            index = UserVectorIndex.load(user_id, settings.VECTOR_DIMENSION, self._index_path(user_id), **self.index_options)
+        except Exception as e:
+            logger.warning(f"读取向量索引失败: 用户 {user_id} - {e}")
+        if index is None or index.signature() != signature:
+            if index is not None:
+                index.close()
+            index = self._build(db, user_id)
+
+        with self._lock:
+            self._indexes[user_id] = index
+        return index
+
+    @staticmethod
+    def _database_signature(db: Session, user_id: int) -> Tuple[int, int]:
+        from app.services.rag_service import RAGService
+
+        conditions, params = RAGService._searchable_chunk_filter(user_id)
+        count, max_id = db.execute(
+            text(f"""
+                SELECT COUNT(*), COALESCE(MAX(vc.id), 0)
+                FROM vector_chunks vc
+                JOIN vector_chunks rep ON rep.id = COALESCE(vc.duplicate_of_id, vc.id)
+                WHERE {conditions} AND rep.embedding IS NOT NULL
+            """),
+            params
+        ).first()
+        return int(count), int(max_id)
+
+    @staticmethod
+    def _load_vectors(
+        db: Session,
+        user_id: int,
+        document_id: Optional[int] = None
+    ) -> List[Tuple[int, str, int, int, np.ndarray]]:
+        """
+        读取可检索分块的 (文档 ID, 分类, 分块 ID, 组 ID, 向量)，按文档、分块 ID 排序
+
+        近似重复分块不存向量，读取其代表分块的向量（代表分块可以不在检索范围内）
+        """
+        from app.services.rag_service import RAGService
+
+        conditions, params = RAGService._searchable_chunk_filter(user_id)
+        if document_id is not None:
+            conditions += " AND vc.document_id = :document_id"
+            params["document_id"] = document_id
+        statement = text(f"""
+            SELECT vc.document_id, vc.category, vc.id, rep.id AS group_id, rep.embedding
+            FROM vector_chunks vc
+            JOIN vector_chunks rep ON rep.id = COALESCE(vc.duplicate_of_id, vc.id)
+            WHERE {conditions} AND rep.embedding IS NOT NULL
+            ORDER BY vc.document_id, vc.id
+        """).columns(embedding=Vector(settings.VECTOR_DIMENSION))
+        return [
+            (row[0], row[1], row[2], row[3], np.asarray(row[4], dtype=np.float32))
+            for row in db.execute(statement, params)
+        ]
+
+    def _build(self, db: Session, user_id: int) -> UserVectorIndex:
+        """从数据库构建用户矩阵（一次读取全部向量，按文档分组写入）"""
+        rows = self._load_vectors(db, user_id)
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        index = UserVectorIndex(user_id, settings.VECTOR_DIMENSION, self._index_path(user_id), **self.index_options)
+        index.drop()
+        index.compact()
+        start = 0
+        while start < len(rows):
+            document_id, category = rows[start][0], rows[start][1]
+            end = start
+            while end < len(rows) and rows[end][0] == document_id:
+                end += 1
+            index.add_document(document_id, category, ((row[2], row[3], row[4]) for row in rows[start:end]), save=False)
+            start = end
+        index.save()
+        logger.info(f"向量索引已构建: 用户 {user_id}，{index.live_count} 个分块")
+        return index
+
+    def _evict(self):
+        """超出内存预算时关闭最久未使用的矩阵（至少保留最近使用的一个，正在使用的矩阵跳过）"""
+        with self._lock:
+            total = sum(index.memory_bytes() for index in self._indexes.values())
+            for user_id in list(self._indexes)[:-1]:
+                if total <= self.memory_budget:
+                    break
+                lock = self._user_locks[user_id]
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    index = self._indexes.pop(user_id)
+                    total -= index.memory_bytes()
+                    index.close()
+                finally:
+                    lock.release()
+                logger.info(f"向量索引已淘汰: 用户 {user_id}")
+
+    def _index_path(self, user_id: int) -> str:
+        return os.path.join(self.index_dir, f"user_{user_id}")
+
+    def _drop_files(self, user_id: int):
+        try:
+            os.remove(f"{self._index_path(user_id)}.meta")
+        except FileNotFoundError:
+            pass
+
+
+_BACKENDS = {
+    PgVectorBackend.name: PgVectorBackend,
+    NumpyVectorBackend.name: lambda: NumpyVectorBackend(
+        memory_budget_mb=settings.VECTOR_INDEX_MEMORY_MB,
+        index_dir=settings.VECTOR_INDEX_DIR,
+        quantization=settings.VECTOR_QUANTIZATION.lower(),
+        rescore_factor=settings.VECTOR_RESCORE_FACTOR
+    )
+}
+
+
+def create_vector_backend(name: Optional[str] = None) -> VectorBackend:
+    """
+    创建向量检索后端
+
+    Args:
+        name: 后端名称（pgvector / numpy，默认使用 VECTOR_BACKEND 配置）
+
+    Returns:
+        向量检索后端实例
+    """
+    name = (name or settings.VECTOR_BACKEND).lower()
+    if name not in _BACKENDS:
+        raise ValueError(f"不支持的向量检索后端: {name}")
+    return _BACKENDS[name]()
+
+
+# 全局向量检索后端实例
+vector_backend = create_vector_backend()
@@ -0,0 +1,311 @@
+"""
+文档文本提取工具
+- iter_*: 按页/段落逐块产出文本，避免整篇文档驻留内存
+- extract_*: 纯函数形式的整篇提取，可在进程池中执行（缓存由 DocumentTextExtractor 负责）
+- stream_document_text: 在进程池中逐段提取并通过队列回传，供流式入库使用
+"""
+import os
+import queue
+import re
+import logging
+from typing import Any, Iterator
+
+logger = logging.getLogger(__name__)
+
+# 文本清理正则（预编译）
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_INLINE_SPACES_RE = re.compile(r'[ \t]+')
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]')
+
+
+def clean_text(text: str) -> str:
+    """
+    清理文本内容
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        清理后的文本
+    """
+    # 移除多余的空白字符
+    text = _BLANK_LINES_RE.sub('\n\n', text)
+    text = _INLINE_SPACES_RE.sub(' ', text)
+
+    # 移除特殊字符
+    text = _CONTROL_CHARS_RE.sub('', text)
+
+    return text.strip()
+
+
+def iter_pdf_pages(
+    file_path: str,
+    engine: str = "pdfplumber",
+    include_tables: bool = False
+) -> Iterator[str]:
+    """
+    逐页提取 PDF 文本
+
+    Args:
+        file_path: PDF 文件路径
+        engine: 提取引擎（pdfplumber, pypdf），pdfplumber 未安装时自动回退到 pypdf
+        include_tables: 是否在页面文本后追加表格内容（仅 pdfplumber）
+
+    Yields:
+        每页的文本（不含结尾换行，空页为空字符串）
+    """
+    if engine == "pdfplumber":
+        try:
+            import pdfplumber
+        except ImportError:
+            logger.warning("pdfplumber 未安装，尝试使用 pypdf")
+            engine = "pypdf"
+
+    if engine == "pypdf":
+        from pypdf import PdfReader
+        reader = PdfReader(file_path)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            parts = []
+            # 提取文本，保持布局顺序
+            page_text = page.extract_text()
+            if page_text:
+                parts.append(page_text)
+
+            # 提取表格（PDF 中的表格信息）
+            if include_tables:
+                for table in page.extract_tables() or []:
+                    for row in table:
+                        row_text = " | ".join([str(cell) if cell else "" for cell in row])
+                        if row_text.strip():
+                            parts.append(row_text)
+
+            # 释放已解析页面的缓存，保持内存占用平稳
+            page.flush_cache()
+            yield "\n".join(parts)
+
+
+def iter_docx_paragraphs(file_path: str) -> Iterator[str]:
+    """
+    逐段提取 Word 文档文本（python-docx）
+
+    Args:
+        file_path: Word 文件路径
+
+    Yields:
+        非空段落文本
+    """
+    from docx import Document
+    doc = Document(file_path)
+    for para in doc.paragraphs:
+        if para.text.strip():
+            yield para.text
+
+
+def iter_text_blocks(file_path: str) -> Iterator[str]:
+    """
+    按空行分块读取文本文件（UTF-8 失败时回退到 GBK）
+
+    Args:
+        file_path: 文本文件路径
+
+    Yields:
+        以空行分隔的文本块
+    """
+    encoding = "utf-8"
+    block = []
+    with open(file_path, "rb") as f:
+        for raw_line in f:
+            try:
+                line = raw_line.decode(encoding)
+            except UnicodeDecodeError:
+                if encoding == "gbk":
+                    raise
+                # UTF-8 解码失败，后续内容按 GBK 解码
+                logger.warning(f"UTF-8 解码失败，尝试 GBK: {file_path}")
+                encoding = "gbk"
+                line = raw_line.decode(encoding)
+
+            # 与文本模式读取保持一致，统一换行符
+            line = line.replace("\r\n", "\n")
+            if line.strip():
+                block.append(line)
+            elif block:
+                yield "".join(block)
+                block = []
+
+    if block:
+        yield "".join(block)
+
+
+def iter_document_segments(file_path: str) -> Iterator[str]:
+    """
+    按文件类型流式提取文档片段（PDF 按页，Word 按段落，文本按空行分块）
+
+    片段之间视为段落边界，调用方可用 "\\n\\n" 拼接得到完整文本
+
+    Args:
+        file_path: 文件路径
+
+    Yields:
+        文本片段
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+
+    if file_ext == ".pdf":
+        yield from iter_pdf_pages(file_path, engine="pypdf")
+    elif file_ext in [".docx", ".doc"]:
+        yield from iter_docx_paragraphs(file_path)
+    else:
+        yield from iter_text_blocks(file_path)
+
+
+def extract_document_text(file_path: str) -> str:
+    """
+    提取并清理文档全文（纯函数，可在进程池中执行）
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        清理后的文本，片段之间以空行分隔
+    """
+    parts = []
+    for segment in iter_document_segments(file_path):
+        cleaned = clean_text(segment)
+        if cleaned:
+            parts.append(cleaned)
+    return "\n\n".join(parts)
+
+
+def stream_document_text(file_path: str, out_queue: Any, cancelled: Any, put_timeout: float = 1.0):
+    """
+    逐段提取并清理文档，通过队列回传给调用方（进程池入口）
+
+    队列容量有限，调用方消费较慢时解析随之暂停，内存占用不随文档大小增长；
+    无论成功与否最后都会放入 None 作为结束标记（取消时除外），异常由任务结果抛出
+
+    Args:
+        file_path: 文件路径
+        out_queue: 片段队列（multiprocessing.Manager().Queue 代理）
+        cancelled: 取消标记（multiprocessing.Manager().Event 代理），调用方放弃读取时设置
+        put_timeout: 队列已满时检查取消标记的间隔（秒）
+    """
+    def _put(item) -> bool:
+        while not cancelled.is_set():
+            try:
+                out_queue.put(item, timeout=put_timeout)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for segment in iter_document_segments(file_path):
+            cleaned = clean_text(segment)
+            if cleaned and not _put(cleaned):
+                return
+    finally:
+        _put(None)
+
+
+def extract_raw_text(file_path: str) -> str:
+    """
+    提取文档原始文本（保留版式与表格，供简历解析和 LLM 文档解析使用）
+
+    依次尝试：文本文件 -> pdfplumber（含表格）-> docx2txt -> unstructured
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        提取的文本内容
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    logger.info(f"开始提取文档文本，文件类型: {file_ext}")
+
+    # 1. 优先处理文本文件
+    if file_ext == '.txt':
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                text_content = f.read()
+            logger.info(f"成功提取文本文件，共 {len(text_content)} 字符")
+            return text_content
+        except UnicodeDecodeError:
+            # 尝试其他编码
+            try:
+                with open(file_path, 'r', encoding='gbk') as f:
+                    text_content = f.read()
+                logger.info(f"成功提取文本文件（GBK编码），共 {len(text_content)} 字符")
+                return text_content
+            except Exception as e:
+                logger.error(f"文本文件读取失败: {e}")
+                raise Exception(f"文本文件读取失败: {str(e)}")
+
+    # 2. 处理 PDF 文件（逐页提取，pdfplumber 未安装时自动回退到 pypdf）
+    if file_ext == '.pdf':
+        try:
+            pages = [
+                page_text + "\n"
+                for page_text in iter_pdf_pages(file_path, engine="pdfplumber", include_tables=True)
+                if page_text
+            ]
+            text_content = "".join(pages)
+            logger.info(f"PDF 提取成功，共 {len(text_content)} 字符，{len(pages)} 页")
+            return text_content
+        except Exception as e:
+            logger.error(f"PDF 提取失败: {e}")
+
+    # 3. 处理 Word 文件
+    if file_ext in ['.docx', '.doc']:
+        try:
+            import docx2txt
+            text_content = docx2txt.process(file_path)
+            logger.info(f"docx2txt 成功提取 Word 文档，共 {len(text_content)} 字符")
+            return text_content
+        except ImportError:
+            logger.warning("docx2txt 未安装，尝试使用其他方法")
+        except Exception as e:
+            logger.error(f"Word 文档提取失败: {e}")
+
+    # 4. 尝试使用 unstructured（处理其他格式）
+    try:
+        from unstructured.partition.auto import partition
+        elements = partition(filename=file_path)
+        text_content = "".join(str(element) + "\n" for element in elements)
+        logger.info(f"unstructured.io 成功提取，共 {len(text_content)} 字符，{len(elements)} 个元素")
+        return text_content
+    except ImportError:
+        logger.warning("unstructured 未安装")
+    except Exception as e:
+        logger.warning(f"unstructured 提取失败: {e}")
+
+    # 5. 如果所有方法都失败，返回错误
+    raise Exception(f"无法提取文件 {file_ext} 的文本内容，请检查文件格式或安装相应的依赖库")
+
+
+# 提取模式：raw(原始文本，简历/LLM 解析), clean(清理后的分段文本，知识库入库)
+EXTRACT_MODES = {
+    "raw": extract_raw_text,
+    "clean": extract_document_text
+}
+
+
+def extract_text(file_path: str, mode: str = "raw") -> str:
+    """
+    按提取模式提取文档文本（进程池入口）
+
+    Args:
+        file_path: 文件路径
+        mode: 提取模式（raw, clean）
+
+    Returns:
+        提取的文本内容
+    """
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"不支持的提取模式: {mode}")
+    return EXTRACT_MODES[mode](file_path)
@@ -0,0 +1,105 @@
+"""
+关键词检索分词与 tsvector/tsquery 构造
+
+- 英文与数字按连续字母数字切分（小写），中文按相邻两字切分（二元组），
+  入库与查询使用同一分词，无需中文分词词典
+- tsvector/tsquery 以输入格式文本构造，入库时直接转换为 tsvector，
+  不经过 PostgreSQL 的文本解析器（与数据库的语言配置、区域设置无关）
+"""
+import re
+from typing import Dict, List
+
+_WORD_RE = re.compile(r'[0-9a-z]+|[\u4e00-\u9fff]+')
+
+# PostgreSQL tsvector 限制：位置最大 16383，每个词位最多 256 个位置
+_MAX_POSITION = 16383
+_MAX_POSITIONS_PER_LEXEME = 256
+
+# 单个词元的最大长度（过长的英文串通常是编码或哈希，没有检索价值）
+MAX_TOKEN_LENGTH = 64
+
+STOPWORDS = {
+    '的', '了', '是', '在', '我', '有', '和', '就', '不', '人', '都', '一', '一个',
+    '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好',
+    '自己', '这', '那', '什么', '怎么', '如何', '为什么', '吗', '呢', '啊', '吧',
+    'the', 'a', 'an', 'of', 'to', 'in', 'on', 'and', 'or', 'is', 'are', 'for', 'with'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词
+
+    Args:
+        text: 文本
+
+    Returns:
+        词元列表（按出现顺序，含重复）
+    """
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word[0] >= '\u4e00':
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        elif len(word) <= MAX_TOKEN_LENGTH:
+            tokens.append(word)
+    return tokens
+
+
+def _quote(lexeme: str) -> str:
+    return "'" + lexeme.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def to_tsvector_text(tokens: List[str]) -> str:
+    """
+    构造 tsvector 输入文本（词位带位置，位置数即词频）
+
+    Args:
+        tokens: 分词结果
+
+    Returns:
+        如 "'缓存':1,5 'redis':2"
+    """
+    positions: Dict[str, List[int]] = {}
+    for position, token in enumerate(tokens, 1):
+        token_positions = positions.setdefault(token, [])
+        if len(token_positions) < _MAX_POSITIONS_PER_LEXEME:
+            token_positions.append(min(position, _MAX_POSITION))
+    return " ".join(
+        f"{_quote(lexeme)}:{','.join(map(str, sorted(set(token_positions))))}"
+        for lexeme, token_positions in positions.items()
+    )
+
+
+def to_tsquery_text(term: str) -> str:
+    """构造单个词位的 tsquery 输入文本"""
+    return _quote(term)
+
+
+def query_terms(query: str, max_terms: int = 32) -> List[str]:
+    """
+    提取查询词位（去重、去停用词）
+
+    中文单字只能匹配文档中同样单独出现的字，有其他词位时舍弃
+
+    Args:
+        query: 查询文本
+        max_terms: 最多保留的词位数
+
+    Returns:
+        词位列表
+    """
+    terms = []
+    seen = set()
+    for token in tokenize(query):
+        if token in STOPWORDS or token in seen:
+            continue
+        seen.add(token)
+        terms.append(token)
+
+    multi_char = [t for t in terms if len(t) > 1 or t < '\u4e00']
+    if multi_char:
+        terms = multi_char
+    return terms[:max_terms]
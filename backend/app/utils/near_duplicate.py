@@ -0,0 +1,116 @@
+"""
+近似重复文本检测（SimHash）
+
+- simhash: 以词元 3-gram 为特征计算 64 位 SimHash，文本越相似汉明距离越小
+- SimHashIndex: 分段索引，将签名切成 (max_distance + 1) 段，
+  汉明距离不超过 max_distance 的两个签名至少有一段完全相同（抽屉原理），只需比较同段候选
+"""
+import hashlib
+import re
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar
+
+SIMHASH_BITS = 64
+_MASK = (1 << SIMHASH_BITS) - 1
+_SIGN_BIT = 1 << (SIMHASH_BITS - 1)
+
+# 词元：连续的英文字母/数字，或单个其他文字字符（中文按字切分），忽略空白与标点
+_TOKEN_RE = re.compile(r'[0-9a-z]+|[^\W\da-z_]')
+
+# 特征窗口（词元数）
+SHINGLE_SIZE = 3
+
+K = TypeVar("K")
+
+
+def simhash(text: str) -> int:
+    """
+    计算文本的 64 位 SimHash（无符号）
+
+    Args:
+        text: 文本
+
+    Returns:
+        SimHash 签名
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) > SHINGLE_SIZE:
+        features = [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    else:
+        features = [" ".join(tokens)]
+
+    # 特征哈希按位展开后逐列统计 1 的个数（转置与计数均在 C 层完成），重复特征自然加权
+    bit_rows = [
+        format(int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for feature in features
+    ]
+    threshold = len(bit_rows) / 2
+    bits = "".join("1" if column.count("1") > threshold else "0" for column in zip(*bit_rows))
+    return int(bits, 2)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个签名的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+def to_signed64(value: int) -> int:
+    """无符号签名转换为有符号 64 位整数（存入 BIGINT 列）"""
+    return value - (1 << SIMHASH_BITS) if value & _SIGN_BIT else value
+
+
+def from_signed64(value: int) -> int:
+    """BIGINT 列中的有符号整数转换回无符号签名"""
+    return value & _MASK
+
+
+class SimHashIndex(Generic[K]):
+    """SimHash 分段索引"""
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max(0, max_distance)
+        band_count = min(self.max_distance + 1, SIMHASH_BITS)
+        width, extra = divmod(SIMHASH_BITS, band_count)
+        # (偏移, 掩码)，前 extra 段多分配一位，保证各段覆盖全部位
+        self._bands: List[Tuple[int, int]] = []
+        offset = 0
+        for i in range(band_count):
+            bits = width + (1 if i < extra else 0)
+            self._bands.append((offset, (1 << bits) - 1))
+            offset += bits
+        self._buckets: List[Dict[int, List[Tuple[int, K]]]] = [{} for _ in self._bands]
+        self._size = 0
+
+    def add(self, signature: int, key: K):
+        """
+        加入签名
+
+        Args:
+            signature: SimHash 签名（无符号）
+            key: 签名对应的键（如分块 ID）
+        """
+        for (offset, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((signature >> offset) & mask, []).append((signature, key))
+        self._size += 1
+
+    def find(self, signature: int) -> Optional[K]:
+        """
+        查找距离最近的近似重复项
+
+        Args:
+            signature: SimHash 签名（无符号）
+
+        Returns:
+            汉明距离不超过 max_distance 的最近项的键，没有时返回 None
+        """
+        best_key, best_distance = None, self.max_distance + 1
+        for (offset, mask), buckets in zip(self._bands, self._buckets):
+            for candidate, key in buckets.get((signature >> offset) & mask, ()):
+                distance = hamming_distance(signature, candidate)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        return best_key
+        return best_key
+
+    def __len__(self) -> int:
+        return self._size
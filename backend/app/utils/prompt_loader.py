@@ -137,14 +137,7 @@ class PromptLoader:
             格式化后的提示词
         """
         resolution = await PromptLoader.get_prompt_async(prompt_name, user_id, session_id)
-        content = resolution.content
-        
-        # 使用字符串替换
-        for key, value in kwargs.items():
-            placeholder = '{' + key + '}'
-            content = content.replace(placeholder, str(value))
-        
-        return content
+        return PromptLoader.render(resolution.content, **kwargs)
 
     @staticmethod
     def format_prompt(prompt_name: str, **kwargs) -> str:
@@ -159,7 +152,20 @@ class PromptLoader:
             格式化后的提示词
         """
         template = PromptLoader.get_prompt(prompt_name)
+        return PromptLoader.render(template, **kwargs)
+
+    @staticmethod
+    def render(template: str, **kwargs) -> str:
+        """
+        填充提示词模板
         
+        Args:
+            template: 提示词模板
+            **kwargs: 格式化参数
+        
+        Returns:
+            格式化后的提示词
+        """
         # 使用字符串替换，避免正则表达式对特殊字符的解析问题
         result = template
         for key, value in kwargs.items():
@@ -0,0 +1,481 @@
+"""
+基于偏移量的文本分段引擎
+
+分块过程中只记录原文片段 (源文本, 起始偏移, 结束偏移) 与分隔符，
+段落、句子均通过预编译的正则或 str.find 在原文上定位，不做中间字符串拼接或重复切分；
+递归分段按各部分的累计偏移二分贪心合并，分块文本只在输出时生成一次。
+分段结果与原有按字符串拼接的实现逐字一致（语义分段、父子分段、递归分段）。
+"""
+import re
+from bisect import bisect_right
+from itertools import accumulate, repeat
+from operator import add
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# 原文片段：(源文本, 起始偏移, 结束偏移)
+Span = Tuple[str, int, int]
+# 分块片段：原文片段或分隔符字面量
+Segment = Union[Span, str]
+
+# 句子结束符（句子包含结束符，末尾没有结束符的残句丢弃）
+SENTENCE_END_RE = re.compile(r'[。！？!?；;]')
+
+PARAGRAPH_SEPARATOR = "\n\n"
+SENTENCE_SEPARATOR = " "
+
+# 主题转换关键词（段落以这些词开头时视为新主题）
+TRANSITION_KEYWORDS = (
+    '另外', '此外', '再者', '接下来', '然后',
+    '另一方面', '同时', '与此同时', '另外一方面',
+    '此外还有', '不仅如此', '更重要的是',
+    '首先', '其次', '再次', '最后',
+    '第一', '第二', '第三', '第四',
+    '总之', '综上所述', '因此', '所以',
+    '然而', '但是', '不过', '相反',
+    '例如', '比如', '举例来说'
+)
+
+# 递归分段默认分隔符优先级：段落 > 句子 > 空格 > 字符
+DEFAULT_SEPARATORS = ['\n\n', '\n', '。', '！', '？', '；', ';', ' ', '']
+
+
+class Chunk:
+    """由原文片段与分隔符组成的分块"""
+
+    __slots__ = ("segments", "length")
+
+    def __init__(self, segments: Optional[List[Segment]] = None, length: int = 0):
+        self.segments: List[Segment] = segments if segments is not None else []
+        self.length = length
+
+    @classmethod
+    def from_span(cls, span: Span) -> "Chunk":
+        if span[1] >= span[2]:
+            return cls()
+        return cls([span], span[2] - span[1])
+
+    @classmethod
+    def from_text(cls, text: str) -> "Chunk":
+        return cls.from_span((text, 0, len(text)))
+
+    def extend(self, other: "Chunk", separator: str = ""):
+        """追加另一个分块（已有内容时先追加分隔符，与原文相邻时直接延长片段）"""
+        segments = self.segments
+        if not other.segments:
+            if segments and separator:
+                segments.append(separator)
+                self.length += len(separator)
+            return
+
+        first = other.segments[0]
+        if segments:
+            last = segments[-1]
+            if type(last) is tuple and type(first) is tuple and last[0] is first[0] \
+                    and last[2] + len(separator) == first[1] and last[0].startswith(separator, last[2]):
+                segments[-1] = (last[0], last[1], first[2])
+                segments.extend(other.segments[1:])
+                self.length += len(separator) + other.length
+                return
+            if separator:
+                segments.append(separator)
+                self.length += len(separator)
+        segments.extend(other.segments)
+        self.length += other.length
+
+    def as_span(self) -> Span:
+        """转换为单个原文片段（多片段分块会生成一次文本）"""
+        segments = self.segments
+        if len(segments) == 1 and type(segments[0]) is tuple:
+            return segments[0]
+        text = self.text()
+        return (text, 0, len(text))
+
+    def source_span(self) -> Optional[Span]:
+        """分块对应的原文片段（由多个片段拼接而成时返回 None）"""
+        segments = self.segments
+        if len(segments) == 1 and type(segments[0]) is tuple:
+            return segments[0]
+        return None
+
+    def text(self) -> str:
+        """生成分块文本"""
+        segments = self.segments
+        if len(segments) == 1:
+            segment = segments[0]
+            return segment if type(segment) is str else segment[0][segment[1]:segment[2]]
+        return "".join([
+            segment if type(segment) is str else segment[0][segment[1]:segment[2]]
+            for segment in segments
+        ])
+
+    def __len__(self) -> int:
+        return self.length
+
+
+def _strip_span(src: str, start: int, end: int) -> Tuple[int, int]:
+    """去除片段首尾空白（与 str.strip() 一致）"""
+    while start < end and src[start].isspace():
+        start += 1
+    while end > start and src[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def content_offsets(span: Optional[Span], bases: Optional[Dict[str, int]]) -> Optional[Tuple[int, int]]:
+    """
+    计算原文片段在文档内容中的偏移
+
+    Args:
+        span: 原文片段
+        bases: 源文本 -> 该文本在文档内容中的起始偏移
+
+    Returns:
+        (起始偏移, 结束偏移)；片段不属于文档内容（如拼接生成的文本）时返回 None
+    """
+    if span is None or not bases:
+        return None
+    base = bases.get(span[0])
+    if base is None:
+        return None
+    return base + span[1], base + span[2]
+
+
+def iter_paragraph_spans(text: str) -> Iterator[Span]:
+    """
+    按空行拆分段落（等价于 text.split('\\n\\n') 后去除首尾空白并跳过空段落）
+
+    Args:
+        text: 清理后的文本
+
+    Yields:
+        段落片段
+    """
+    pos = 0
+    text_length = len(text)
+    find = text.find
+    while True:
+        idx = find(PARAGRAPH_SEPARATOR, pos)
+        end = text_length if idx < 0 else idx
+        start = pos
+        # 清理后的文本段落首尾通常没有空白，先做快速判断
+        if start < end and (text[start].isspace() or text[end - 1].isspace()):
+            start, end = _strip_span(text, start, end)
+        if start < end:
+            yield (text, start, end)
+        if idx < 0:
+            return
+        pos = idx + 2
+
+
+def is_semantic_boundary(span: Span, previous_length: int) -> bool:
+    """
+    检测语义边界（新主题开始）
+
+    Args:
+        span: 当前段落片段
+        previous_length: 当前分块长度（0 表示尚无内容）
+
+    Returns:
+        是否为新主题
+    """
+    if not previous_length:
+        return False
+
+    src, start, end = span
+    # 检查段落开头是否包含主题转换词
+    if src.startswith(TRANSITION_KEYWORDS, start, end):
+        return True
+
+    # 检查段落长度差异（如果新段落很短，可能是新主题）
+    return previous_length > 300 and end - start < 100
+
+
+def iter_window_spans(span: Span, size: int, overlap: int) -> Iterator[Span]:
+    """
+    按固定字符窗口在原文偏移上切分片段（等价于对片段文本做 simple_chunk_text）
+
+    Args:
+        span: 待切分的原文片段
+        size: 窗口大小
+        overlap: 重叠大小
+
+    Yields:
+        去除首尾空白后的非空子片段
+    """
+    src, base, limit = span
+    total = limit - base
+    isspace = str.isspace
+    start = 0
+    while start < total:
+        end = start + size
+        s = base + start
+        e = base + (end if end < total else total)
+        if isspace(src[s]) or isspace(src[e - 1]):
+            s, e = _strip_span(src, s, e)
+        if s < e:
+            yield (src, s, e)
+        start = end - overlap
+
+
+def iter_window_chunks(chunk: Chunk, size: int, overlap: int) -> Iterator[Chunk]:
+    """
+    按固定字符窗口切分分块（等价于对分块文本做 simple_chunk_text）
+
+    单片段分块直接在原文偏移上切分；多片段分块先生成一次文本，再在该文本上按偏移切分
+
+    Args:
+        chunk: 待切分的分块
+        size: 窗口大小
+        overlap: 重叠大小
+
+    Yields:
+        去除首尾空白后的非空子块
+    """
+    if not chunk.segments:
+        return
+    for span in iter_window_spans(chunk.as_span(), size, overlap):
+        yield Chunk([span], span[2] - span[1])
+
+
+def iter_semantic_chunks(paragraphs: Iterable[Span], chunk_size: int) -> Iterator[Chunk]:
+    """
+    按段落流式生成语义分块（单次遍历）
+
+    当前分块由已封闭的片段列表和一个可延长的原文片段 (src, start, end) 组成：
+    新内容与原文相邻且分隔符一致时直接延长片段，否则封闭片段并插入分隔符。
+
+    Args:
+        paragraphs: 段落片段迭代器
+        chunk_size: 每块大小
+
+    Yields:
+        分块
+    """
+    segments: List[Segment] = []
+    src, start, end = "", 0, 0
+    # length 为分块文本长度（含分隔符），current_size 只统计内容长度（与原实现一致）
+    length = 0
+    current_size = 0
+
+    for para_src, para_start, para_end in paragraphs:
+        para_size = para_end - para_start
+
+        # 检测语义边界（新段落以主题转换词开头，或长块之后出现短段落）
+        is_new_topic = length and (
+            para_src.startswith(TRANSITION_KEYWORDS, para_start, para_end)
+            or (length > 300 and para_size < 100)
+        )
+
+        # 如果单个段落超过 chunk_size，按句子分割
+        if para_size > chunk_size:
+            if length:
+                segments.append((src, start, end))
+                yield Chunk(segments, length)
+                segments = []
+                length = 0
+                current_size = 0
+
+            s = para_start
+            for sentence_end in SENTENCE_END_RE.finditer(para_src, para_start, para_end):
+                e = sentence_end.end()
+                # 句子以非空白的结束符结尾，只需去除前导空白
+                while para_src[s].isspace():
+                    s += 1
+                sentence_size = e - s
+                if current_size + sentence_size > chunk_size:
+                    if length:
+                        segments.append((src, start, end))
+                        yield Chunk(segments, length)
+                        segments = []
+                    src, start, end = para_src, s, e
+                    length = sentence_size
+                    current_size = sentence_size
+                else:
+                    if not length:
+                        src, start, end = para_src, s, e
+                        length = sentence_size
+                    elif src is para_src and end + 1 == s and src[end] == SENTENCE_SEPARATOR:
+                        end = e
+                        length += 1 + sentence_size
+                    else:
+                        segments.append((src, start, end))
+                        segments.append(SENTENCE_SEPARATOR)
+                        src, start, end = para_src, s, e
+                        length += 1 + sentence_size
+                    current_size += sentence_size
+                s = e
+
+        # 如果检测到新主题或当前 chunk 加上新段落超过大小
+        elif is_new_topic or current_size + para_size > chunk_size:
+            if length:
+                segments.append((src, start, end))
+                yield Chunk(segments, length)
+                segments = []
+            src, start, end = para_src, para_start, para_end
+            length = para_size
+            current_size = para_size
+        else:
+            if not length:
+                src, start, end = para_src, para_start, para_end
+                length = para_size
+            elif src is para_src and end + 2 == para_start and src.startswith(PARAGRAPH_SEPARATOR, end):
+                end = para_end
+                length += 2 + para_size
+            else:
+                segments.append((src, start, end))
+                segments.append(PARAGRAPH_SEPARATOR)
+                src, start, end = para_src, para_start, para_end
+                length += 2 + para_size
+            current_size += para_size
+
+    if length:
+        segments.append((src, start, end))
+        yield Chunk(segments, length)
+
+
+def iter_adjusted_chunks(chunks: Iterable[Chunk], target_size: int) -> Iterator[Chunk]:
+    """
+    流式调整块大小：过大的块按字符窗口切分，过小的块合并到前一个块
+
+    Args:
+        chunks: 分块迭代器
+        target_size: 目标块大小
+
+    Yields:
+        调整后的分块
+    """
+    last: Optional[Chunk] = None
+    max_size = target_size * 1.5
+    min_size = target_size * 0.3
+    merge_limit = target_size * 1.2
+
+    for chunk in chunks:
+        if chunk.length > max_size:
+            for sub_chunk in iter_window_chunks(chunk, target_size, 0):
+                if last is not None:
+                    yield last
+                last = sub_chunk
+        elif chunk.length < min_size and last is not None \
+                and last.length + chunk.length < merge_limit:
+            last.extend(chunk, PARAGRAPH_SEPARATOR)
+        else:
+            if last is not None:
+                yield last
+            last = chunk
+
+    if last is not None:
+        yield last
+
+
+def iter_semantic_or_window_chunks(text: str, chunk_size: int, overlap: int) -> Iterator[Chunk]:
+    """语义分块；没有切分出任何块时退回按字符窗口切分"""
+    produced = False
+    for chunk in iter_semantic_chunks(iter_paragraph_spans(text), chunk_size):
+        produced = True
+        yield chunk
+    if not produced:
+        yield from iter_window_chunks(Chunk.from_text(text), chunk_size, overlap)
+
+
+def recursive_spans(
+    text: str,
+    chunk_size: int = 500,
+    overlap: int = 50,
+    separators: Optional[List[str]] = None
+) -> List[Span]:
+    """
+    递归分段：按分隔符优先级递归切分，过大的块降级使用下一级分隔符
+
+    合并后的块绝大多数是原文中的连续区间，直接以原文片段表示；
+    只有部分被去除空白或跳过空部分时，才为该块生成一次文本
+
+    Args:
+        text: 原始文本
+        chunk_size: 每块大小
+        overlap: 重叠大小
+        separators: 分隔符列表，按优先级从高到低排序（空字符串表示按字符切分）
+
+    Returns:
+        分块片段列表
+    """
+    if separators is None:
+        separators = DEFAULT_SEPARATORS
+    max_size = chunk_size * 1.5
+
+    separator_count = len(separators)
+
+    def _recursive_split(src: str, start: int, end: int, level: int) -> List[Span]:
+        if start >= end:
+            return []
+
+        # 如果文本长度小于等于 chunk_size，直接返回
+        if end - start <= chunk_size:
+            if src[start].isspace() or src[end - 1].isspace():
+                start, end = _strip_span(src, start, end)
+            return [(src, start, end)]
+
+        # 如果分隔符不存在（分割后只有一个部分），使用下一个分隔符
+        find = src.find
+        while level < separator_count and separators[level] and find(separators[level], start, end) < 0:
+            level += 1
+
+        # 没有更多分隔符（或空分隔符）时按字符切分
+        if level >= separator_count or not separators[level]:
+            return list(iter_window_spans((src, start, end), chunk_size, overlap))
+
+        separator = separators[level]
+
+        parts = src[start:end].split(separator)
+        sep_len = len(separator)
+        part_lengths = list(map(len, parts))
+        # 首尾的空部分（文本以分隔符开头或结尾）在合并时被跳过，不影响连续性
+        part_start = start
+        if not part_lengths[-1]:
+            part_lengths.pop()
+            parts.pop()
+        if part_lengths and not part_lengths[0]:
+            del part_lengths[0], parts[0]
+            part_start += sep_len
+
+        stripped = list(map(str.strip, parts))
+        contiguous = all(part_lengths) and stripped == parts
+        if not contiguous:
+            # 部分需要去除空白或跳过空部分时，按去除空白后的非空部分合并，每个块生成一次文本
+            stripped = list(filter(None, stripped))
+            part_lengths = list(map(len, stripped))
+            part_start = 0
+
+        # 第 k 部分位于 [bounds[k], bounds[k + 1] - sep_len)，合并后的块长度即为偏移差
+        bounds = list(accumulate(map(add, part_lengths, repeat(sep_len)), initial=part_start))
+        count = len(part_lengths)
+        window = chunk_size + sep_len
+
+        result: List[Span] = []
+        i = 0
+        while i < count:
+            # 贪心追加后续部分，直到合并后的长度超过 chunk_size（至少包含一个部分）
+            chunk_start = bounds[i]
+            j = bisect_right(bounds, chunk_start + window, i + 2, count + 1) - 1
+            chunk_end = bounds[j] - sep_len
+            if contiguous:
+                # 各部分均非空且无首尾空白时，合并后的块就是原文中的连续区间
+                span = (src, chunk_start, chunk_end)
+            else:
+                chunk_text = separator.join(stripped[i:j])
+                span = (chunk_text, 0, len(chunk_text))
+
+            # 块仍然过大时降级使用下一级分隔符递归处理
+            if chunk_end - chunk_start > max_size:
+                result.extend(_recursive_split(*span, level + 1))
+            else:
+                result.append(span)
+            i = j
+        return result
+
+    spans = _recursive_split(text, 0, len(text), 0)
+
+    # 如果没有切分出任何 chunk，使用简单切分
+    if not spans:
+        spans = list(iter_window_spans((text, 0, len(text)), chunk_size, overlap))
+
+    return spans
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+自适应检索阈值评估
+使用召回测试用例（recall_test_cases），对比完整检索（查询扩展 + 重排序）与不同阈值下的自适应检索：
+- 召回率 / MRR：与召回测试功能的指标一致
+- 跳过比例：首轮检索置信度足够、不再调用查询扩展 / 重排序 LLM 的用例比例
+
+每个用例只执行一次四种组合的检索，各组阈值在内存中模拟，评估耗时与阈值组数无关。
+
+用法:
+    python benchmark_adaptive_retrieval.py --user-id 1
+    python benchmark_adaptive_retrieval.py --user-id 1 --top-scores 0.7 0.8 0.9 --margins 0 0.03 0.1 --json result.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+from typing import Any, Dict
+
+from app.core.database import SessionLocal
+from app.services.recall_test_service import RecallTestService
+from config import settings
+
+
+async def run_evaluation(args) -> Dict[str, Any]:
+    grid = [
+        {"min_top_score": top_score, "min_score_margin": margin, "min_lexical_overlap": overlap}
+        for top_score, margin, overlap in itertools.product(args.top_scores, args.margins, args.overlaps)
+    ]
+
+    db = SessionLocal()
+    try:
+        report = await RecallTestService.evaluate_adaptive_thresholds(args.user_id, args.top_k, grid, db)
+    finally:
+        db.close()
+
+    if not report["case_count"]:
+        print("没有召回测试用例，请先在召回测试页面创建用例")
+        return {}
+
+    full = report["full"]
+    print(f"测试用例: {report['case_count']}，Top-K: {args.top_k}")
+    print(f"当前配置: 相似度 {settings.ADAPTIVE_MIN_TOP_SCORE}，领先 {settings.ADAPTIVE_MIN_SCORE_MARGIN}，"
+          f"词位覆盖 {settings.ADAPTIVE_MIN_LEXICAL_OVERLAP}")
+    print()
+    print(f"{'相似度':>8}{'领先':>8}{'词位覆盖':>10}{'召回率':>10}{'MRR':>8}{'跳过扩展':>10}{'跳过重排':>10}")
+    print("-" * 66)
+    print(f"{'完整检索':<26}{full['recall']:>10.2%}{full['mrr']:>8.3f}{0:>10.0%}{0:>10.0%}")
+    for row in report["results"]:
+        thresholds = row["thresholds"]
+        print(
+            f"{thresholds['min_top_score']:>8.2f}{thresholds['min_score_margin']:>8.2f}"
+            f"{thresholds['min_lexical_overlap']:>10.2f}{row['recall']:>10.2%}{row['mrr']:>8.3f}"
+            f"{row['expansion_skip_rate']:>10.0%}{row['rerank_skip_rate']:>10.0%}"
+        )
+    print("-" * 66)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="自适应检索阈值评估")
+    parser.add_argument("--user-id", type=int, required=True, help="使用该用户的测试用例")
+    parser.add_argument("--top-k", type=int, default=5, help="检索数量")
+    parser.add_argument("--top-scores", type=float, nargs="+", default=[0.7, 0.75, 0.8, 0.85, 0.9],
+                        help="首条结果最低相似度取值")
+    parser.add_argument("--margins", type=float, nargs="+", default=[0.0, 0.03, 0.05, 0.1],
+                        help="首条领先第二条的最小相似度差取值")
+    parser.add_argument("--overlaps", type=float, nargs="+", default=[0.0, 0.5, 0.8],
+                        help="查询词位最低覆盖率取值")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_evaluation(args))
+    if not report:
+        sys.exit(1)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+知识库入库吞吐基准测试
+生成可配置大小的合成中文/英文文档，使用本地确定性 Embedding 替身（可配置延迟）驱动
+文档解析 + RAGService.ingest_document_content（入库队列的执行路径），按分段策略统计：块/秒、Embedding 调用次数、数据库往返次数、峰值 RSS
+
+每个策略在独立进程中运行，峰值 RSS 互不影响。默认使用内存中的记录型会话统计数据库往返
+（不需要数据库）；--db postgres 时写入 DATABASE_URL 指向的数据库（需已执行迁移，结束后清理测试数据）
+
+用法:
+    python benchmark_ingestion.py                              # 1MB 中英混合文档，全部策略
+    python benchmark_ingestion.py --sizes 0.5 2 --language zh
+    python benchmark_ingestion.py --latency-ms 50 --per-text-ms 0.5
+    python benchmark_ingestion.py --db postgres --json result.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+STRATEGIES = ["semantic", "parent_child", "recursive"]
+
+ZH_WORDS = [
+    "数据库", "索引", "缓存", "一致性", "事务", "分布式", "微服务", "消息队列", "负载均衡", "限流",
+    "熔断", "线程池", "协程", "垃圾回收", "内存泄漏", "哈希表", "二叉树", "动态规划", "排序算法", "时间复杂度",
+    "候选人", "面试官", "项目经历", "系统设计", "高可用", "水平扩展", "读写分离", "主从复制", "分库分表", "慢查询",
+    "接口", "延迟", "吞吐量", "监控", "告警", "日志", "容器", "部署", "回滚", "灰度发布"
+]
+ZH_CONNECTORS = ["需要考虑", "可以通过", "通常依赖", "往往影响", "能够提升", "容易导致", "适合用于", "取决于"]
+ZH_ENDINGS = ["。", "。", "。", "！", "？", "；"]
+ZH_OPENERS = ["", "", "", "另外，", "例如，", "然而，", "因此，", "首先，", "最后，"]
+
+EN_WORDS = [
+    "index", "cache", "latency", "throughput", "replica", "shard", "queue", "worker", "thread", "process",
+    "lock", "transaction", "schema", "query", "planner", "vector", "embedding", "retrieval", "ranking", "token",
+    "candidate", "interviewer", "design", "tradeoff", "failure", "timeout", "retry", "backoff", "snapshot", "log",
+    "memory", "allocation", "pointer", "hash", "tree", "graph", "heap", "stack", "buffer", "stream"
+]
+EN_VERBS = ["improves", "reduces", "depends on", "affects", "requires", "limits", "replaces", "protects"]
+EN_ENDINGS = [".", ".", ".", "!", "?", ";"]
+
+
+# ==================== 合成文档 ====================
+
+def _zh_sentence(rng: random.Random) -> str:
+    words = rng.sample(ZH_WORDS, rng.randint(2, 4))
+    return (
+        rng.choice(ZH_OPENERS) + words[0] + rng.choice(ZH_CONNECTORS) + "、".join(words[1:])
+        + f"，在第{rng.randint(1, 999)}个场景中" + rng.choice(ZH_CONNECTORS) + rng.choice(ZH_WORDS)
+        + rng.choice(ZH_ENDINGS)
+    )
+
+
+def _en_sentence(rng: random.Random) -> str:
+    words = rng.sample(EN_WORDS, rng.randint(3, 6))
+    sentence = (
+        f"The {words[0]} {rng.choice(EN_VERBS)} the {' '.join(words[1:-1])} "
+        f"in case {rng.randint(1, 9999)} when the {words[-1]} {rng.choice(EN_VERBS)} it"
+    )
+    return sentence + rng.choice(EN_ENDINGS)
+
+
+def generate_document(size_mb: float, language: str = "mixed", seed: int = 42) -> str:
+    """
+    生成合成文档（句子由词表随机组合，重复度低；段落长短不一，包含超长段落）
+
+    Args:
+        size_mb: 目标大小（MB，按字符数计）
+        language: zh, en, mixed
+        seed: 随机种子
+
+    Returns:
+        以空行分隔段落的文档文本
+    """
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    paragraphs = []
+    total = 0
+    while total < target:
+        zh = language == "zh" or (language == "mixed" and rng.random() < 0.6)
+        count = rng.randint(20, 50) if rng.random() < 0.1 else rng.randint(2, 8)
+        if zh:
+            para = "".join(_zh_sentence(rng) for _ in range(count))
+        else:
+            para = " ".join(_en_sentence(rng) for _ in range(count))
+        paragraphs.append(para)
+        total += len(para) + 2
+    return "\n\n".join(paragraphs) + "\n"
+
+
+# ==================== 本地 Embedding 替身 ====================
+
+class LocalEmbeddingService:
+    """确定性的本地 Embedding 服务：同一文本总是得到同一个单位向量，可模拟网络与推理延迟"""
+
+    model = "benchmark-local"
+
+    def __init__(self, dimension: int, latency: float = 0.0, per_text_latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.shake_256(text.encode("utf-8")).digest(self.dimension)
+        vector = [byte - 127.5 for byte in digest]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        return (await self.generate_embeddings_batch([text]))[0]
+
+    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        delay = self.latency + self.per_text_latency * len(texts)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return [self._vector(text) for text in texts]
+
+
+# ==================== 内存数据库会话 ====================
+
+class _Result:
+    def __init__(self, ids=None):
+        self._ids = ids or []
+        self.rowcount = 0
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._ids
+
+    def fetchall(self):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+
+class _Query:
+    def __init__(self, document):
+        self._document = document
+
+    def filter(self, *args, **kwargs):
+        return self
+
+    def first(self):
+        return self._document
+
+    def count(self):
+        return 0
+
+
+class RecordingSession:
+    """
+    记录型数据库会话：模拟 ingest_document_content 用到的会话接口，
+    每次 execute/query/commit 计为一次数据库往返，写入的分块只计数不保存
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.round_trips = 0
+        self.rows_written = 0
+        self._next_id = 1
+
+    def query(self, *entities):
+        self.round_trips += 1
+        return _Query(self.document)
+
+    def execute(self, statement, params=None):
+        self.round_trips += 1
+        if isinstance(params, list):
+            self.rows_written += len(params)
+            ids = list(range(self._next_id, self._next_id + len(params)))
+            self._next_id += len(params)
+            return _Result(ids)
+        return _Result()
+
+    def commit(self):
+        self.round_trips += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _MemoryDocument:
+    id = 1
+    user_id = 1
+    status = "pending"
+    content = None
+    chunk_count = 0
+    chunk_strategy = None
+    error_message = None
+
+
+# ==================== 单次运行（子进程） ====================
+
+def _peak_rss_mb() -> float:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def _ingest(document_id: int, file_path: str, db, strategy: str):
+    """
+    按入库队列的执行路径处理文档：逐页/逐段提取清理后的片段，边解析边分段、向量化并存储
+
+    入库队列经 DocumentTextExtractor 读写提取缓存，基准测试直接逐段提取，避免缓存干扰统计
+    """
+    from app.services.rag_service import RAGService
+    from app.utils.document_extractor import clean_text, iter_document_segments
+
+    segments = (clean_text(segment) for segment in iter_document_segments(file_path))
+    await RAGService.ingest_document_content(document_id, segments, db, strategy)
+
+
+def _run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """在子进程中运行一次入库并返回统计"""
+    from config import settings
+    import app.services.llm_service as llm_service
+
+    settings.ENABLE_EMBEDDING_CACHE = case["embedding_cache"]
+    if case["db"] == "memory":
+        # 内存模式下缓存只保留进程内 LRU
+        settings.EMBEDDING_CACHE_PERSIST = False
+
+    embedding_service = LocalEmbeddingService(
+        settings.VECTOR_DIMENSION,
+        latency=case["latency_ms"] / 1000,
+        per_text_latency=case["per_text_ms"] / 1000
+    )
+
+    async def _get_embedding_service():
+        return embedding_service
+
+    llm_service.get_embedding_service = _get_embedding_service
+
+    text_content = generate_document(case["size_mb"], case["language"], case["seed"])
+    fd, file_path = tempfile.mkstemp(suffix=".txt", prefix="benchmark_ingestion_")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text_content)
+
+    rss_before = _peak_rss_mb()
+    try:
+        if case["db"] == "memory":
+            db = RecordingSession(_MemoryDocument())
+            started = time.perf_counter()
+            asyncio.run(_ingest(1, file_path, db, case["strategy"]))
+            elapsed = time.perf_counter() - started
+            chunk_count = db.document.chunk_count
+            round_trips = db.round_trips
+            status = db.document.status
+        else:
+            elapsed, chunk_count, round_trips, status = _run_postgres(file_path, case["strategy"])
+    finally:
+        os.remove(file_path)
+
+    return {
+        "strategy": case["strategy"],
+        "language": case["language"],
+        "size_mb": case["size_mb"],
+        "status": status,
+        "chunks": chunk_count,
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(chunk_count / elapsed, 1) if elapsed else 0.0,
+        "embedding_calls": embedding_service.calls,
+        "embedded_texts": embedding_service.texts,
+        "db_round_trips": round_trips,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "rss_growth_mb": round(_peak_rss_mb() - rss_before, 1)
+    }
+
+
+def _run_postgres(file_path: str, strategy: str):
+    """写入真实数据库运行一次入库（统计游标执行与提交次数），结束后删除测试数据"""
+    from sqlalchemy import event
+    from app.core.database import SessionLocal, sync_engine
+    from app.models.knowledge import KnowledgeDocument
+    from app.models.user import User
+    from app.services.rag_service import RAGService
+
+    suffix = f"{os.getpid()}_{int(time.time() * 1000)}"
+    db = SessionLocal()
+    user = User(
+        username=f"benchmark_{suffix}",
+        email=f"benchmark_{suffix}@example.com",
+        hashed_password="!"
+    )
+    db.add(user)
+    db.flush()
+    doc = KnowledgeDocument(
+        user_id=user.id,
+        file_name=os.path.basename(file_path),
+        file_path=file_path,
+        file_type="txt",
+        status="pending"
+    )
+    db.add(doc)
+    db.commit()
+
+    counter = {"round_trips": 0}
+
+    def _count(*args, **kwargs):
+        counter["round_trips"] += 1
+
+    event.listen(sync_engine, "before_cursor_execute", _count)
+    event.listen(sync_engine, "commit", _count)
+    try:
+        started = time.perf_counter()
+        asyncio.run(_ingest(doc.id, file_path, db, strategy))
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", _count)
+        event.remove(sync_engine, "commit", _count)
+
+    db.refresh(doc)
+    chunk_count, status = doc.chunk_count, doc.status
+
+    # 清理测试数据
+    asyncio.run(RAGService.delete_document_chunks(doc.id, db))
+    db.delete(doc)
+    db.delete(user)
+    db.commit()
+    db.close()
+    return elapsed, chunk_count, counter["round_trips"], status
+
+
+# ==================== 主流程 ====================
+
+def run_benchmark(args) -> List[Dict[str, Any]]:
+    cases = [
+        {
+            "strategy": strategy,
+            "size_mb": size_mb,
+            "language": args.language,
+            "seed": args.seed,
+            "latency_ms": args.latency_ms,
+            "per_text_ms": args.per_text_ms,
+            "embedding_cache": args.embedding_cache,
+            "db": args.db
+        }
+        for size_mb in args.sizes
+        for strategy in args.strategies
+    ]
+
+    results = []
+    header = (
+        f"{'策略':<14}{'语言':<7}{'输入':>7}{'块数':>8}{'耗时 s':>9}{'块/秒':>10}"
+        f"{'Embedding 调用':>16}{'向量化文本':>11}{'DB 往返':>9}{'峰值 RSS MB':>13}"
+    )
+    print(header)
+    print("-" * 104)
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        # 每次运行使用新进程，峰值 RSS 只反映本次运行
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(_run_case, case).result()
+        results.append(result)
+        status = "" if result["status"] == "completed" else f"  ({result['status']})"
+        print(
+            f"{result['strategy']:<14}{result['language']:<7}{result['size_mb']:>6.1f}M{result['chunks']:>8}"
+            f"{result['seconds']:>9.2f}{result['chunks_per_sec']:>10.1f}{result['embedding_calls']:>16}"
+            f"{result['embedded_texts']:>11}{result['db_round_trips']:>9}{result['peak_rss_mb']:>13.1f}{status}"
+        )
+    print("-" * 104)
+    print(
+        f"Embedding 替身: 每次调用 {args.latency_ms}ms + 每条文本 {args.per_text_ms}ms，"
+        f"缓存{'开启' if args.embedding_cache else '关闭'}，数据库: {args.db}"
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库入库吞吐基准测试")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1.0], help="文档大小（MB）")
+    parser.add_argument("--language", choices=["zh", "en", "mixed"], default="mixed", help="文档语言")
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=STRATEGIES, help="分段策略")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="每次 Embedding 调用的模拟延迟（毫秒）")
+    parser.add_argument("--per-text-ms", type=float, default=0.0, help="每条文本额外的模拟延迟（毫秒）")
+    parser.add_argument("--embedding-cache", action="store_true", help="启用 Embedding 缓存")
+    parser.add_argument("--db", choices=["memory", "postgres"], default="memory", help="数据库模式")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--json", help="将结果写入 JSON 文件（便于对比回归）")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+
+    if any(result["status"] != "completed" for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
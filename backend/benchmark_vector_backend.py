@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+向量检索后端基准测试
+- 合成数据（不需要数据库）：在临时目录构建不同规模的内存映射 float16 矩阵，按工作副本的量化方式
+  （none / int8 / binary，量化时先取候选再重新打分）测量构建耗时、工作副本大小、检索延迟（P50/P95）
+  与相对 float32 精确检索的召回率
+- 真实数据（--user-id）：对比 pgvector（近似 / 精确）与 numpy 后端的端到端检索延迟，
+  以 pgvector 精确检索为基准计算 numpy 后端的召回率
+
+用法:
+    python benchmark_vector_backend.py --synthetic-only
+    python benchmark_vector_backend.py --sizes 10000 50000 100000 --queries 200
+    python benchmark_vector_backend.py --synthetic-only --quantization int8 binary --rescore-factor 10
+    python benchmark_vector_backend.py --user-id 1 --queries 100
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services.vector_backend_service import NumpyVectorBackend, UserVectorIndex
+from config import settings
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+    }
+
+
+def benchmark_synthetic(
+    size: int,
+    queries: np.ndarray,
+    top_k: int,
+    dimension: int,
+    quantization: str = "none",
+    rescore_factor: int = 4
+) -> Dict[str, Any]:
+    """合成数据：构建矩阵并检索"""
+    rng = np.random.default_rng(size)
+    vectors = rng.standard_normal((size, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    directory = tempfile.mkdtemp(prefix="vector_index_")
+    try:
+        index = UserVectorIndex(
+            0, dimension, f"{directory}/user_0", quantization=quantization, rescore_factor=rescore_factor
+        )
+        started = time.perf_counter()
+        index.compact()
+        # 按每个文档 100 个分块增量写入，与入库路径一致
+        for document_id, start in enumerate(range(0, size, 100)):
+            rows = [(start + i + 1, start + i + 1, vectors[start + i]) for i in range(min(100, size - start))]
+            index.add_document(document_id, "", rows, save=False)
+        index.save()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        latencies = []
+        recall_hits = 0
+        for query in queries:
+            started = time.perf_counter()
+            hits = index.search(query[None, :], top_k)[0]
+            latencies.append((time.perf_counter() - started) * 1000)
+
+            exact = np.argpartition(-(vectors @ query), top_k - 1)[:top_k] + 1
+            recall_hits += len(set(exact.tolist()) & {chunk_id for chunk_id, _ in hits})
+
+        return {
+            "size": size,
+            "quantization": quantization,
+            "build_ms": round(build_ms, 1),
+            "file_mb": round(index.file_bytes() / 1024 / 1024, 1),
+            "resident_mb": round(index.memory_bytes() / 1024 / 1024, 1),
+            "recall": recall_hits / (len(queries) * top_k),
+            **_percentiles(latencies)
+        }
+    finally:
+        index.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def benchmark_database(args, queries: np.ndarray) -> List[Dict[str, Any]]:
+    """真实数据：pgvector 近似 / 精确检索与 numpy 后端对比"""
+    from app.core import vector_db
+    from app.core.database import SessionLocal
+    from app.services import rag_service
+    from app.services.rag_service import RAGService
+
+    db = SessionLocal()
+    index_dir = tempfile.mkdtemp(prefix="vector_index_")
+    pgvector_backend = rag_service.vector_backend
+    numpy_backend = NumpyVectorBackend(
+        memory_budget_mb=settings.VECTOR_INDEX_MEMORY_MB,
+        index_dir=index_dir,
+        quantization=settings.VECTOR_QUANTIZATION.lower(),
+        rescore_factor=settings.VECTOR_RESCORE_FACTOR
+    )
+    try:
+        started = time.perf_counter()
+        numpy_backend.search(db, args.user_id, [queries[0].tolist()], args.top_k)
+        print(f"numpy 后端加载（从数据库构建）: {(time.perf_counter() - started) * 1000:.1f} ms")
+        db.rollback()
+
+        modes = {
+            "pgvector": (pgvector_backend, False),
+            "pgvector_exact": (pgvector_backend, True),
+            "numpy": (numpy_backend, False)
+        }
+        results = {}
+        for mode, (backend, exact) in modes.items():
+            rag_service.vector_backend = backend
+            latencies = []
+            ids = []
+            for query in queries:
+                started = time.perf_counter()
+                rows = await RAGService.vector_search(
+                    query.tolist(), args.user_id, top_k=args.top_k, db=db, exact=exact
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                ids.append({row["id"] for row in rows})
+                db.rollback()
+            results[mode] = {"mode": mode, "ids": ids, **_percentiles(latencies)}
+
+        baseline = results["pgvector_exact"]["ids"]
+        for result in results.values():
+            found = sum(len(ids & expected) for ids, expected in zip(result.pop("ids"), baseline))
+            result["recall"] = found / max(sum(len(expected) for expected in baseline), 1)
+        return list(results.values())
+    finally:
+        rag_service.vector_backend = pgvector_backend
+        numpy_backend.close()
+        shutil.rmtree(index_dir, ignore_errors=True)
+        db.close()
+        await vector_db.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量检索后端基准测试")
+    parser.add_argument("--user-id", type=int, help="使用该用户的真实数据对比 pgvector 与 numpy 后端")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000], help="合成数据的分块数量")
+    parser.add_argument("--quantization", nargs="+", default=["none", "int8", "binary"],
+                        help="合成数据的工作副本量化方式")
+    parser.add_argument("--rescore-factor", type=int, default=settings.VECTOR_RESCORE_FACTOR,
+                        help="量化检索的候选倍数")
+    parser.add_argument("--queries", type=int, default=100, help="查询次数")
+    parser.add_argument("--top-k", type=int, default=10, help="检索数量")
+    parser.add_argument("--synthetic-only", action="store_true", help="只测试合成数据（不需要数据库）")
+    args = parser.parse_args()
+
+    dimension = settings.VECTOR_DIMENSION
+    rng = np.random.default_rng(42)
+    queries = rng.standard_normal((args.queries, dimension), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"合成数据（{dimension} 维，Top-{args.top_k}，{args.queries} 次查询，候选倍数 {args.rescore_factor}）:")
+    print(f"{'分块数':>10}{'量化':>8}{'构建 ms':>12}{'文件 MB':>10}{'副本 MB':>10}{'P50 ms':>10}{'P95 ms':>10}{'召回率':>10}")
+    print("-" * 80)
+    for size in args.sizes:
+        for quantization in args.quantization:
+            result = benchmark_synthetic(size, queries, args.top_k, dimension, quantization, args.rescore_factor)
+            print(
+                f"{result['size']:>10}{result['quantization']:>8}{result['build_ms']:>12.1f}"
+                f"{result['file_mb']:>10.1f}{result['resident_mb']:>10.1f}"
+                f"{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['recall']:>10.2%}"
+            )
+    print("-" * 80)
+
+    if args.synthetic_only or args.user_id is None:
+        return
+
+    print()
+    print(f"真实数据（用户 {args.user_id}，端到端 vector_search，召回率以 pgvector 精确检索为基准）:")
+    print(f"{'后端':<16}{'P50 ms':>10}{'P95 ms':>10}{'召回率':>10}")
+    print("-" * 46)
+    for result in asyncio.run(benchmark_database(args, queries)):
+        print(f"{result['mode']:<16}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['recall']:>10.2%}")
+    print("-" * 46)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+向量索引召回率/延迟基准测试
+使用召回测试用例（recall_test_cases）的查询，对比精确搜索（禁用索引扫描）与
+HNSW（不同 ef_search）/ IVFFlat（不同 probes）近似搜索的召回率与延迟：
+- ANN 召回率：近似搜索结果与精确搜索 Top-K 的重合比例
+- 用例召回率：命中测试用例期望分段的比例（与召回测试功能的指标一致）
+
+需要已执行迁移（add_vector_chunk_ann_index）且数据库中有召回测试用例与向量数据。
+
+用法:
+    python benchmark_vector_index.py
+    python benchmark_vector_index.py --user-id 1 --top-k 10 --repeat 5
+    python benchmark_vector_index.py --ef-search 10 40 160 --probes 1 10 50 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.database import SessionLocal
+from app.models.knowledge import RecallTestCase
+from app.services.llm_service import create_embedding
+from app.services.rag_service import RAGService
+from app.services.recall_test_service import RecallTestService
+
+
+def detect_index_type(db) -> Optional[str]:
+    """从 pg_indexes 检测 vector_chunks.embedding 上的近似最近邻索引类型"""
+    rows = db.execute(text(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = 'vector_chunks'"
+    )).fetchall()
+    for (indexdef,) in rows:
+        lowered = indexdef.lower()
+        for index_type in ("hnsw", "ivfflat"):
+            if f"using {index_type}" in lowered:
+                return index_type
+    return None
+
+
+def explain_uses_index(db, embedding: List[float], user_id: int, top_k: int) -> bool:
+    """检查向量检索的执行计划是否使用了向量索引"""
+    vector_str = f"[{','.join(map(str, embedding))}]"
+    conditions, params = RAGService._searchable_chunk_filter(user_id)
+    RAGService._apply_session_settings(db, RAGService._vector_search_settings(top_k))
+    plan = db.execute(text(f"""
+        EXPLAIN
+        SELECT vc.id
+        FROM vector_chunks vc
+        WHERE {RAGService._searchable_group_filter(conditions)}
+        ORDER BY vc.embedding <=> '{vector_str}'::vector
+        LIMIT {top_k}
+    """), params).fetchall()
+    db.rollback()
+    return any("ix_vector_chunks_embedding" in row[0] for row in plan)
+
+
+async def timed_search(db, case: Dict[str, Any], top_k: int, exact: bool = False, **params):
+    """执行一次向量检索，返回（分段 ID 列表, 耗时毫秒）"""
+    started = time.perf_counter()
+    results = await RAGService.vector_search(
+        query_embedding=case["embedding"],
+        user_id=case["user_id"],
+        top_k=top_k,
+        db=db,
+        exact=exact,
+        **params
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    db.rollback()
+    return [r["id"] for r in results], elapsed
+
+
+async def evaluate(db, cases: List[Dict[str, Any]], top_k: int, repeat: int, exact: bool = False, **params):
+    """对所有用例执行检索并汇总召回率与延迟"""
+    latencies = []
+    ann_recalls = []
+    case_recalls = []
+    for case in cases:
+        ids = []
+        for _ in range(repeat):
+            ids, elapsed = await timed_search(db, case, top_k, exact=exact, **params)
+            latencies.append(elapsed)
+        if case.get("exact_ids"):
+            ann_recalls.append(len(set(ids) & set(case["exact_ids"])) / len(case["exact_ids"]))
+        metrics = RecallTestService.calculate_metrics(ids, case["expected_ids"])
+        case_recalls.append(metrics["recall"])
+        if exact:
+            case["exact_ids"] = ids
+
+    latencies.sort()
+    return {
+        "ann_recall": round(statistics.mean(ann_recalls), 4) if ann_recalls else 1.0,
+        "case_recall": round(statistics.mean(case_recalls), 4) if case_recalls else 0.0,
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2)
+    }
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        query = db.query(RecallTestCase)
+        if args.user_id:
+            query = query.filter(RecallTestCase.user_id == args.user_id)
+        test_cases = query.order_by(RecallTestCase.id).all()
+        if not test_cases:
+            print("没有召回测试用例，请先在召回测试页面创建用例")
+            return {}
+
+        chunk_count = db.execute(text(
+            "SELECT COUNT(*) FROM vector_chunks WHERE embedding IS NOT NULL"
+        )).scalar()
+        index_type = detect_index_type(db)
+        db.rollback()
+
+        cases = []
+        for test_case in test_cases:
+            cases.append({
+                "id": test_case.id,
+                "user_id": test_case.user_id,
+                "embedding": await create_embedding(test_case.query),
+                "expected_ids": json.loads(test_case.expected_chunk_ids)
+            })
+
+        uses_index = explain_uses_index(db, cases[0]["embedding"], cases[0]["user_id"], args.top_k)
+
+        print(f"测试用例: {len(cases)}，向量分块: {chunk_count}，Top-K: {args.top_k}，重复: {args.repeat}")
+        print(f"向量索引: {index_type or '无'}，执行计划{'使用' if uses_index else '未使用'}索引")
+        print()
+        print(f"{'模式':<22}{'ANN 召回率':>12}{'用例召回率':>12}{'P50 ms':>10}{'P95 ms':>10}")
+        print("-" * 66)
+
+        rows = []
+
+        def _report(label: str, result: Dict[str, Any]):
+            rows.append({"mode": label, **result})
+            print(
+                f"{label:<22}{result['ann_recall']:>12.2%}{result['case_recall']:>12.2%}"
+                f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+            )
+
+        _report("exact", await evaluate(db, cases, args.top_k, args.repeat, exact=True))
+
+        if index_type == "hnsw":
+            for ef_search in args.ef_search:
+                result = await evaluate(db, cases, args.top_k, args.repeat, ef_search=ef_search)
+                _report(f"hnsw ef_search={ef_search}", result)
+        elif index_type == "ivfflat":
+            for probes in args.probes:
+                result = await evaluate(db, cases, args.top_k, args.repeat, probes=probes)
+                _report(f"ivfflat probes={probes}", result)
+        print("-" * 66)
+
+        return {
+            "index_type": index_type,
+            "uses_index": uses_index,
+            "chunk_count": chunk_count,
+            "case_count": len(cases),
+            "top_k": args.top_k,
+            "results": rows
+        }
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引召回率/延迟基准测试")
+    parser.add_argument("--user-id", type=int, help="只使用该用户的测试用例")
+    parser.add_argument("--top-k", type=int, default=10, help="检索数量")
+    parser.add_argument("--repeat", type=int, default=3, help="每个查询重复次数")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[10, 20, 40, 80, 160, 320],
+                        help="HNSW ef_search 取值")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 5, 10, 20, 50],
+                        help="IVFFlat probes 取值")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    if not report:
+        sys.exit(1)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
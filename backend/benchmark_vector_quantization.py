@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+向量量化检索评估
+使用召回测试用例（recall_test_cases），对比全精度精确检索与各量化方式的两阶段检索
+（量化距离取 Top-K × VECTOR_RESCORE_FACTOR 个候选，再用全精度向量重新打分）：
+- 用例召回率 / MRR：与召回测试功能的指标一致
+- 基准重合率：与全精度精确检索 Top-K 的重合比例
+- 延迟：只有已创建对应量化索引（manage_vector_index.py rebuild --quantization）的方式走索引扫描
+同时列出 vector_chunks 上向量索引与 TOAST（全精度向量）的实际大小。
+
+用法:
+    python benchmark_vector_quantization.py --user-id 1
+    python benchmark_vector_quantization.py --user-id 1 --top-k 10 --quantization none halfvec binary --json result.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict
+
+from sqlalchemy import text
+
+from app.core.database import SessionLocal
+from app.services.recall_test_service import RecallTestService
+from config import settings
+
+# 每个向量在索引中的大小（字节，不含图结构等开销）
+_VECTOR_BYTES = {
+    "none": lambda dimension: dimension * 4,
+    "halfvec": lambda dimension: dimension * 2,
+    "binary": lambda dimension: (dimension + 7) // 8
+}
+
+
+def storage_report(db) -> Dict[str, int]:
+    """vector_chunks 上向量索引与 TOAST 表的大小（字节）"""
+    rows = db.execute(text("""
+        SELECT c.relname, pg_relation_size(c.oid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'vector_chunks'::regclass AND c.relname LIKE 'ix_vector_chunks_embedding%'
+        UNION ALL
+        SELECT 'toast', COALESCE(pg_relation_size(reltoastrelid), 0)
+        FROM pg_class
+        WHERE oid = 'vector_chunks'::regclass
+    """)).fetchall()
+    db.rollback()
+    return {name: int(size) for name, size in rows}
+
+
+async def run_evaluation(args) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        storage = storage_report(db)
+        report = await RecallTestService.evaluate_quantization(args.user_id, args.top_k, args.quantization, db)
+    finally:
+        db.close()
+
+    if not report["case_count"]:
+        print("没有召回测试用例，请先在召回测试页面创建用例")
+        return {}
+
+    dimension = settings.VECTOR_DIMENSION
+    print(f"测试用例: {report['case_count']}，Top-K: {args.top_k}，候选倍数: {settings.VECTOR_RESCORE_FACTOR}，"
+          f"当前量化方式: {settings.VECTOR_QUANTIZATION}")
+    print()
+    print("存储:")
+    for name, size in storage.items():
+        print(f"  {name:<48}{size / 1024 / 1024:>10.1f} MB")
+    print()
+    print(f"{'量化':<10}{'向量字节':>10}{'召回率':>10}{'MRR':>8}{'基准重合率':>12}{'P50 ms':>10}{'P95 ms':>10}")
+    print("-" * 70)
+    for row in report["results"]:
+        vector_bytes = _VECTOR_BYTES.get(row["quantization"], _VECTOR_BYTES["none"])(dimension)
+        print(
+            f"{row['quantization']:<10}{vector_bytes:>10}{row['recall']:>10.2%}{row['mrr']:>8.3f}"
+            f"{row['baseline_overlap']:>12.2%}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+        )
+    print("-" * 70)
+    return {**report, "storage": storage, "top_k": args.top_k}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量量化检索评估")
+    parser.add_argument("--user-id", type=int, required=True, help="使用该用户的测试用例")
+    parser.add_argument("--top-k", type=int, default=10, help="检索数量")
+    parser.add_argument("--quantization", nargs="+", default=["none", "halfvec", "binary"],
+                        help="量化方式（none / halfvec / binary）")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_evaluation(args))
+    if not report:
+        sys.exit(1)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
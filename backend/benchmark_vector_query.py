@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+向量查询传输方式基准测试
+对比向量检索的三种执行方式：
+- legacy:          psycopg2，查询向量格式化为十进制字符串拼入 SQL（原实现）
+- psycopg2_bound:  psycopg2，查询向量作为参数绑定（ENABLE_ASYNCPG_VECTOR_SEARCH=false）
+- asyncpg_binary:  asyncpg 连接池，二进制向量参数 + 预编译语句复用（默认）
+
+输出每种方式的延迟（P50/P95）与客户端 CPU 时间，另外单独测量查询向量的编码开销（不需要数据库）。
+
+用法:
+    python benchmark_vector_query.py                      # 自动选择分块最多的用户
+    python benchmark_vector_query.py --user-id 1 --queries 500 --top-k 10
+    python benchmark_vector_query.py --encode-only
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from typing import Any, Dict, List
+
+from pgvector.utils import to_db_binary
+
+from config import settings
+
+
+def random_vectors(count: int, dimension: int, seed: int = 42) -> List[List[float]]:
+    """生成确定性的随机单位向量"""
+    rng = random.Random(seed)
+    vectors = []
+    for _ in range(count):
+        vector = [rng.gauss(0, 1) for _ in range(dimension)]
+        norm = math.sqrt(sum(v * v for v in vector))
+        vectors.append([v / norm for v in vector])
+    return vectors
+
+
+def benchmark_encoding(vectors: List[List[float]]) -> Dict[str, float]:
+    """查询向量编码开销（微秒/次）：十进制字符串 vs pgvector 二进制"""
+    started = time.process_time()
+    for vector in vectors:
+        f"[{','.join(map(str, vector))}]"
+    text_us = (time.process_time() - started) / len(vectors) * 1e6
+
+    started = time.process_time()
+    for vector in vectors:
+        to_db_binary(vector)
+    binary_us = (time.process_time() - started) / len(vectors) * 1e6
+
+    text_bytes = sum(len(f"[{','.join(map(str, v))}]") for v in vectors) / len(vectors)
+    binary_bytes = sum(len(to_db_binary(v)) for v in vectors) / len(vectors)
+    return {
+        "text_us": round(text_us, 1),
+        "binary_us": round(binary_us, 1),
+        "text_bytes": round(text_bytes),
+        "binary_bytes": round(binary_bytes)
+    }
+
+
+async def legacy_vector_search(query_embedding: List[float], user_id: int, top_k: int, db) -> List[Any]:
+    """原实现：向量格式化为字符串拼入 SQL"""
+    from sqlalchemy import text
+    from app.services.rag_service import CHUNK_TEXT_SQL, RAGService
+
+    RAGService._apply_session_settings(db, RAGService._vector_search_settings(top_k))
+    conditions, params = RAGService._searchable_chunk_filter(user_id)
+    vector_str = f"[{','.join(map(str, query_embedding))}]"
+    sql = f"""
+        SELECT
+            vc.id,
+            {CHUNK_TEXT_SQL} as chunk_text,
+            vc.chunk_index,
+            kd.file_name,
+            kd.id as document_id,
+            1 - vc.distance as similarity
+        FROM (
+            SELECT
+                vc.id, vc.document_id, vc.chunk_index,
+                vc.chunk_text, vc.start_offset, vc.end_offset,
+                vc.embedding <=> '{vector_str}'::vector as distance
+            FROM vector_chunks vc
+            WHERE {RAGService._searchable_group_filter(conditions)}
+            ORDER BY vc.embedding <=> '{vector_str}'::vector
+            LIMIT {top_k}
+        ) vc
+        JOIN knowledge_documents kd ON vc.document_id = kd.id
+        ORDER BY vc.distance
+    """
+    return db.execute(text(sql), params).fetchall()
+
+
+async def run_mode(mode: str, vectors: List[List[float]], user_id: int, top_k: int, db) -> Dict[str, Any]:
+    """按指定方式执行全部查询，返回延迟与客户端 CPU 统计"""
+    from app.services.rag_service import RAGService
+
+    settings.ENABLE_ASYNCPG_VECTOR_SEARCH = mode == "asyncpg_binary"
+
+    async def _search(vector):
+        if mode == "legacy":
+            rows = await legacy_vector_search(vector, user_id, top_k, db)
+        else:
+            rows = await RAGService.vector_search(vector, user_id, top_k=top_k, db=db)
+        db.rollback()
+        return rows
+
+    # 预热（建立连接、预编译语句）
+    for vector in vectors[:5]:
+        await _search(vector)
+
+    latencies = []
+    result_count = 0
+    cpu_started = time.process_time()
+    for vector in vectors:
+        started = time.perf_counter()
+        result_count += len(await _search(vector))
+        latencies.append((time.perf_counter() - started) * 1000)
+    cpu_ms = (time.process_time() - cpu_started) * 1000 / len(vectors)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "cpu_ms": round(cpu_ms, 3),
+        "avg_results": round(result_count / len(vectors), 1)
+    }
+
+
+async def run_queries(args, vectors: List[List[float]]):
+    from sqlalchemy import text
+    from app.core import vector_db
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        user_id = args.user_id
+        if user_id is None:
+            user_id = db.execute(text("""
+                SELECT user_id FROM vector_chunks
+                WHERE embedding IS NOT NULL
+                GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+            """)).scalar()
+            db.rollback()
+        if user_id is None:
+            print("没有可检索的向量分块，跳过查询测试")
+            return
+
+        print(f"用户: {user_id}，查询数: {len(vectors)}，Top-K: {args.top_k}")
+        print(f"{'方式':<18}{'P50 ms':>10}{'P95 ms':>10}{'客户端 CPU ms/次':>18}{'平均结果数':>12}")
+        print("-" * 70)
+        for mode in args.modes:
+            result = await run_mode(mode, vectors, user_id, args.top_k, db)
+            print(
+                f"{mode:<18}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}"
+                f"{result['cpu_ms']:>18.3f}{result['avg_results']:>12.1f}"
+            )
+        print("-" * 70)
+    finally:
+        db.close()
+        await vector_db.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量查询传输方式基准测试")
+    parser.add_argument("--user-id", type=int, help="检索的用户（默认选择分块最多的用户）")
+    parser.add_argument("--queries", type=int, default=200, help="查询次数")
+    parser.add_argument("--top-k", type=int, default=10, help="检索数量")
+    parser.add_argument("--modes", nargs="+", default=["legacy", "psycopg2_bound", "asyncpg_binary"],
+                        choices=["legacy", "psycopg2_bound", "asyncpg_binary"], help="执行方式")
+    parser.add_argument("--encode-only", action="store_true", help="只测量向量编码开销（不需要数据库）")
+    args = parser.parse_args()
+
+    vectors = random_vectors(args.queries, settings.VECTOR_DIMENSION)
+
+    encoding = benchmark_encoding(vectors)
+    print(f"查询向量编码（{settings.VECTOR_DIMENSION} 维）:")
+    print(f"  十进制字符串: {encoding['text_us']:>8.1f} μs/次，{encoding['text_bytes']:>6} 字节")
+    print(f"  二进制:       {encoding['binary_us']:>8.1f} μs/次，{encoding['binary_bytes']:>6} 字节")
+    print()
+
+    if not args.encode_only:
+        asyncio.run(run_queries(args, vectors))
+
+
+if __name__ == "__main__":
+    main()
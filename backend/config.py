@@ -69,8 +69,93 @@ class Settings(BaseSettings):
     ENABLE_QUERY_EXPANSION: bool = True  # 启用查询扩展
     QUERY_EXPANSION_COUNT: int = 3  # 查询扩展数量
     ENABLE_HYBRID_SEARCH: bool = True  # 启用混合检索
+    HYBRID_RRF_K: int = 60  # 混合检索倒数排名融合（RRF）常数，越大排名靠后的结果权重越接近靠前的结果
+    PARENT_CONTEXT_RETRIEVAL: bool = True  # 父子分段只检索子块，命中后批量取回父块作为上下文（同一父块只返回一次）
+    PARENT_CONTEXT_CANDIDATE_FACTOR: int = 3  # 父子分段检索的子块候选倍数（候选数 = Top-K × 倍数，按父块去重后截取 Top-K 个上下文）
+    EMBED_PARENT_CHUNKS: bool = False  # 父子分段时为父块生成向量（只检索子块时不需要；关闭 PARENT_CONTEXT_RETRIEVAL 前应开启并重新分段）
     ENABLE_RERANKING: bool = True  # 启用重排序
     RERANK_TOP_K: int = 10  # 重排序候选数量
+    RERANKER: str = "local"  # 重排序器: local（CPU 特征打分）, llm（LLM 评分，延迟高）
+    RERANK_WEIGHT_OVERLAP: float = 0.2  # 本地重排序：查询词位覆盖率权重
+    RERANK_WEIGHT_BM25: float = 0.3  # 本地重排序：候选集内 BM25 权重
+    RERANK_WEIGHT_COSINE: float = 0.5  # 本地重排序：向量余弦相似度权重
+    RERANK_CACHE_MAX_ITEMS: int = 50000  # 重排序得分缓存条目上限
+
+    # 检索结果缓存（知识库变化时按用户版本号精确失效）
+    ENABLE_SEARCH_CACHE: bool = True  # 启用检索结果缓存
+    SEARCH_CACHE_MAX_ENTRIES: int = 2000  # 缓存条目上限
+    SEARCH_CACHE_MEMORY_MB: int = 64  # 缓存内存上限（MB，按结果文本估算）
+    SEARCH_CACHE_TTL_SECONDS: int = 600  # 条目有效期（秒），兜底未经 ORM 修改知识库的路径
+
+    # 自适应检索配置（先用原始查询检索一次，置信度足够时跳过查询扩展与重排序，阈值可用召回测试评估）
+    ENABLE_ADAPTIVE_RETRIEVAL: bool = True  # 启用自适应检索
+    ADAPTIVE_MIN_TOP_SCORE: float = 0.8  # 首条结果的最低相似度
+    ADAPTIVE_MIN_SCORE_MARGIN: float = 0.03  # 首条领先第二条的最小相似度差（跳过重排序）
+    ADAPTIVE_MIN_LEXICAL_OVERLAP: float = 0.5  # 查询词位在首条结果中的最低覆盖率
+
+    # 流水线检索配置（知识库查询接口：原始查询检索与查询扩展并行，按延迟预算取舍扩展与重排序）
+    ENABLE_SPECULATIVE_RETRIEVAL: bool = True  # 启用流水线检索（关闭时按顺序执行各阶段）
+    RETRIEVAL_LATENCY_BUDGET_MS: int = 3000  # 检索总延迟预算（毫秒）
+    QUERY_EXPANSION_DEADLINE_MS: int = 1500  # 扩展查询结果的截止时间（毫秒），超时则只使用原始查询的结果
+    RERANK_MIN_BUDGET_MS: int = 800  # 剩余预算低于该值时跳过重排序
+
+    # 向量索引配置（pgvector 近似最近邻索引，迁移创建默认的 HNSW 索引，修改类型或构建参数后执行 manage_vector_index.py rebuild）
+    VECTOR_INDEX_TYPE: str = "hnsw"  # 可选: hnsw, ivfflat, none
+    HNSW_M: int = 16  # 每个节点的最大连接数
+    HNSW_EF_CONSTRUCTION: int = 64  # 构建时的候选列表大小
+    HNSW_EF_SEARCH: int = 40  # 查询时的候选列表大小，越大召回率越高、延迟越高
+    IVFFLAT_LISTS: int = 100  # 聚类中心数量，建议约为 行数/1000（百万行以上取 sqrt(行数)）
+    IVFFLAT_PROBES: int = 10  # 查询时扫描的聚类数量，越大召回率越高、延迟越高
+    VECTOR_ITERATIVE_SCAN: str = "relaxed_order"  # 可选: off, relaxed_order, strict_order（pgvector 0.8+，过滤后结果不足时继续扫描索引；近似索引覆盖全部用户，按用户/文档/分类过滤时需开启；数据库中的 pgvector 低于 0.8 时自动不开启）
+    ENABLE_ASYNCPG_VECTOR_SEARCH: bool = True  # 向量检索使用独立的 asyncpg 连接池（二进制向量参数、预编译语句复用）
+    VECTOR_SEARCH_POOL_SIZE: int = 5  # 向量检索连接池大小
+    VECTOR_BACKEND: str = "pgvector"  # 可选: pgvector（数据库向量索引）, numpy（进程内内存映射 float16 矩阵精确检索，适合单用户分块数数万以内）
+    VECTOR_INDEX_DIR: str = "./uploads/vector_index"  # 进程内向量索引文件目录
+    VECTOR_INDEX_MEMORY_MB: int = 512  # 进程内向量索引内存预算（MB，float32 工作副本），超出时按 LRU 释放冷用户的矩阵
+    VECTOR_QUANTIZATION: str = "none"  # 可选: none, halfvec, binary（pgvector 量化索引，切换后执行 manage_vector_index.py rebuild）, int8（仅 numpy 后端）；量化检索先取候选再用全精度向量重新打分
+    VECTOR_RESCORE_FACTOR: int = 4  # 量化检索的候选倍数（候选数 = Top-K × 倍数，binary 建议 10 以上）
+
+    # 关键词检索配置（BM25）
+    KEYWORD_SEARCH_BACKEND: str = "postgres"  # 可选: postgres（全文索引）, memory（进程内倒排索引）
+    KEYWORD_SEARCH_CANDIDATES: int = 1000  # 全文索引检索候选数量上限（也是常见词判定的文档频率阈值）
+    KEYWORD_SEARCH_BM25_K1: float = 1.2  # BM25 词频饱和参数
+    KEYWORD_SEARCH_BM25_B: float = 0.75  # BM25 长度归一化参数
+    KEYWORD_INDEX_MEMORY_MB: int = 256  # 进程内倒排索引内存预算（MB），超出时按 LRU 淘汰
+    KEYWORD_INDEX_SNAPSHOT_DIR: str = "./uploads/keyword_index"  # 进程内倒排索引快照目录
+
+    # 向量化入库配置
+    EMBEDDING_BATCH_SIZE: int = 16  # 每批发送给 Embedding 服务的文本数量
+    EMBEDDING_CONCURRENCY: int = 4  # 同时进行的 Embedding 批次数量
+    ENABLE_COMPACT_CHUNK_STORAGE: bool = False  # 紧凑存储：分块只记录在文档内容中的偏移，不重复存储文本
+
+    # Embedding 缓存配置
+    ENABLE_EMBEDDING_CACHE: bool = True  # 启用 Embedding 缓存
+    EMBEDDING_CACHE_MEMORY_SIZE: int = 10000  # 进程内 LRU 缓存条目上限
+    EMBEDDING_CACHE_PERSIST: bool = True  # 是否持久化到数据库
+
+    # 查询扩展缓存配置（按查询与提示词版本缓存 LLM 生成的查询变体）
+    ENABLE_QUERY_EXPANSION_CACHE: bool = True  # 启用查询扩展缓存
+    QUERY_EXPANSION_CACHE_MEMORY_SIZE: int = 5000  # 进程内 LRU 缓存条目上限
+    QUERY_EXPANSION_CACHE_TTL_SECONDS: int = 604800  # 条目有效期（秒），0 表示不过期
+    QUERY_EXPANSION_CACHE_PERSIST: bool = True  # 是否持久化到数据库
+    QUERY_EXPANSION_CACHE_WARM_SIZE: int = 1000  # 启动时预热到内存的条目数
+
+    # 近似重复分块检测配置
+    ENABLE_NEAR_DUPLICATE_DETECTION: bool = True  # 入库时检测与已有分块近似重复的分块，复用已有向量
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 3  # SimHash（64 位）汉明距离阈值
+    NEAR_DUPLICATE_MIN_LENGTH: int = 50  # 参与检测的最小分块长度（过短的文本签名不可靠）
+
+    # 知识库入库队列配置
+    INGESTION_WORKERS: int = 2  # 异步入库 Worker 数量（负责分段与向量化）
+    INGESTION_MAX_ATTEMPTS: int = 3  # 任务最大尝试次数
+    INGESTION_RETRY_DELAY: int = 10  # 重试基础间隔（秒），按指数退避
+    INGESTION_POLL_INTERVAL: float = 2.0  # 队列轮询间隔（秒）
+    INGESTION_JOB_LEASE: int = 600  # 任务执行租约（秒），超时未续约视为 Worker 失联
+
+    # 文档文本提取配置
+    DOCUMENT_EXTRACT_WORKERS: int = 2  # 文档解析进程池大小（CPU 密集），0 表示在当前线程解析
+    ENABLE_DOCUMENT_TEXT_CACHE: bool = True  # 按文件内容哈希缓存提取结果
+    DOCUMENT_TEXT_CACHE_DIR: str = "./uploads/text_cache"  # 提取结果缓存目录
 
     class Config:
         env_file = ".env"
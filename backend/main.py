@@ -15,6 +15,13 @@ logging.basicConfig(
 )
 
 from app.api import auth, resume, job, interview, knowledge, evaluation, statistics, task_notification, llm_config, game, persona, prompt_config
+from app.services.ingestion_queue_service import ingestion_queue
+from app.services.document_text_service import document_text_extractor
+from app.services.keyword_index_service import keyword_index
+from app.services.vector_backend_service import vector_backend
+from app.services.query_expansion_cache_service import query_expansion_cache
+from app.services import search_cache_service  # noqa: F401 注册知识库版本号的会话事件（检索结果缓存失效）
+from app.core import vector_db
 
 
 @asynccontextmanager
@@ -23,9 +30,21 @@ async def lifespan(app: FastAPI):
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     os.makedirs(os.path.join(settings.UPLOAD_DIR, "resumes"), exist_ok=True)
     os.makedirs(os.path.join(settings.UPLOAD_DIR, "knowledge"), exist_ok=True)
+    # 启动知识库入库队列（继续处理重启前未完成的任务）
+    await ingestion_queue.start()
+    # 预热查询扩展缓存
+    if settings.ENABLE_QUERY_EXPANSION_CACHE:
+        try:
+            await query_expansion_cache.warm_up(settings.QUERY_EXPANSION_CACHE_WARM_SIZE)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"查询扩展缓存预热失败: {e}")
     yield
     # 关闭时的清理工作
-    pass
+    await ingestion_queue.stop()
+    document_text_extractor.shutdown()
+    await vector_db.dispose()
+    keyword_index.snapshot_all()
+    vector_backend.close()
 
 
 app = FastAPI(
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+向量近似最近邻索引管理
+迁移只创建默认索引（HNSW，m = 16，ef_construction = 64，余弦距离），不读取运行时配置；
+切换索引类型、调整构建参数或开启量化检索时执行本命令，按配置（或命令行参数）重建 vector_chunks 的近似最近邻索引。
+
+量化索引（VECTOR_QUANTIZATION）与检索时的量化距离表达式一致（见 RAGService._nearest_chunks_sql）：
+- halfvec：索引表达式 embedding::halfvec(维度)，索引大小约为全精度的 1/2
+- binary：索引表达式 binary_quantize(embedding)::bit(维度)，汉明距离，索引大小约为全精度的 1/32
+构建量化索引后删除全精度索引（常驻内存的主要部分），全精度向量只在重新打分时按候选读取。
+none / int8（pgvector 没有 int8 向量类型，只用于 numpy 后端）时使用全精度索引。
+
+新索引以 CONCURRENTLY 方式构建（不阻塞分块写入），构建完成后再删除旧索引，重建期间检索仍可使用旧索引。
+IVFFlat 的聚类中心在建索引时根据已有数据计算，应在导入数据后构建；数据量变化较大时需重建。
+
+用法:
+    python manage_vector_index.py show                                 # 查看当前索引
+    python manage_vector_index.py rebuild                              # 按 VECTOR_INDEX_TYPE / HNSW_* / IVFFLAT_LISTS 重建
+    python manage_vector_index.py rebuild --index-type ivfflat --lists 400
+    python manage_vector_index.py rebuild --quantization halfvec       # 量化索引
+    python manage_vector_index.py rebuild --index-type none            # 只删除索引（精确检索）
+"""
+import argparse
+import sys
+from typing import List
+
+from sqlalchemy import text
+
+from config import settings
+
+INDEX_PREFIX = "ix_vector_chunks_embedding_"
+
+# 量化方式 -> (索引表达式, 操作符类)
+QUANTIZED_EXPRESSIONS = {
+    "halfvec": ("(embedding::halfvec({dimension}))", "halfvec_cosine_ops"),
+    "binary": ("(binary_quantize(embedding)::bit({dimension}))", "bit_hamming_ops")
+}
+
+
+def index_name(index_type: str, quantization: str = "none") -> str:
+    """近似最近邻索引名称（与迁移中的命名一致）"""
+    if quantization in QUANTIZED_EXPRESSIONS:
+        return f"{INDEX_PREFIX}{quantization}_{index_type}"
+    return f"{INDEX_PREFIX}{index_type}"
+
+
+def index_target(quantization: str, dimension: int) -> str:
+    """索引表达式与操作符类"""
+    if quantization in QUANTIZED_EXPRESSIONS:
+        expression, opclass = QUANTIZED_EXPRESSIONS[quantization]
+        return f"{expression.format(dimension=int(dimension))} {opclass}"
+    return "embedding vector_cosine_ops"
+
+
+def index_options(index_type: str, args) -> str:
+    """索引构建参数"""
+    if index_type == "hnsw":
+        return f"WITH (m = {int(args.m)}, ef_construction = {int(args.ef_construction)})"
+    return f"WITH (lists = {int(args.lists)})"
+
+
+def list_indexes(conn) -> List[tuple]:
+    """vector_chunks 上现有的近似最近邻索引 (名称, 定义)"""
+    return conn.execute(
+        text("""
+            SELECT indexname, indexdef
+            FROM pg_indexes
+            WHERE tablename = 'vector_chunks' AND indexname LIKE :prefix
+            ORDER BY indexname
+        """),
+        {"prefix": f"{INDEX_PREFIX}%"}
+    ).fetchall()
+
+
+def show(conn):
+    indexes = list_indexes(conn)
+    if not indexes:
+        print("vector_chunks 上没有近似最近邻索引（向量检索为精确扫描）")
+        return
+    for name, definition in indexes:
+        print(f"{name}: {definition}")
+
+
+def rebuild(conn, args):
+    index_type = args.index_type.lower()
+    if index_type not in ("hnsw", "ivfflat", "none"):
+        print(f"不支持的索引类型: {index_type}")
+        sys.exit(1)
+
+    quantization = args.quantization.lower()
+    target = index_name(index_type, quantization) if index_type != "none" else None
+    building = f"{target}_rebuild" if target else None
+
+    if target:
+        # 先以临时名称构建新索引，旧索引在构建期间继续服务检索
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {building}"))
+        print(f"正在构建 {index_type} 索引（量化: {quantization}）{index_options(index_type, args)} ...")
+        conn.execute(text(f"""
+            CREATE INDEX CONCURRENTLY {building}
+            ON vector_chunks USING {index_type} ({index_target(quantization, args.dimension)})
+            {index_options(index_type, args)}
+        """))
+
+    # 构建完成后再列出旧索引（包括之前失败残留的临时索引），新建的索引不在其中
+    old_names = [name for name, _ in list_indexes(conn) if name != building]
+    for name in old_names:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        print(f"已删除旧索引: {name}")
+
+    if target:
+        conn.execute(text(f"ALTER INDEX {building} RENAME TO {target}"))
+        print(f"索引已就绪: {target}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量近似最近邻索引管理")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("show", help="查看当前索引")
+    rebuild_parser = subparsers.add_parser("rebuild", help="按配置重建索引")
+    rebuild_parser.add_argument("--index-type", default=settings.VECTOR_INDEX_TYPE, help="hnsw, ivfflat, none")
+    rebuild_parser.add_argument("--m", type=int, default=settings.HNSW_M, help="HNSW 每个节点的最大连接数")
+    rebuild_parser.add_argument(
+        "--ef-construction", type=int, default=settings.HNSW_EF_CONSTRUCTION, help="HNSW 构建时的候选列表大小"
+    )
+    rebuild_parser.add_argument("--lists", type=int, default=settings.IVFFLAT_LISTS, help="IVFFlat 聚类中心数量")
+    rebuild_parser.add_argument(
+        "--quantization", default=settings.VECTOR_QUANTIZATION, help="none, halfvec, binary（int8 按 none 处理）"
+    )
+    rebuild_parser.add_argument("--dimension", type=int, default=settings.VECTOR_DIMENSION, help="向量维度")
+    args = parser.parse_args()
+
+    from app.core.database import sync_engine
+
+    # CREATE / DROP INDEX CONCURRENTLY 不能在事务中执行
+    with sync_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if args.command == "show":
+            show(conn)
+        else:
+            rebuild(conn, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ import asyncio
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.services.rag_service import RAGService
+from app.utils import lexical
 
 
 async def test_query_expansion():
@@ -44,8 +45,8 @@ async def test_keyword_extraction():
 
     for text in test_texts:
         print(f"\n输入文本: {text}")
-        keywords = RAGService._extract_keywords(text)
-        print(f"提取关键词: {keywords}")
+        keywords = lexical.query_terms(text)
+        print(f"提取查询词位: {keywords}")
 
 
 async def test_semantic_boundary_detection():
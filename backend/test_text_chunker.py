@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+文本分段引擎测试
+- 与原有字符串拼接实现的输出一致：对固定种子生成的文档比较分块结果指纹
+  （指纹由原实现在同一输入上生成，原实现已移除，见 benchmark_chunking.py）
+- 分块偏移与文档内容一致
+"""
+import hashlib
+import json
+import random
+from typing import Any, Dict, List
+
+from app.utils import text_chunker
+from app.utils.document_extractor import clean_text
+
+ZH_SENTENCES = [
+    "数据库索引能够显著提升查询性能。",
+    "另外，缓存策略需要考虑数据一致性！",
+    "微服务架构将系统拆分为多个独立部署的服务；",
+    "然而，分布式事务的处理复杂度更高。",
+    "例如，可以使用消息队列实现最终一致性？",
+    "首先需要明确业务边界，其次再设计接口。",
+    "面试中常见的问题包括算法、系统设计与项目经历",
+]
+EN_SENTENCES = [
+    "Python performance tuning starts with profiling the hot path.",
+    "Indexes trade write throughput for faster reads!",
+    "Consider connection pooling when latency matters;",
+    "Why does the garbage collector pause here?",
+    "Vector search combines embeddings with keyword retrieval",
+]
+
+# (种子, 是否保留多余空白, 分块大小, 重叠) -> (语义分段, 父子分段, 递归分段) 的结果指纹
+EXPECTED_FINGERPRINTS = {
+    (7, False, 500, 50): ("1952ef1a8a3986b8", "ce140b6a99771fe1", "6f1425e8bc24de9b"),
+    (7, False, 300, 30): ("e29c47cec056b00d", "445fe082a0d741a5", "f4a747d1c3fd678d"),
+    (7, False, 800, 100): ("4ddb0226dbbeb57b", "9d07b38808bcb9ab", "dafcd0de02cdcd5e"),
+    (11, True, 500, 50): ("230328c12fe17c1b", "0728f2d49eaa7dc9", "0254275339184b28"),
+    (11, True, 300, 30): ("e5ef3d5cfcd14f06", "6b1eb1e455656131", "bd79deb9dcb5442c"),
+    (11, True, 800, 100): ("5c4a0d4aebe195d5", "8de02ee830bd73ce", "21c2abeea2b1fc9b"),
+}
+
+
+def make_document(paragraphs: int, seed: int, messy: bool = False) -> str:
+    """生成中英混合的文档（包含超长段落）；messy 时保留多余空白、单换行与空段落，不做清理"""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(paragraphs):
+        pool = ZH_SENTENCES if rng.random() < 0.7 else EN_SENTENCES
+        count = rng.randint(20, 60) if rng.random() < 0.1 else rng.randint(1, 8)
+        sep = "" if pool is ZH_SENTENCES else " "
+        if messy:
+            sep = rng.choice([sep, "  ", "\n", " \t"])
+        para = sep.join(rng.choice(pool) for _ in range(count))
+        if messy and rng.random() < 0.2:
+            para = "  " + para + " \n"
+        parts.append(para)
+        if messy and rng.random() < 0.1:
+            parts.append("   ")
+    text = "\n\n".join(parts)
+    return text if messy else clean_text(text)
+
+
+def semantic_chunks(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """同 RAGService.chunk_text"""
+    chunks = text_chunker.iter_adjusted_chunks(
+        text_chunker.iter_semantic_or_window_chunks(text, chunk_size, overlap),
+        chunk_size
+    )
+    return [chunk.text() for chunk in chunks]
+
+
+def parent_child_chunks(text: str, parent_size: int, child_size: int, overlap: int) -> List[Dict[str, Any]]:
+    """同 RAGService.parent_child_chunk_text（offsets 为分块在 text 中的偏移）"""
+    result = []
+    chunk_index = 0
+    for parent_idx, parent in enumerate(text_chunker.iter_semantic_or_window_chunks(text, parent_size, overlap)):
+        parent_span = parent.as_span()
+        parent_text = parent_span[0][parent_span[1]:parent_span[2]]
+        result.append({
+            "text": parent_text,
+            "is_parent": True,
+            "parent_index": parent_idx,
+            "chunk_index": chunk_index,
+            "offsets": text_chunker.content_offsets(parent_span, {text: 0})
+        })
+        chunk_index += 1
+        for child_span in text_chunker.iter_window_spans(parent_span, child_size, overlap):
+            result.append({
+                "text": child_span[0][child_span[1]:child_span[2]],
+                "is_parent": False,
+                "parent_index": parent_idx,
+                "chunk_index": chunk_index,
+                "offsets": text_chunker.content_offsets(child_span, {text: 0})
+            })
+            chunk_index += 1
+    return result
+
+
+def recursive_chunks(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """同 RAGService.recursive_chunk_text"""
+    return [src[start:end] for src, start, end in text_chunker.recursive_spans(text, chunk_size, overlap)]
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def test_matches_legacy_output():
+    """分块结果与原实现一致"""
+    documents = {}
+    for (seed, messy, size, overlap), expected in EXPECTED_FINGERPRINTS.items():
+        text = documents.setdefault((seed, messy), make_document(400, seed, messy))
+        parent_child = [
+            [chunk["text"], chunk["parent_index"], chunk["is_parent"], chunk["chunk_index"]]
+            for chunk in parent_child_chunks(text, size * 2, size, overlap)
+        ]
+        actual = (
+            fingerprint(semantic_chunks(text, size, overlap)),
+            fingerprint(parent_child),
+            fingerprint(recursive_chunks(text, size, overlap))
+        )
+        assert actual == expected, f"种子 {seed}，分块大小 {size}: {actual} != {expected}"
+
+
+def test_small_inputs():
+    """边界输入"""
+    assert semantic_chunks("", 500, 50) == []
+    # 短的新主题段落合并到前一个块
+    assert semantic_chunks("第一段。\n\n另外，第二段。", 500, 50) == ["第一段。\n\n另外，第二段。"]
+    # 超长段落按句子切分，末尾没有结束符的残句丢弃
+    sentences = ["甲" * 30 + "。", "乙" * 30 + "！", "丙" * 30 + "？"]
+    assert semantic_chunks("".join(sentences) + "尾巴", 40, 5) == sentences
+    assert recursive_chunks("aaaa bbbb\ncccc dddd\n\neeee", 10, 2) == ["aaaa bbbb", "cccc dddd", "eeee"]
+    assert [chunk["text"] for chunk in parent_child_chunks("一二三四五六七八九十。", 100, 4, 1)] == [
+        "一二三四五六七八九十。", "一二三四", "四五六七", "七八九十", "十。"
+    ]
+
+
+def test_offsets_match_content():
+    """带偏移的分块文本与文档内容中对应区间一致"""
+    text = make_document(200, 3)
+    chunks = parent_child_chunks(text, 1000, 500, 50)
+    assert any(chunk["offsets"] for chunk in chunks)
+    for chunk in chunks:
+        if chunk["offsets"]:
+            start, end = chunk["offsets"]
+            assert text[start:end] == chunk["text"]
+
+
+if __name__ == "__main__":
+    for test in (test_matches_legacy_output, test_small_inputs, test_offsets_match_content):
+        test()
+        print(f"✓ {test.__name__}")